@@ -3,14 +3,724 @@ DIAN a Siigo - Aplicación de Escritorio v3.1
 """
 
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 import pandas as pd
+import numpy as np
 from pathlib import Path
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import importlib.util
+import itertools
+import io
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from fractions import Fraction
+import asyncio
+import argparse
+import contextlib
+import email.policy
+from email.parser import BytesParser
+import gzip
+import hashlib
+import html
+import http.client
+import http.server
+import json
+import queue
+import random
+import shutil
+import socket
+import sqlite3
+import threading
+import tempfile
+import urllib.parse
+import uuid
+import zipfile
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+# Palabras que identifican la fila de encabezados de un reporte DIAN
+PALABRAS_ENCABEZADO = ['total', 'iva', 'nit', 'emisor', 'receptor']
+
+# Motores de lectura disponibles: módulo opcional que requieren y extensiones que soportan.
+# 'openpyxl' es el lector en modo solo-lectura (streaming) que usa pandas por defecto.
+MOTORES_LECTURA = {
+    'calamine': {'modulo': 'python_calamine', 'extensiones': ['.xlsx', '.xlsm', '.xls', '.xlsb', '.ods']},
+    'openpyxl': {'modulo': 'openpyxl', 'extensiones': ['.xlsx', '.xlsm']},
+    'xlrd': {'modulo': 'xlrd', 'extensiones': ['.xls']},
+    'pyxlsb': {'modulo': 'pyxlsb', 'extensiones': ['.xlsb']},
+    'csv': {'modulo': None, 'extensiones': ['.csv', '.txt']},
+}
+
+# Archivos comprimidos que se leen sin extraer a disco: .zip (cualquier formato soportado
+# dentro, varios miembros en paralelo) y CSV comprimidos con gzip (.csv.gz)
+EXTENSIONES_COMPRIMIDAS = ['.zip', '.gz']
+
+# A partir de este tamaño se prefiere el motor rápido (calamine) si está instalado
+UMBRAL_MOTOR_RAPIDO = 1 * 1024 * 1024
+
+# Índice persistente de facturas ya procesadas (huellas de 8 bytes por factura)
+ARCHIVO_INDICE_FACTURAS = Path.home() / '.dian_a_siigo' / 'facturas.idx'
+
+# Espacio de trabajo multi-cliente: clientes, cuentas propias y cola persistente de conversiones
+ARCHIVO_ESPACIO_TRABAJO = Path.home() / '.dian_a_siigo' / 'espacio.db'
+
+# Puntos de control de las conversiones por bloques (para reanudar tras un cierre inesperado)
+CARPETA_AVANCE = Path.home() / '.dian_a_siigo' / 'avance'
+
+# Resultados que un proceso de conversión entrega a la interfaz como archivos mapeados en memoria
+CARPETA_RESULTADOS = Path.home() / '.dian_a_siigo' / 'resultados'
+
+# Memoria que puede usar una conversión: fracción de la RAM física (o --memoria) y
+# presupuesto si no se puede determinar la RAM
+FRACCION_MEMORIA = 0.5
+PRESUPUESTO_MEMORIA_RESPALDO = 2 * 1024 ** 3
+
+
+def motor_disponible(motor):
+    """Indica si el módulo opcional del motor de lectura está instalado"""
+    modulo = MOTORES_LECTURA[motor]['modulo']
+    if modulo is None:
+        return True
+    if importlib.util.find_spec(modulo) is None:
+        return False
+    if motor == 'calamine':
+        # pandas soporta engine='calamine' desde la versión 2.2
+        version = tuple(int(p) for p in re.findall(r'\d+', pd.__version__)[:2])
+        return version >= (2, 2)
+    return True
+
+
+def extension_datos(nombre_archivo):
+    """Extensión del contenido del archivo: 'datos.csv.gz' → '.csv' (los .gz solo pueden ser CSV)"""
+    ruta = Path(nombre_archivo)
+    if ruta.suffix.lower() == '.gz':
+        interna = Path(ruta.stem).suffix.lower()
+        return interna if interna in MOTORES_LECTURA['csv']['extensiones'] else '.gz'
+    return ruta.suffix.lower()
+
+
+def memoria_fisica():
+    """RAM física total en bytes (None si no se puede determinar)"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                            ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                            ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                            ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                            ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+            
+            estado = MEMORYSTATUSEX()
+            estado.dwLength = ctypes.sizeof(estado)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(estado)):
+                return estado.ullTotalPhys
+        elif 'SC_PHYS_PAGES' in getattr(os, 'sysconf_names', {}):
+            return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+
+def presupuesto_memoria():
+    """Presupuesto de memoria por defecto para una conversión (FRACCION_MEMORIA de la RAM física)"""
+    total = memoria_fisica()
+    return int(total * FRACCION_MEMORIA) if total else PRESUPUESTO_MEMORIA_RESPALDO
+
+
+def motores_para_archivo(ruta_archivo, preferido=None, tamano=None):
+    """
+    Devuelve los motores de lectura disponibles para el archivo, en orden de preferencia
+    según la extensión y el tamaño (el motor preferido, si se indica, va primero).
+    `tamano` permite evaluar miembros de un .zip sin tenerlos en disco.
+    """
+    extension = extension_datos(ruta_archivo)
+    if tamano is None:
+        tamano = os.path.getsize(ruta_archivo)
+    if tamano >= UMBRAL_MOTOR_RAPIDO:
+        orden = ['calamine', 'openpyxl', 'xlrd', 'pyxlsb', 'csv']
+    else:
+        orden = ['openpyxl', 'xlrd', 'pyxlsb', 'calamine', 'csv']
+    if preferido in orden:
+        orden.remove(preferido)
+        orden.insert(0, preferido)
+    return [motor for motor in orden
+            if extension in MOTORES_LECTURA[motor]['extensiones'] and motor_disponible(motor)]
+
+
+def _es_fila_encabezado(celdas):
+    """Indica si una fila contiene alguna de las PALABRAS_ENCABEZADO de un reporte DIAN"""
+    texto = ' '.join(str(celda) for celda in celdas if pd.notna(celda)).lower()
+    return any(palabra in texto for palabra in PALABRAS_ENCABEZADO)
+
+
+def _celda_texto(valor):
+    """Valor de celda de openpyxl como texto, igual que pd.read_excel(dtype=str)"""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _leer_hoja_dian(ruta_archivo, hoja=None, motor='openpyxl'):
+    """
+    Lee una hoja de Excel (o el CSV si hoja es None) detectando su fila de encabezados.
+    `ruta_archivo` puede ser una ruta o un archivo abierto (miembro de un .zip).
+    Función de módulo para poder ejecutarse en un pool de procesos.
+    Devuelve (hoja, DataFrame o None si está vacía, tiene_encabezado).
+    """
+    def leer(**kwargs):
+        if hasattr(ruta_archivo, 'seek'):
+            ruta_archivo.seek(0)
+        if hoja is None:
+            return pd.read_csv(ruta_archivo, encoding='utf-8-sig', dtype=str, **kwargs)
+        return pd.read_excel(ruta_archivo, sheet_name=hoja, dtype=str, engine=motor, **kwargs)
+    
+    # Primero intentar leer sin saltar filas para inspeccionar
+    df_raw = leer(header=None, nrows=10)
+    if df_raw.empty or df_raw.isnull().all().all():
+        return hoja, None, False
+    
+    print(f"Primeras filas del archivo crudo{f' (hoja {hoja})' if hoja is not None else ''}:")
+    for i in range(min(5, len(df_raw))):
+        print(f"Fila {i}: {list(df_raw.iloc[i].dropna().head(15))}")
+    
+    # Buscar la fila que contiene encabezados clave
+    header_row = None
+    for idx, row in df_raw.iterrows():
+        if _es_fila_encabezado(row):
+            header_row = idx
+            print(f"Encontrado encabezado en fila {idx}")
+            break
+    
+    if header_row is None:
+        # Sin encabezado reconocible: se devuelve crudo para decidir al combinar hojas
+        return hoja, leer(header=None), False
+    
+    # Leer la hoja con el encabezado encontrado
+    df = leer(skiprows=header_row, header=0)
+    df.columns = [str(col).strip() for col in df.columns]
+    return hoja, df, True
+
+
+def _leer_miembro_zip(ruta_zip, miembro, preferido=None):
+    """
+    Lee un archivo dentro de un .zip sin extraerlo a disco: los CSV se leen en streaming
+    desde el miembro comprimido y los libros de Excel (que requieren acceso aleatorio) desde memoria.
+    Función de módulo para poder ejecutarse en un pool de procesos.
+    Devuelve (motor, [(miembro[:hoja], DataFrame o None, tiene_encabezado), ...]).
+    """
+    with zipfile.ZipFile(ruta_zip) as archivo_zip:
+        info = archivo_zip.getinfo(miembro)
+        motores = motores_para_archivo(miembro, preferido, tamano=info.file_size)
+        if not motores:
+            raise Exception(f"No hay un motor de lectura instalado para '{miembro}'")
+        
+        for motor in motores:
+            try:
+                if motor == 'csv':
+                    # Un .csv.gz dentro del .zip se descomprime también al vuelo
+                    with archivo_zip.open(info) as fuente, (
+                            gzip.GzipFile(fileobj=fuente) if miembro.lower().endswith('.gz')
+                            else contextlib.nullcontext(fuente)) as contenido:
+                        lecturas = [_leer_hoja_dian(contenido, None, motor)]
+                else:
+                    fuente = io.BytesIO(archivo_zip.read(info))
+                    with pd.ExcelFile(fuente, engine=motor) as xl:
+                        hojas = list(xl.sheet_names)
+                    lecturas = [_leer_hoja_dian(fuente, hoja, motor) for hoja in hojas]
+                break
+            except Exception as e:
+                if motor == motores[-1]:
+                    raise
+                print(f"⚠️ Motor '{motor}' falló con '{miembro}' ({e}), probando con el siguiente")
+    
+    return motor, [(miembro if hoja is None else f"{miembro}:{hoja}", datos, tiene_encabezado)
+                   for hoja, datos, tiene_encabezado in lecturas]
+
+
+def escribir_libro_siigo(ruta_archivo, hojas):
+    """
+    Escribe un libro .xlsx con una hoja por cada (nombre, DataFrame) de `hojas`,
+    con valores enteros y el formato colombiano EXACTO #.##0,00.
+    Función de módulo para poder ejecutarse en un pool de procesos.
+    """
+    from openpyxl import Workbook
+    
+    # Crear un nuevo workbook
+    wb = Workbook()
+    wb.remove(wb.active)
+    
+    for nombre_hoja, df_export in hojas:
+        ws = wb.create_sheet(title=nombre_hoja)
+        
+        # Escribir encabezados
+        for col_idx, col_name in enumerate(df_export.columns, start=1):
+            ws.cell(row=1, column=col_idx, value=col_name)
+        
+        # Escribir datos - VALORES COMO ENTEROS (redondeados al peso)
+        for row_idx, row_data in enumerate(df_export.itertuples(index=False), start=2):
+            for col_idx, (col_name, valor) in enumerate(zip(df_export.columns, row_data), start=1):
+                cell = ws.cell(row=row_idx, column=col_idx)
+                
+                # Escribir valor según el tipo
+                if col_name in ['DEBITO', 'CREDITO', 'VALOR_BASE']:
+                    if pd.notna(valor) and valor is not None:
+                        # Ya vienen en pesos enteros
+                        cell.value = int(valor)
+                        # Formato colombiano EXACTO: 200.000,00
+                        cell.number_format = '#.##0,00'
+                    else:
+                        cell.value = None
+                elif col_name in ['H', 'FACTURAS']:
+                    if pd.notna(valor) and valor is not None and valor != '':
+                        cell.value = int(valor)
+                    else:
+                        cell.value = None
+                else:
+                    cell.value = str(valor) if pd.notna(valor) and valor != '' else ''
+        
+        # Ajustar anchos de columna
+        for column in ws.columns:
+            max_length = 0
+            column_letter = column[0].column_letter
+            for cell in column:
+                try:
+                    if cell.value:
+                        max_length = max(max_length, len(str(cell.value)))
+                except:
+                    pass
+            ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
+    
+    # Guardar archivo
+    wb.save(ruta_archivo)
+    return ruta_archivo
+
+
+def _letras_columna(indice):
+    """Número de columna (1 = A) a letras de Excel"""
+    letras = ''
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _partir_celda(celda):
+    """'B6' → (columna 2, fila 6)"""
+    partes = re.fullmatch(r'\$?([A-Za-z]{1,3})\$?(\d+)', celda.strip())
+    if not partes:
+        raise ValueError(f"Celda no válida: '{celda}'")
+    columna = 0
+    for letra in partes.group(1).upper():
+        columna = columna * 26 + ord(letra) - 64
+    return columna, int(partes.group(2))
+
+
+def _xml_texto(valor):
+    """Texto escapado para XML, sin caracteres de control que Excel no admite"""
+    texto = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', str(valor))
+    return texto.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def hojas_plantilla(ruta_plantilla):
+    """
+    Hojas de un libro .xlsx leídas directamente de xl/workbook.xml (sin cargar el libro):
+    lista de (nombre, ruta de la hoja dentro del .zip), en orden.
+    """
+    with zipfile.ZipFile(ruta_plantilla) as libro:
+        workbook = libro.read('xl/workbook.xml').decode('utf-8')
+        relaciones = libro.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+    destinos = {}
+    for relacion in re.findall(r'<Relationship\b[^>]*>', relaciones):
+        id_rel = re.search(r'\bId="([^"]+)"', relacion)
+        destino = re.search(r'\bTarget="([^"]+)"', relacion)
+        if id_rel and destino:
+            ruta = destino.group(1)
+            destinos[id_rel.group(1)] = ruta.lstrip('/') if ruta.startswith('/') else f"xl/{ruta}"
+    hojas = []
+    for hoja in re.findall(r'<sheet\b[^>]*>', workbook):
+        nombre = re.search(r'\bname="([^"]*)"', hoja)
+        id_rel = re.search(r'\b\w+:id="([^"]+)"', hoja)
+        if nombre and id_rel and id_rel.group(1) in destinos:
+            hojas.append((html.unescape(nombre.group(1)), destinos[id_rel.group(1)]))
+    return hojas
+
+
+def _estilo_pesos(estilos):
+    """
+    Agrega a styles.xml (como texto, sin reescribir el resto) el formato #.##0,00 y un estilo
+    de celda que lo usa. Devuelve (styles.xml modificado, índice del estilo).
+    """
+    formato = '#.##0,00'
+    existente = re.search(r'<numFmt\b[^>]*numFmtId="(\d+)"[^>]*formatCode="' + re.escape(formato) + '"', estilos)
+    if existente is None:
+        existente = re.search(r'<numFmt\b[^>]*formatCode="' + re.escape(formato) + r'"[^>]*numFmtId="(\d+)"', estilos)
+    if existente:
+        id_formato = int(existente.group(1))
+    else:
+        # Los formatos personalizados empiezan en 164
+        id_formato = max([163] + [int(i) for i in re.findall(r'<numFmt\b[^>]*numFmtId="(\d+)"', estilos)]) + 1
+        nuevo = f'<numFmt numFmtId="{id_formato}" formatCode="{formato}"/>'
+        if re.search(r'<numFmts\b', estilos):
+            estilos = re.sub(r'<numFmts\b[^>]*?(/?)>',
+                             lambda m: '<numFmts count="0">' + nuevo + ('</numFmts>' if m.group(1) else ''),
+                             estilos, count=1)
+            estilos = re.sub(r'(<numFmts\b[^>]*>)(.*?)(</numFmts>)',
+                             lambda m: re.sub(r'count="\d+"', f'count="{m.group(2).count("<numFmt ")}"', m.group(1))
+                             + m.group(2) + m.group(3),
+                             estilos, count=1, flags=re.S)
+        else:
+            # numFmts debe ser el primer hijo de styleSheet
+            estilos = re.sub(r'(<styleSheet\b[^>]*>)', lambda m: m.group(1) + f'<numFmts count="1">{nuevo}</numFmts>',
+                             estilos, count=1)
+    
+    xf = f'<xf numFmtId="{id_formato}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    bloque = re.search(r'<cellXfs\b[^>]*>(.*?)</cellXfs>', estilos, flags=re.S)
+    if bloque is None:
+        raise ValueError("La plantilla no tiene estilos de celda (cellXfs)")
+    indice = len(re.findall(r'<xf\b', bloque.group(1)))
+    contenido = bloque.group(0).replace('</cellXfs>', xf + '</cellXfs>')
+    contenido = re.sub(r'count="\d+"', f'count="{indice + 1}"', contenido, count=1)
+    estilos = estilos[:bloque.start()] + contenido + estilos[bloque.end():]
+    return estilos, indice
+
+
+def _combinar_fila(fila_plantilla, celdas):
+    """
+    Une las celdas escritas con una fila vacía de la plantilla: conserva los atributos de la
+    fila (estilo, alto) y las celdas de la plantilla que no se escriben; una celda escrita sin
+    estilo propio toma el de la celda de la plantilla en la misma posición.
+    """
+    etiqueta = re.match(r'<row\b[^>]*?(?=/?>)', fila_plantilla).group(0)
+    # spans es solo una pista de columnas usadas y ya no corresponde
+    etiqueta = re.sub(r'\s+spans="[^"]*"', '', etiqueta)
+    
+    def columna(celda):
+        return _partir_celda(re.search(r'\br="([^"]+)"', celda).group(1))[0]
+    
+    por_columna = {columna(celda): celda
+                   for celda in re.findall(r'<c\b[^>]*?(?:/>|>.*?</c>)', fila_plantilla, flags=re.S)}
+    for celda in celdas:
+        numero_columna = columna(celda)
+        estilo = re.search(r'\bs="(\d+)"', por_columna.get(numero_columna, ''))
+        if estilo and not re.search(r'\bs="', celda):
+            celda = celda.replace('<c ', f'<c s="{estilo.group(1)}" ', 1)
+        por_columna[numero_columna] = celda
+    return f'{etiqueta}>{"".join(por_columna[c] for c in sorted(por_columna))}</row>'
+
+
+def escribir_en_plantilla(ruta_plantilla, ruta_salida, df_export, hoja=None, celda_inicio='A2',
+                          filas_por_escritura=2000):
+    """
+    Escribe los registros en una plantilla .xlsx existente a partir de `celda_inicio` de la hoja
+    indicada (la primera si es None), sin pasar el libro por el modelo de objetos de openpyxl:
+    - Las demás partes del libro (otras hojas, estilos, encabezados, imágenes) se copian tal cual
+    - Solo se modifica el XML de la hoja destino: las filas se escriben en streaming al .zip de salida
+    - Los valores van como enteros con el formato colombiano EXACTO #.##0,00 (agregado a styles.xml)
+    Las filas vacías de la plantilla desde la fila de inicio conservan su formato (estilo de fila,
+    alto y estilo de cada celda) y reciben los datos; si alguna tiene contenido se detiene con
+    un error en lugar de sobrescribirla.
+    """
+    hojas = hojas_plantilla(ruta_plantilla)
+    if not hojas:
+        raise ValueError("La plantilla no tiene hojas")
+    if hoja is None:
+        nombre_hoja, ruta_hoja = hojas[0]
+    else:
+        coincidencias = [h for h in hojas if h[0] == hoja]
+        if not coincidencias:
+            raise ValueError(f"La plantilla no tiene la hoja '{hoja}' (hojas: {', '.join(h[0] for h in hojas)})")
+        nombre_hoja, ruta_hoja = coincidencias[0]
+    
+    columna_inicio, fila_inicio = _partir_celda(celda_inicio)
+    ultima_fila = fila_inicio + len(df_export) - 1
+    if ultima_fila > 1048576:
+        raise ValueError(f"Los {len(df_export)} registros no caben en la hoja desde la fila {fila_inicio}")
+    letras = [_letras_columna(columna_inicio + i) for i in range(len(df_export.columns))]
+    
+    with zipfile.ZipFile(ruta_plantilla) as plantilla:
+        hoja_xml = plantilla.read(ruta_hoja).decode('utf-8')
+        estilos, estilo_pesos = _estilo_pesos(plantilla.read('xl/styles.xml').decode('utf-8'))
+        
+        # Separar la hoja en: antes de los datos, filas de la plantilla y después de los datos
+        datos = re.search(r'<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>', hoja_xml, flags=re.S)
+        if datos is None:
+            raise ValueError(f"La hoja '{nombre_hoja}' no tiene sheetData")
+        filas_plantilla = re.findall(r'<row\b[^>]*/>|<row\b.*?</row>', datos.group(1) or '', flags=re.S)
+        conservadas = []
+        con_formato = {}
+        for fila in filas_plantilla:
+            numero = int(re.search(r'\br="(\d+)"', fila).group(1))
+            if numero < fila_inicio:
+                conservadas.append(fila)
+            elif re.search(r'<v>|<is>|<f>', fila):
+                raise ValueError(f"La plantilla tiene contenido en la fila {numero} de '{nombre_hoja}', "
+                                 f"a partir de la fila de inicio {fila_inicio}")
+            else:
+                con_formato[numero] = fila
+        antes = hoja_xml[:datos.start()] + '<sheetData>' + ''.join(conservadas)
+        despues = '</sheetData>' + hoja_xml[datos.end():]
+        
+        # Ampliar el rango declarado de la hoja para incluir los datos
+        rango = re.search(r'<dimension ref="([^"]+)"\s*/>', antes)
+        if rango and len(df_export):
+            esquinas = [_partir_celda(c) for c in rango.group(1).split(':')]
+            ultima_columna = columna_inicio + len(df_export.columns) - 1
+            ref = (f"{_letras_columna(min(c for c, _ in esquinas + [(columna_inicio, 0)]))}"
+                   f"{min(f for _, f in esquinas)}:"
+                   f"{_letras_columna(max(c for c, _ in esquinas + [(ultima_columna, 0)]))}"
+                   f"{max(f for _, f in esquinas + [(0, ultima_fila)])}")
+            antes = antes[:rango.start()] + f'<dimension ref="{ref}"/>' + antes[rango.end():]
+        
+        with zipfile.ZipFile(ruta_salida, 'w', zipfile.ZIP_DEFLATED) as salida:
+            for info in plantilla.infolist():
+                if info.filename == ruta_hoja:
+                    with salida.open(info.filename, 'w', force_zip64=True) as destino:
+                        destino.write(antes.encode('utf-8'))
+                        lote = []
+                        for numero, fila in enumerate(df_export.itertuples(index=False, name=None), fila_inicio):
+                            celdas = []
+                            for letra, col_name, valor in zip(letras, df_export.columns, fila):
+                                if pd.isna(valor) or valor == '':
+                                    continue
+                                ref = f"{letra}{numero}"
+                                if col_name in ['DEBITO', 'CREDITO', 'VALOR_BASE']:
+                                    celdas.append(f'<c r="{ref}" s="{estilo_pesos}"><v>{int(valor)}</v></c>')
+                                elif col_name in ['H', 'FACTURAS']:
+                                    celdas.append(f'<c r="{ref}"><v>{int(valor)}</v></c>')
+                                else:
+                                    celdas.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">'
+                                                  f'{_xml_texto(valor)}</t></is></c>')
+                            formato = con_formato.pop(numero, None)
+                            if formato is None:
+                                lote.append(f'<row r="{numero}">{"".join(celdas)}</row>')
+                            else:
+                                lote.append(_combinar_fila(formato, celdas))
+                            if len(lote) >= filas_por_escritura:
+                                destino.write(''.join(lote).encode('utf-8'))
+                                lote = []
+                        destino.write(''.join(lote).encode('utf-8'))
+                        # Filas con formato más abajo de los datos
+                        destino.write(''.join(fila for _, fila in sorted(con_formato.items())).encode('utf-8'))
+                        destino.write(despues.encode('utf-8'))
+                elif info.filename == 'xl/styles.xml':
+                    salida.writestr(info, estilos.encode('utf-8'))
+                else:
+                    salida.writestr(info, plantilla.read(info))
+    return ruta_salida
+
+
+def publicar_resultado(df, carpeta=CARPETA_RESULTADOS):
+    """
+    Escribe un DataFrame en un archivo columnar para que otro proceso lo mapee en memoria sin
+    deserializarlo (ver abrir_resultado). Devuelve un descriptor pequeño (ruta y esquema):
+    - Columnas numéricas, booleanas y de fecha: su arreglo tal cual
+    - Enteros con nulos (Int64): valores + máscara de nulos
+    - Texto: códigos de categoría; las categorías van en el mismo archivo como UTF-8 + desplazamientos
+    El índice no se conserva (el de df_resultado es 0..n-1).
+    """
+    carpeta = Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    partes = []
+    posicion = 0
+    
+    def agregar(arreglo):
+        nonlocal posicion
+        arreglo = np.ascontiguousarray(arreglo)
+        inicio = -(-posicion // 64) * 64   # alineado a 64 bytes
+        partes.append((inicio, arreglo))
+        posicion = inicio + arreglo.nbytes
+        return {'inicio': inicio, 'dtype': arreglo.dtype.str, 'largo': len(arreglo)}
+    
+    columnas = []
+    for nombre in df.columns:
+        serie = df[nombre]
+        if isinstance(serie.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+            nulos = serie.isna().to_numpy()
+            valores = serie.array.to_numpy(dtype=serie.dtype.numpy_dtype, na_value=0)
+            columnas.append({'nombre': nombre, 'tipo': 'nulos', 'valores': agregar(valores), 'nulos': agregar(nulos)})
+        elif isinstance(serie.dtype, np.dtype) and serie.dtype.kind in 'iufbmM':
+            columnas.append({'nombre': nombre, 'tipo': 'numpy', 'valores': agregar(serie.to_numpy())})
+        else:
+            # Texto (o mezcla): todo a str, conservando los nulos
+            texto = serie.astype(object)
+            texto = texto.where(texto.isna(), texto.astype(str))
+            categorica = pd.Categorical(texto)
+            codificadas = [str(c).encode('utf-8') for c in categorica.categories]
+            desplazamientos = np.zeros(len(codificadas) + 1, dtype=np.int64)
+            desplazamientos[1:] = np.cumsum([len(c) for c in codificadas])
+            columnas.append({'nombre': nombre, 'tipo': 'texto',
+                             'codigos': agregar(categorica.codes),
+                             'texto': agregar(np.frombuffer(b''.join(codificadas), dtype=np.uint8)),
+                             'desplazamientos': agregar(desplazamientos)})
+    
+    ruta = carpeta / f"{uuid.uuid4().hex}.bin"
+    temporal = ruta.with_suffix('.tmp')
+    with open(temporal, 'wb') as f:
+        for inicio, arreglo in partes:
+            f.seek(inicio)
+            f.write(arreglo.reshape(-1).view(np.uint8))
+        f.truncate(max(posicion, 1))
+    os.replace(temporal, ruta)
+    return {'ruta': str(ruta), 'filas': len(df), 'bytes': posicion, 'columnas': columnas}
+
+
+def abrir_resultado(descriptor, eliminar=True):
+    """
+    Mapea en memoria un resultado publicado con publicar_resultado y arma un DataFrame cuyas
+    columnas son vistas sobre el archivo: los datos no se copian al heap del proceso, solo las
+    categorías de texto (un valor por texto distinto). Las columnas de texto quedan como categóricas.
+    Con eliminar=True el archivo se borra en cuanto queda mapeado (en Windows, si el sistema no
+    lo permite, se borra en la siguiente sesión con limpiar_resultados).
+    """
+    # 'c' = copia al escribir: el archivo nunca se modifica desde este proceso
+    mapa = np.memmap(descriptor['ruta'], dtype=np.uint8, mode='c').view(np.ndarray)
+    
+    def vista(parte):
+        dtype = np.dtype(parte['dtype'])
+        return mapa[parte['inicio']:parte['inicio'] + dtype.itemsize * parte['largo']].view(dtype)
+    
+    clases = {'i': pd.arrays.IntegerArray, 'u': pd.arrays.IntegerArray,
+              'f': pd.arrays.FloatingArray, 'b': pd.arrays.BooleanArray}
+    datos = {}
+    for columna in descriptor['columnas']:
+        if columna['tipo'] == 'numpy':
+            datos[columna['nombre']] = vista(columna['valores'])
+        elif columna['tipo'] == 'nulos':
+            valores = vista(columna['valores'])
+            datos[columna['nombre']] = clases[valores.dtype.kind](valores, vista(columna['nulos']))
+        else:
+            texto = bytes(vista(columna['texto']))
+            limites = vista(columna['desplazamientos']).tolist()
+            categorias = [texto[a:b].decode('utf-8') for a, b in zip(limites[:-1], limites[1:])]
+            datos[columna['nombre']] = pd.Categorical.from_codes(
+                vista(columna['codigos']), categories=pd.Index(categorias, dtype=object), validate=False)
+    df = pd.DataFrame(datos, copy=False)
+    
+    if eliminar:
+        try:
+            os.remove(descriptor['ruta'])
+        except OSError:
+            pass
+    return df
+
+
+def limpiar_resultados(carpeta=CARPETA_RESULTADOS):
+    """Borra los resultados mapeados que quedaron de sesiones anteriores"""
+    carpeta = Path(carpeta)
+    if carpeta.exists():
+        for ruta in carpeta.iterdir():
+            try:
+                ruta.unlink()
+            except OSError:
+                pass
+
+
+@contextlib.contextmanager
+def bloqueo_archivo(ruta, espera=60.0):
+    """
+    Bloqueo exclusivo entre procesos sobre un archivo de bloqueo (flock / msvcrt.locking).
+    El sistema lo libera si el proceso muere, así que no quedan bloqueos huérfanos.
+    """
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, 'a+b') as f:
+        limite = time.monotonic() + espera
+        while True:
+            try:
+                if os.name == 'nt':
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() > limite:
+                    raise TimeoutError(f"No se pudo bloquear '{ruta}' (otro proceso lo está usando)")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class IndiceFacturas:
+    """
+    Índice persistente y compacto de facturas ya procesadas:
+    - Cada factura es una huella de 64 bits (8 bytes en disco, ~8 MB por millón de facturas)
+    - El archivo es una firma + las huellas ordenadas y sin repetir (uint64)
+    - En memoria se consulta con una tabla hash (pd.Index): búsquedas O(1) en bloque
+    """
+    
+    FIRMA = b'DIANIDX1'
+    
+    def __init__(self, ruta=ARCHIVO_INDICE_FACTURAS):
+        self.ruta = Path(ruta)
+        self._asignar(self._cargar())
+    
+    def _cargar(self):
+        if not self.ruta.exists():
+            return np.empty(0, dtype='<u8')
+        with open(self.ruta, 'rb') as f:
+            if f.read(len(self.FIRMA)) != self.FIRMA:
+                raise ValueError(f"'{self.ruta}' no es un índice de facturas válido")
+            return np.frombuffer(f.read(), dtype='<u8')
+    
+    def _asignar(self, huellas):
+        self.huellas = huellas
+        self._tabla = pd.Index(huellas.astype(np.uint64))
+    
+    def __len__(self):
+        return len(self.huellas)
+    
+    def contiene(self, huellas):
+        """Máscara booleana: qué huellas ya están en el índice"""
+        if len(self.huellas) == 0:
+            return np.zeros(len(huellas), dtype=bool)
+        return self._tabla.get_indexer(np.asarray(huellas, dtype=np.uint64)) >= 0
+    
+    def registrar(self, huellas):
+        """
+        Agrega huellas al índice y lo guarda. Leer, combinar y escribir ocurre bajo un bloqueo
+        exclusivo (los trabajos de la cola, la carpeta vigilada y la interfaz comparten el índice),
+        así ningún proceso pierde las huellas que otro acaba de registrar.
+        """
+        huellas = np.asarray(huellas, dtype=np.uint64)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with bloqueo_archivo(self.ruta.with_name(self.ruta.name + '.lock')):
+            combinadas = np.union1d(self._cargar(), huellas).astype('<u8')
+            # Escritura atómica (temporal propio) para no corromper el índice si el proceso se interrumpe
+            descriptor, temporal = tempfile.mkstemp(dir=self.ruta.parent, prefix=self.ruta.name, suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as f:
+                    f.write(self.FIRMA)
+                    f.write(combinadas.tobytes())
+                os.replace(temporal, self.ruta)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(temporal)
+                raise
+        nuevas = len(combinadas) - len(self.huellas)
+        self._asignar(combinadas)
+        return nuevas
 
 
 class ProcesadorContableDIAN:
@@ -27,6 +737,44 @@ class ProcesadorContableDIAN:
             'iva_generado': '24080101',
             'iva_credito': '13050501'
         }
+        # Columnas del layout de importación de Siigo (en orden)
+        self.COLUMNAS_SIIGO = ['CUENTA', 'CC', 'OBSERVACIONES', 'DEBITO',
+                               'CREDITO', 'VALOR_BASE', 'TERCERO', 'H']
+        # Columnas de trazabilidad que viajan con los registros pero no se exportan
+        self.COLUMNAS_INTERNAS = ['DOCUMENTO', 'FECHA']
+        # Límite de IVA / base gravable considerado plausible (tarifa general + tolerancia)
+        self.IVA_MAXIMO_PLAUSIBLE = 0.20
+        # Clases de documento DIAN; solo las procesables generan asientos
+        self.CLASES_DOCUMENTO = ['Factura', 'Nota crédito', 'Nota débito', 'Application response', 'Otro']
+        self.CLASES_PROCESABLES = ['Factura', 'Nota crédito', 'Nota débito']
+        # Límite de filas de datos por hoja de Excel (1.048.576 menos el encabezado)
+        self.MAX_FILAS_HOJA = 1048575
+        # Filas por bloque en la conversión por bloques (con puntos de control)
+        self.TAMANO_BLOQUE = 50000
+        self.TAMANO_BLOQUE_MINIMO = 5000
+        # Modelo de memoria del planificador (medido con pandas): bytes por celda leída según
+        # el lector (texto más copias intermedias) y por línea de asiento generada
+        self.BYTES_POR_CELDA = {'csv': 110, 'excel': 200}
+        self.BYTES_POR_LINEA = 300
+        self.LINEAS_POR_FACTURA = 2.5
+        # Presupuesto de memoria en bytes (None = FRACCION_MEMORIA de la RAM física)
+        self.presupuesto_memoria = None
+        # Motor de lectura preferido (None = automático) y datos de la última lectura
+        self.motor_lectura = None
+        self.ultima_lectura = None
+        # Filas que fallaron durante la generación de asientos (para el reporte de validación)
+        self.filas_omitidas = []
+        # Índice de facturas ya procesadas (None = no se revisan duplicados); si excluir_duplicados
+        # es False las duplicadas solo se reportan como anomalías
+        self.indice_facturas = None
+        self.excluir_duplicados = False
+        self.duplicados = None
+        self.huellas_leidas = None
+        # Resúmenes de la última generación de asientos: por tercero, por cuenta e IVA (ver resumir)
+        self.resumen = None
+        self.TOP_TERCEROS = 10
+        # Tarifas de IVA que distingue el resumen de IVA (general y reducida)
+        self.TARIFAS_IVA = [self.IVA_RATE, 0.05]
     
     def limpiar_numero(self, valor_str):
         """
@@ -87,7 +835,7 @@ class ProcesadorContableDIAN:
             if pd.isna(valor) or valor == 0 or valor == '':
                 return "0,00"
             # Convertir a entero (redondeado al peso)
-            valor_entero = int(round(float(valor), 0))
+            valor_entero = self.redondear_peso(valor)
             # Formatear con punto para miles y coma para decimales
             return f"{valor_entero:,}".replace(",", ".") + ",00"
         except:
@@ -98,34 +846,69 @@ class ProcesadorContableDIAN:
         try:
             if pd.isna(valor) or valor == '' or valor == 0:
                 return None
-            # Asegurar conversión correcta
-            valor_float = float(valor)
-            # Redondear al entero más cercano
-            return int(round(valor_float, 0))
+            return self.redondear_peso(valor)
         except:
             return None
     
     def valor_numerico_base(self, valor):
         """Devuelve el valor de base redondeado al peso más cercano (sin decimales)"""
-        try:
-            if pd.isna(valor) or valor == '' or valor == 0:
-                return None
-            valor_float = float(valor)
-            # Redondear al entero más cercano
-            return int(round(valor_float, 0))
-        except:
-            return None
+        return self.valor_numerico(valor)
     
     def redondear_peso(self, valor):
-        """Redondea al peso más cercano"""
+        """Redondea al peso más cercano (mitad hacia arriba, sin pasar por round())"""
         try:
             if pd.isna(valor) or valor == '':
                 return 0
-            valor_float = float(valor)
-            return int(round(valor_float, 0))
+            return int(Decimal(str(valor)).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
         except:
             return 0
     
+    def convertir_a_centavos(self, serie):
+        """
+        Convierte una columna de montos en texto a centavos enteros (int64), vectorizado
+        y sin pasar por float. Acepta los mismos formatos que limpiar_numero;
+        los decimales más allá del centavo se redondean mitad hacia arriba.
+        """
+        texto = serie.astype(object).where(serie.notna(), '').astype(str)
+        texto = texto.str.strip().str.replace(' ', '', regex=False)
+        texto = texto.mask(texto.isin(['', 'nan', 'None', '<NA>']), '0')
+        
+        # Detectar formato por la posición de comas y puntos
+        pos_punto = texto.str.rfind('.')
+        pos_coma = texto.str.rfind(',')
+        ambos = (pos_punto >= 0) & (pos_coma >= 0)
+        coma_decimal = (ambos & (pos_coma > pos_punto)) | (
+            ~ambos & (pos_coma >= 0) & (texto.str.count(',') == 1))
+        normal = texto.str.replace(',', '', regex=False).mask(
+            coma_decimal, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+        
+        partes = normal.str.extract(r'^([+-]?)(\d*)(?:\.(\d*))?$')
+        validos = partes[1].notna() & ((partes[1] != '') | (partes[2].fillna('') != ''))
+        
+        entero = pd.to_numeric(partes[1].where(validos & (partes[1] != ''), '0')).astype('int64')
+        fraccion = partes[2].where(validos, '').fillna('').str.ljust(3, '0')
+        centavos = (entero * 100 + fraccion.str[:2].astype('int64')
+                    + (fraccion.str[2] >= '5').astype('int64'))
+        centavos = centavos.where(partes[0] != '-', -centavos)
+        
+        # Formatos no reconocidos (p. ej. notación científica): conversión valor a valor
+        if (~validos).any():
+            centavos[~validos] = [
+                int((Decimal(str(self.limpiar_numero(v))) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+                for v in serie[~validos]]
+        return centavos.astype('int64')
+    
+    def centavos_a_pesos(self, centavos):
+        """Redondea centavos enteros al peso más cercano (mitad hacia arriba), vectorizado"""
+        return self.dividir_redondeado(centavos, 100)
+    
+    def dividir_redondeado(self, numerador, denominador):
+        """División entera con redondeo mitad hacia arriba (alejándose de cero), vectorizada"""
+        signo = np.sign(numerador)
+        # Redondear con el residuo (< denominador) y no con 2 * numerador, que desborda int64
+        cociente, residuo = np.divmod(np.abs(numerador), denominador)
+        return signo * (cociente + (2 * residuo >= denominador))
+    
     def limpiar_nit(self, nit):
         """Limpia y formatea el NIT"""
         if pd.isna(nit):
@@ -133,288 +916,677 @@ class ProcesadorContableDIAN:
         nit_str = str(nit).strip().replace('.0', '').replace('.00', '')
         return re.sub(r'[^\d]', '', nit_str)
     
+    def identificar_documentos(self, df):
+        """
+        Identificador de cada factura (vectorizado): el CUFE/CUDE; sin él, NIT emisor + prefijo + folio
+        (dos proveedores pueden usar el mismo prefijo y folio); sin folio, el número de fila
+        """
+        documentos = pd.Series([f"Fila {idx + 1}" for idx in df.index], index=df.index, dtype=object)
+        if 'Folio' in df.columns:
+            folio = df['Folio'].astype(str).str.strip()
+            prefijo = df['Prefijo'].fillna('').astype(str).str.strip() if 'Prefijo' in df.columns else ''
+            valido = df['Folio'].notna() & (folio != '')
+            numero = prefijo + folio
+            if 'NIT Emisor' in df.columns:
+                nit = (df['NIT Emisor'].fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+                       .str.replace(r'[^\d]', '', regex=True))
+                numero = numero.mask(nit != '', nit + '-' + numero)
+            documentos = documentos.mask(valido, numero)
+        if 'CUFE/CUDE' in df.columns:
+            cufe = df['CUFE/CUDE'].astype(str).str.strip()
+            valido = df['CUFE/CUDE'].notna() & (cufe != '')
+            documentos = documentos.mask(valido, cufe)
+        return documentos
+    
+    def huellas_facturas(self, df):
+        """
+        Huella de 64 bits de cada factura: CUFE/CUDE o, si no hay, NIT emisor + prefijo + folio + total.
+        Las filas sin CUFE ni folio no tienen identidad (huella 0) y nunca se marcan como duplicadas.
+        """
+        claves = pd.Series('', index=df.index, dtype=object)
+        if 'Folio' in df.columns:
+            folio = df['Folio'].fillna('').astype(str).str.strip()
+            prefijo = df['Prefijo'].fillna('').astype(str).str.strip() if 'Prefijo' in df.columns else ''
+            nit = (df['NIT Emisor'].fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+                   .str.replace(r'[^\d]', '', regex=True)
+                   if 'NIT Emisor' in df.columns else '')
+            total = df['Total'].astype(str) if 'Total' in df.columns else ''
+            claves = claves.mask(folio != '', 'doc|' + nit + '|' + prefijo + folio + '|' + total)
+        if 'CUFE/CUDE' in df.columns:
+            cufe = df['CUFE/CUDE'].fillna('').astype(str).str.strip().str.lower()
+            claves = claves.mask(cufe != '', 'cufe|' + cufe)
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(clave.encode('utf-8'), digest_size=8).digest(), 'little')
+             if clave else 0 for clave in claves),
+            dtype=np.uint64, count=len(claves))
+    
+    def revisar_duplicados(self, df, vistas=None):
+        """
+        Revisa en bloque las facturas leídas contra sí mismas y contra el índice de facturas
+        ya procesadas. Deja las duplicadas en self.duplicados (se reportan en la validación)
+        y las excluye si self.excluir_duplicados. Las huellas nuevas quedan en
+        self.huellas_leidas para registrarlas cuando las salidas se guarden o envíen.
+        `vistas`: huellas de bloques anteriores del mismo archivo (conversión por bloques).
+        """
+        huellas = self.huellas_facturas(df)
+        con_identidad = huellas != 0
+        repetida = pd.Series(huellas).duplicated()
+        if vistas is not None and len(vistas):
+            repetida |= pd.Series(huellas).isin(vistas)
+        en_archivo = repetida.to_numpy() & con_identidad
+        ya_procesada = self.indice_facturas.contiene(huellas) & con_identidad & ~en_archivo
+        duplicada = en_archivo | ya_procesada
+        
+        motivo = np.where(en_archivo, 'Factura repetida en el archivo', 'Factura ya procesada antes')
+        if self.excluir_duplicados:
+            motivo = np.char.add(motivo, ' (excluida)')
+        col_nit = 'NIT Emisor' if 'NIT Emisor' in df.columns else None
+        self.duplicados = pd.DataFrame({
+            'DOCUMENTO': self.identificar_documentos(df)[duplicada],
+            'TERCERO': df.loc[duplicada, col_nit].map(self.limpiar_nit) if col_nit else '',
+            'TOTAL': pd.to_numeric(df.loc[duplicada, 'Total'], errors='coerce') / 100
+                     if 'Total' in df.columns else 0,
+            'IVA': pd.to_numeric(df.loc[duplicada, 'IVA'], errors='coerce') / 100
+                   if 'IVA' in df.columns else 0,
+            'MOTIVO': motivo[duplicada]})
+        print(f"🔁 Duplicadas: {int(en_archivo.sum())} repetidas en el archivo, "
+              f"{int(ya_procesada.sum())} ya procesadas (índice con {len(self.indice_facturas)} facturas)")
+        
+        self.huellas_leidas = np.unique(huellas[con_identidad])
+        if self.excluir_duplicados and duplicada.any():
+            df = df[~duplicada]
+        return df
+    
+    def registrar_facturas(self):
+        """
+        Registra en el índice las facturas de la última conversión. Se llama cuando sus salidas
+        ya se guardaron o enviaron, no al convertir: volver a procesar el mismo archivo (p. ej.
+        tras un error al exportar o un cambio de cuentas) no debe marcarlo como ya procesado.
+        """
+        if self.indice_facturas is None or self.huellas_leidas is None:
+            return 0
+        nuevas = self.indice_facturas.registrar(self.huellas_leidas)
+        self.huellas_leidas = None
+        print(f"🔁 Índice de facturas: {nuevas} nuevas ({len(self.indice_facturas)} en total)")
+        return nuevas
+    
+    def columnas_exportables(self, df):
+        """Columnas del resultado que se escriben en Excel/Power Query (sin las internas)"""
+        return [col for col in df.columns if col not in self.COLUMNAS_INTERNAS]
+    
+    def _leer_hojas(self, ruta_archivo, motor):
+        """Descubre las hojas del archivo y las lee en paralelo con el motor indicado"""
+        # Un CSV es una sola "hoja"
+        if motor == 'csv':
+            hojas = [None]
+        else:
+            with pd.ExcelFile(ruta_archivo, engine=motor) as xl:
+                hojas = list(xl.sheet_names)
+        print(f"Hojas encontradas: {len(hojas)}")
+        
+        # Leer las hojas en paralelo (cada una detecta su propio encabezado)
+        if len(hojas) > 1:
+            argumentos = ([ruta_archivo] * len(hojas), hojas, [motor] * len(hojas))
+            try:
+                trabajadores = min(len(hojas), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+                    return list(pool.map(_leer_hoja_dian, *argumentos))
+            except (BrokenProcessPool, OSError) as e:
+                print(f"⚠️ No se pudo usar lectura paralela ({e}), leyendo hojas en secuencia")
+                return list(map(_leer_hoja_dian, *argumentos))
+        return [_leer_hoja_dian(ruta_archivo, hojas[0], motor)]
+    
+    def _leer_zip(self, ruta_archivo):
+        """Lee los miembros soportados de un .zip en paralelo (sin extraerlos). Devuelve (lecturas, motor)"""
+        with zipfile.ZipFile(ruta_archivo) as archivo_zip:
+            miembros = [info.filename for info in archivo_zip.infolist()
+                        if not info.is_dir()
+                        and not Path(info.filename).name.startswith(('~$', '.'))
+                        and not info.filename.startswith('__MACOSX/')
+                        and motores_para_archivo(info.filename, tamano=info.file_size)]
+        if not miembros:
+            raise Exception("El archivo .zip no contiene reportes en un formato soportado")
+        print(f"Miembros del .zip: {len(miembros)} ({', '.join(miembros)})")
+        
+        argumentos = ([ruta_archivo] * len(miembros), miembros, [self.motor_lectura] * len(miembros))
+        if len(miembros) > 1:
+            try:
+                trabajadores = min(len(miembros), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+                    resultados = list(pool.map(_leer_miembro_zip, *argumentos))
+            except (BrokenProcessPool, OSError) as e:
+                print(f"⚠️ No se pudo usar lectura paralela ({e}), leyendo miembros en secuencia")
+                resultados = list(map(_leer_miembro_zip, *argumentos))
+        else:
+            resultados = list(map(_leer_miembro_zip, *argumentos))
+        
+        motores = sorted({motor for motor, _ in resultados})
+        lecturas = [lectura for _, lecturas_miembro in resultados for lectura in lecturas_miembro]
+        return lecturas, f"zip ({', '.join(motores)})"
+    
+    def _leer_crudo(self, ruta_archivo):
+        """Lee todas las hojas (o miembros del .zip) y las combina en un DataFrame de texto"""
+        if Path(ruta_archivo).suffix.lower() == '.zip':
+            # Reporte comprimido: cada miembro se lee desde el .zip, sin extraerlo
+            inicio = time.perf_counter()
+            lecturas, motor = self._leer_zip(ruta_archivo)
+        else:
+            # Elegir motor de lectura según extensión y tamaño (con respaldo si falla)
+            motores = motores_para_archivo(ruta_archivo, self.motor_lectura)
+            if not motores:
+                raise Exception(f"No hay un motor de lectura instalado para '{Path(ruta_archivo).suffix}'")
+        
+            for motor in motores:
+                inicio = time.perf_counter()
+                try:
+                    lecturas = self._leer_hojas(ruta_archivo, motor)
+                    break
+                except Exception as e:
+                    if motor == motores[-1]:
+                        raise
+                    print(f"⚠️ Motor '{motor}' falló ({e}), probando con el siguiente")
+        
+        segundos = time.perf_counter() - inicio
+        self.ultima_lectura = {'motor': motor, 'segundos': segundos}
+        print(f"Motor de lectura: {motor} ({segundos:.2f} s)")
+        
+        # Hojas sin encabezado propio: continuación de la hoja anterior si tienen
+        # el mismo número de columnas (archivos partidos por el límite de filas)
+        partes = []
+        columnas_referencia = None
+        for hoja, datos, tiene_encabezado in lecturas:
+            if datos is None:
+                print(f"Hoja '{hoja}' vacía, se ignora")
+                continue
+            if tiene_encabezado:
+                columnas_referencia = list(datos.columns)
+            elif columnas_referencia is not None and len(datos.columns) == len(columnas_referencia):
+                datos.columns = columnas_referencia
+                print(f"Hoja '{hoja}' sin encabezado: se toma como continuación")
+            elif len(lecturas) == 1:
+                # Usar la primera fila no vacía como encabezado
+                datos = datos.dropna(how='all')
+                datos, encabezado = datos.iloc[1:].copy(), datos.iloc[0]
+                datos.columns = [f"Unnamed: {i}" if pd.isna(col) else col
+                                 for i, col in enumerate(encabezado)]
+            else:
+                print(f"Hoja '{hoja}' sin encabezados reconocibles, se ignora")
+                continue
+            datos['Hoja Origen'] = hoja if hoja is not None else Path(ruta_archivo).name
+            partes.append(datos)
+        
+        if not partes:
+            raise Exception("No se encontraron hojas con datos en el archivo")
+        df = pd.concat(partes, ignore_index=True)
+        if len(partes) > 1:
+            print(f"Hojas combinadas: {len(partes)} ({len(df)} filas)")
+        
+        # Limpiar nombres de columnas
+        df.columns = [str(col).strip() for col in df.columns]
+        
+        # Mostrar columnas detectadas
+        print(f"\nColumnas detectadas ({len(df.columns)}):")
+        for i, col in enumerate(df.columns):
+            print(f"  {i:2d}. '{col}'")
+        
+        print(f"\nTotal filas leídas: {len(df)}")
+        return df
+    
+    def detectar_columnas(self, df):
+        """
+        Detecta por patrones las columnas estándar (Total, IVA, NIT/Nombre Emisor/Receptor...).
+        Devuelve el mapeo {'columnas': {...}, 'total_alterno': columna o None}, serializable
+        para reutilizarlo en todos los bloques de una conversión por bloques.
+        """
+        # Buscar columnas por patrones si no tienen los nombres exactos
+        column_mapping = {}
+        
+        # Buscar Total
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'total' in col_lower and 'base' not in col_lower:
+                column_mapping['Total'] = col
+            elif 'valor' in col_lower and 'total' in col_lower:
+                column_mapping['Total'] = col
+            elif 'monetario' in col_lower:
+                column_mapping['Total'] = col
+        
+        # Buscar IVA
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'iva' in col_lower and 'rete' not in col_lower and 'total' not in col_lower:
+                column_mapping['IVA'] = col
+            elif 'impuesto' in col_lower and 'valor' in col_lower:
+                column_mapping['IVA'] = col
+        
+        # Buscar NIT Emisor
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'nit' in col_lower and 'emisor' in col_lower:
+                column_mapping['NIT Emisor'] = col
+            elif 'documento' in col_lower and 'emisor' in col_lower:
+                column_mapping['NIT Emisor'] = col
+        
+        # Buscar Nombre Emisor
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'nombre' in col_lower and 'emisor' in col_lower:
+                column_mapping['Nombre Emisor'] = col
+            elif 'razón' in col_lower and 'social' in col_lower:
+                column_mapping['Nombre Emisor'] = col
+        
+        # Buscar NIT Receptor
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'nit' in col_lower and 'receptor' in col_lower:
+                column_mapping['NIT Receptor'] = col
+            elif 'documento' in col_lower and 'receptor' in col_lower:
+                column_mapping['NIT Receptor'] = col
+        
+        # Buscar Nombre Receptor
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'nombre' in col_lower and 'receptor' in col_lower:
+                column_mapping['Nombre Receptor'] = col
+        
+        # Buscar Fecha Emisión, Prefijo, Folio y CUFE (trazabilidad)
+        for col in df.columns:
+            col_lower = str(col).lower()
+            if 'fecha' in col_lower and 'emisi' in col_lower:
+                column_mapping['Fecha Emisión'] = col
+            elif col_lower == 'prefijo':
+                column_mapping['Prefijo'] = col
+            elif col_lower in ('folio', 'número', 'numero'):
+                column_mapping['Folio'] = col
+            elif 'cufe' in col_lower or 'cude' in col_lower:
+                column_mapping['CUFE/CUDE'] = col
+        
+        print(f"\nMapeo de columnas encontrado: {column_mapping}")
+        
+        # Verificar que tenemos las columnas mínimas requeridas
+        total_alterno = None
+        vista = df.rename(columns=column_mapping)
+        if 'Total' not in vista.columns:
+            # Intentar encontrar por índice (última columna numérica)
+            numeric_cols = []
+            for col in vista.columns:
+                try:
+                    # Verificar si la columna contiene números
+                    sample = vista[col].dropna().head(10)
+                    if len(sample) > 0 and any(str(x).replace(',', '').replace('.', '').replace('-', '').isdigit() for x in sample):
+                        numeric_cols.append(col)
+                except:
+                    pass
+        
+            if numeric_cols:
+                # Usar la última columna numérica como Total
+                total_alterno = numeric_cols[-1]
+        
+        return {'columnas': column_mapping, 'total_alterno': total_alterno}
+    
+    def normalizar_facturas(self, df, mapeo):
+        """
+        Aplica el mapeo de columnas y normaliza las facturas: filtra los tipos de documento
+        procesables, convierte los montos a centavos y la fecha de emisión a fecha.
+        """
+        # Renombrar columnas a nombres estándar
+        df = df.rename(columns=mapeo['columnas'])
+        if 'Total' not in df.columns and mapeo['total_alterno'] in df.columns:
+            # Usar la última columna numérica como Total
+            df = df.rename(columns={mapeo['total_alterno']: 'Total'})
+            print(f"Usando '{mapeo['total_alterno']}' como columna Total")
+        
+        # Clasificar tipos de documento una sola vez (categórico) y descartar
+        # Application Responses y otros por código de categoría
+        if 'Tipo de documento' in df.columns:
+            original_count = len(df)
+            tipos = df['Tipo de documento'].astype('category')
+            clases = pd.Categorical(
+                [self.clasificar_tipo_documento(t) for t in tipos.cat.categories],
+                categories=self.CLASES_DOCUMENTO)
+            codigos = clases.codes[tipos.cat.codes.to_numpy()]
+            codigos[tipos.cat.codes.to_numpy() == -1] = self.CLASES_DOCUMENTO.index('Otro')
+            df['Clase Documento'] = pd.Categorical.from_codes(codigos, categories=self.CLASES_DOCUMENTO)
+            procesables = [self.CLASES_DOCUMENTO.index(c) for c in self.CLASES_PROCESABLES]
+            df = df[pd.Series(codigos, index=df.index).isin(procesables)]
+            conteo = df['Clase Documento'].value_counts()
+            print(f"Documentos filtrados: {len(df)} de {original_count} "
+                  f"({', '.join(f'{c}: {conteo.get(c, 0)}' for c in self.CLASES_PROCESABLES)})")
+        else:
+            print("Advertencia: No se encontró columna 'Tipo de documento'")
+        
+        # Convertir columnas monetarias a centavos enteros (int64) en bloque
+        for col in df.columns:
+            if col in ['Total', 'IVA', 'ICA', 'Rete IVA', 'Rete Renta', 'Rete ICA']:
+                try:
+                    df[col] = self.convertir_a_centavos(df[col])
+                    print(f"✓ Convertida columna {col} a centavos")
+        
+                    # Mostrar muestra de valores para verificación
+                    muestra = df[col].head(3).tolist()
+                    print(f"  Muestra (centavos): {muestra}")
+                except Exception as e:
+                    print(f"❌ Error convirtiendo columna {col}: {e}")
+                    df[col] = 0
+        
+        # Convertir la fecha de emisión (formato DIAN dd-mm-aaaa) en una sola pasada
+        if 'Fecha Emisión' in df.columns:
+            df['Fecha Emisión'] = pd.to_datetime(df['Fecha Emisión'], errors='coerce', dayfirst=True)
+            print(f"✓ Convertida columna Fecha Emisión ({df['Fecha Emisión'].notna().sum()} fechas válidas)")
+        
+        # Si no se encontró columna IVA, calcularla si es posible
+        if 'IVA' not in df.columns and 'Total' in df.columns:
+            print("Advertencia: No se encontró columna IVA, se asumirá 0")
+            df['IVA'] = 0
+        
+        return df
+    
     def leer_archivo_dian(self, ruta_archivo):
         """
         Lee archivo DIAN con mejor detección de estructura:
         - Busca encabezados reales buscando patrones conocidos
         - Maneja diferentes formatos de archivo
         """
-        extension = Path(ruta_archivo).suffix.lower()
-        
         try:
-            # Primero intentar leer sin saltar filas para inspeccionar
-            if extension == '.csv':
-                df_raw = pd.read_csv(ruta_archivo, encoding='utf-8-sig', 
-                                   header=None, dtype=str, nrows=10)
-            else:
-                xl = pd.ExcelFile(ruta_archivo)
-                hoja = xl.sheet_names[0]
-                df_raw = pd.read_excel(ruta_archivo, sheet_name=hoja, 
-                                     header=None, dtype=str, nrows=10)
-            
-            print("Primeras filas del archivo crudo:")
-            for i in range(min(5, len(df_raw))):
-                print(f"Fila {i}: {list(df_raw.iloc[i].dropna().head(15))}")
-            
-            # Buscar la fila que contiene encabezados clave
-            header_row = None
-            for idx, row in df_raw.iterrows():
-                row_str = ' '.join([str(cell) for cell in row if pd.notna(cell)])
-                if any(keyword in row_str.lower() for keyword in ['total', 'iva', 'nit', 'emisor', 'receptor']):
-                    header_row = idx
-                    print(f"Encontrado encabezado en fila {idx}")
-                    break
+            df = self._leer_crudo(ruta_archivo)
+            mapeo = self.detectar_columnas(df)
+            df = self.normalizar_facturas(df, mapeo)
             
-            if header_row is None:
-                # Usar la primera fila no vacía como encabezado
-                for idx, row in df_raw.iterrows():
-                    if not row.isnull().all():
-                        header_row = idx
-                        break
-            
-            print(f"Usando fila {header_row} como encabezado")
-            
-            # Leer el archivo con el encabezado encontrado
-            if extension == '.csv':
-                df = pd.read_csv(ruta_archivo, encoding='utf-8-sig', 
-                               skiprows=header_row, header=0, dtype=str)
-            else:
-                df = pd.read_excel(ruta_archivo, sheet_name=hoja, 
-                                 skiprows=header_row, header=0, dtype=str)
-            
-            # Limpiar nombres de columnas
-            df.columns = [str(col).strip() for col in df.columns]
-            
-            # Mostrar columnas detectadas
-            print(f"\nColumnas detectadas ({len(df.columns)}):")
-            for i, col in enumerate(df.columns):
-                print(f"  {i:2d}. '{col}'")
-            
-            print(f"\nTotal filas leídas: {len(df)}")
-            
-            # Buscar columnas por patrones si no tienen los nombres exactos
-            column_mapping = {}
-            
-            # Buscar Total
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'total' in col_lower and 'base' not in col_lower:
-                    column_mapping['Total'] = col
-                elif 'valor' in col_lower and 'total' in col_lower:
-                    column_mapping['Total'] = col
-                elif 'monetario' in col_lower:
-                    column_mapping['Total'] = col
-            
-            # Buscar IVA
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'iva' in col_lower and 'rete' not in col_lower and 'total' not in col_lower:
-                    column_mapping['IVA'] = col
-                elif 'impuesto' in col_lower and 'valor' in col_lower:
-                    column_mapping['IVA'] = col
-            
-            # Buscar NIT Emisor
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'nit' in col_lower and 'emisor' in col_lower:
-                    column_mapping['NIT Emisor'] = col
-                elif 'documento' in col_lower and 'emisor' in col_lower:
-                    column_mapping['NIT Emisor'] = col
-            
-            # Buscar Nombre Emisor
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'nombre' in col_lower and 'emisor' in col_lower:
-                    column_mapping['Nombre Emisor'] = col
-                elif 'razón' in col_lower and 'social' in col_lower:
-                    column_mapping['Nombre Emisor'] = col
-            
-            # Buscar NIT Receptor
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'nit' in col_lower and 'receptor' in col_lower:
-                    column_mapping['NIT Receptor'] = col
-                elif 'documento' in col_lower and 'receptor' in col_lower:
-                    column_mapping['NIT Receptor'] = col
-            
-            # Buscar Nombre Receptor
-            for col in df.columns:
-                col_lower = str(col).lower()
-                if 'nombre' in col_lower and 'receptor' in col_lower:
-                    column_mapping['Nombre Receptor'] = col
-            
-            print(f"\nMapeo de columnas encontrado: {column_mapping}")
-            
-            # Renombrar columnas a nombres estándar
-            df = df.rename(columns=column_mapping)
-            
-            # Verificar que tenemos las columnas mínimas requeridas
-            if 'Total' not in df.columns:
-                # Intentar encontrar por índice (última columna numérica)
-                numeric_cols = []
-                for col in df.columns:
-                    try:
-                        # Verificar si la columna contiene números
-                        sample = df[col].dropna().head(10)
-                        if len(sample) > 0 and any(str(x).replace(',', '').replace('.', '').replace('-', '').isdigit() for x in sample):
-                            numeric_cols.append(col)
-                    except:
-                        pass
-                
-                if numeric_cols:
-                    # Usar la última columna numérica como Total
-                    df = df.rename(columns={numeric_cols[-1]: 'Total'})
-                    print(f"Usando '{numeric_cols[-1]}' como columna Total")
-            
-            # Filtrar solo Facturas electrónicas si existe la columna
-            if 'Tipo de documento' in df.columns:
-                original_count = len(df)
-                mask = df['Tipo de documento'].astype(str).str.contains('Factura', case=False, na=False)
-                df = df[mask]
-                print(f"Facturas filtradas: {len(df)} de {original_count}")
-            else:
-                print("Advertencia: No se encontró columna 'Tipo de documento'")
-            
-            # Convertir columnas numéricas usando el método mejorado
-            for col in df.columns:
-                if col in ['Total', 'IVA', 'ICA', 'Rete IVA', 'Rete Renta', 'Rete ICA']:
-                    try:
-                        # Usar la función limpiar_numero para cada valor
-                        df[col] = df[col].apply(self.limpiar_numero)
-                        print(f"✓ Convertida columna {col} a numérico")
-                        
-                        # Mostrar muestra de valores para verificación
-                        muestra = df[col].head(3).tolist()
-                        print(f"  Muestra: {muestra}")
-                    except Exception as e:
-                        print(f"❌ Error convirtiendo columna {col}: {e}")
-                        df[col] = 0
-            
-            # Si no se encontró columna IVA, calcularla si es posible
-            if 'IVA' not in df.columns and 'Total' in df.columns:
-                print("Advertencia: No se encontró columna IVA, se asumirá 0")
-                df['IVA'] = 0
+            if self.indice_facturas is not None:
+                df = self.revisar_duplicados(df)
             
             return df
             
         except Exception as e:
             raise Exception(f"Error leyendo archivo: {str(e)}\nDetalle: {traceback.format_exc()}")
     
-    def procesar_compras(self, df):
+    def clasificar_tipo_documento(self, tipo):
+        """Clasifica el texto de 'Tipo de documento' en una de las CLASES_DOCUMENTO"""
+        texto = str(tipo).lower()
+        if 'nota' in texto and re.search(r'cr[eé]dito', texto):
+            return 'Nota crédito'
+        if 'nota' in texto and re.search(r'd[eé]bito', texto):
+            return 'Nota débito'
+        if 'factura' in texto:
+            return 'Factura'
+        if 'application' in texto:
+            return 'Application response'
+        return 'Otro'
+    
+    def _preparar_documentos(self, df, col_nit, col_nombre, etiqueta):
         """
-        Procesa COMPRAS según especificaciones:
-        - Débito (gasto) = Total - IVA
-        - Débito (IVA) = IVA original
-        - VALOR_BASE = IVA / 0.19 (redondeado al peso)
-        - Todos los valores redondeados al peso más cercano
+        Extrae en bloque (columnar) los datos por documento que usan compras y ventas:
+        TOTAL, IVA (en centavos), NIT, OBS, DOCUMENTO, FECHA y REVERSA (notas crédito).
+        Descarta documentos con Total e IVA en cero.
         """
-        registros = []
+        total = pd.to_numeric(df['Total'], errors='coerce')
+        iva = pd.to_numeric(df['IVA'], errors='coerce')
         
-        print(f"\nProcesando {len(df)} compras...")
-        print(f"Columnas disponibles: {list(df.columns)}")
+        # Filas con valores no numéricos: se omiten y se reportan en la validación
+        invalidas = total.isna() | iva.isna()
+        self.filas_omitidas = [{'fila': idx, 'error': 'Total o IVA no numérico'}
+                               for idx in df.index[invalidas]]
         
-        # Verificar columnas requeridas
-        required_cols = ['Total', 'IVA']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            raise Exception(f"Columnas faltantes para compras: {missing_cols}")
+        if col_nit in df.columns:
+            nit_origen = df[col_nit]
+        else:
+            # Intentar encontrar columna con NIT
+            nit_cols = [col for col in df.columns if 'nit' in str(col).lower()]
+            nit_origen = df[nit_cols[0]] if nit_cols else pd.Series('', index=df.index)
+        nits = (nit_origen.fillna('').astype(str).str.strip()
+                .str.replace('.0', '', regex=False)
+                .str.replace(r'[^\d]', '', regex=True))
         
-        for idx, row in df.iterrows():
-            try:
-                # Obtener valores - ya vienen como float del leer_archivo_dian
-                total = float(row.get('Total', 0))
-                iva = float(row.get('IVA', 0))
-                
-                # DEBUG: Mostrar primeros 3 registros
-                if idx < 3:
-                    print(f"\n📊 Registro {idx + 1}:")
-                    print(f"   Total: {total:,.2f}")
-                    print(f"   IVA: {iva:,.2f}")
-                
-                # Obtener NIT Emisor o usar valor por defecto
-                if 'NIT Emisor' in df.columns:
-                    nit = self.limpiar_nit(row.get('NIT Emisor', ''))
-                else:
-                    # Intentar encontrar columna con NIT
-                    nit_cols = [col for col in df.columns if 'nit' in str(col).lower()]
-                    nit = self.limpiar_nit(row[nit_cols[0]]) if nit_cols else ""
-                
-                # Obtener nombre o usar valor por defecto
-                if 'Nombre Emisor' in df.columns:
-                    obs = str(row.get('Nombre Emisor', f'Compra {idx+1}'))[:50]
-                else:
-                    obs = f"Compra {idx+1}"
-                
-                if total == 0 and iva == 0:
-                    continue
-                
-                # Calcular valores
-                valor_sin_iva = total - iva
-                base_iva = iva / self.IVA_RATE if iva > 0 else 0
-                
-                # DEBUG: Mostrar cálculo
-                if idx < 3:
-                    print(f"   Valor sin IVA: {valor_sin_iva:,.2f}")
-                    print(f"   Base IVA: {base_iva:,.2f}")
-                
-                # Redondear todos los valores al peso más cercano
-                valor_sin_iva_entero = self.redondear_peso(valor_sin_iva)
-                iva_entero = self.redondear_peso(iva)
-                base_iva_entero = self.redondear_peso(base_iva)
-                
-                # DEBUG: Mostrar valores redondeados
-                if idx < 3:
-                    print(f"   Redondeados:")
-                    print(f"   - Valor sin IVA: {valor_sin_iva_entero:,}")
-                    print(f"   - IVA: {iva_entero:,}")
-                    print(f"   - Base IVA: {base_iva_entero:,}")
-                
-                # Fila 1: Gasto (Débito) - VALORES ENTEROS
-                registros.append({
-                    'CUENTA': self.CUENTAS_COMPRAS['gasto'],
-                    'CC': '',
-                    'OBSERVACIONES': obs,
-                    'DEBITO': valor_sin_iva_entero,
-                    'CREDITO': None,
-                    'VALOR_BASE': None,
-                    'TERCERO': nit,
-                    'H': None
-                })
-                
-                # Fila 2: IVA descontable (Débito) - VALORES ENTEROS
-                if iva > 0:
-                    registros.append({
-                        'CUENTA': self.CUENTAS_COMPRAS['iva_descontable'],
-                        'CC': '',
-                        'OBSERVACIONES': obs,
-                        'DEBITO': iva_entero,
-                        'CREDITO': None,
-                        'VALOR_BASE': base_iva_entero,
-                        'TERCERO': nit,
-                        'H': 1
-                    })
-                    
-            except Exception as e:
-                print(f"❌ Error procesando fila {idx}: {e}")
-                print(f"   Total: {row.get('Total', 'N/A')}")
-                print(f"   IVA: {row.get('IVA', 'N/A')}")
-                traceback.print_exc()
-                continue
+        if col_nombre in df.columns:
+            obs = df[col_nombre].fillna('').astype(str).str[:50]
+        else:
+            obs = pd.Series([f"{etiqueta} {idx + 1}" for idx in df.index], index=df.index)
         
-        print(f"\n✅ Registros generados: {len(registros)}")
-        return pd.DataFrame(registros)
+        if 'Clase Documento' in df.columns:
+            clase = df['Clase Documento']
+            es_nota = clase.isin(['Nota crédito', 'Nota débito'])
+            reversa = (clase == 'Nota crédito').to_numpy()
+        else:
+            es_nota = pd.Series(False, index=df.index)
+            reversa = False
+        
+        documentos = pd.DataFrame({
+            'TOTAL': total.where(~es_nota, total.abs()),
+            'IVA': iva.where(~es_nota, iva.abs()),
+            'NIT': nits,
+            'OBS': obs,
+            'DOCUMENTO': self.identificar_documentos(df),
+            'FECHA': df['Fecha Emisión'] if 'Fecha Emisión' in df.columns else pd.NaT,
+            'REVERSA': reversa,
+        })
+        documentos = documentos[~invalidas]
+        documentos = documentos[(documentos['TOTAL'] != 0) | (documentos['IVA'] != 0)]
+        
+        # DEBUG: Mostrar primeros 3 documentos
+        for idx, doc in documentos.head(3).iterrows():
+            print(f"\n📊 Registro {idx + 1} ({doc['DOCUMENTO']}):")
+            print(f"   Total: {doc['TOTAL'] / 100:,.2f}")
+            print(f"   IVA: {doc['IVA'] / 100:,.2f}")
+            print(f"   Nota crédito (reversa): {'Sí' if doc['REVERSA'] else 'No'}")
+        
+        return documentos
     
-    def procesar_ventas(self, df):
+    def _generar_lineas(self, documentos, lineas):
         """
-        Procesa VENTAS según especificaciones:
-        - Crédito (ingresos) = Total - IVA
-        - Crédito (IVA generado) = IVA original
-        - Débito (IVA crédito) = Total factura (Base + IVA)
+        Genera los registros Siigo en bloque a partir de especificaciones de línea:
+        (cuenta, lado 'DEBITO'/'CREDITO', valores, valores_base, H, máscara).
+        Las notas crédito (REVERSA) intercambian débito y crédito para reversar el asiento.
+        Conserva el orden por documento: todas las líneas de una factura quedan juntas.
+        """
+        bloques = []
+        posicion = pd.Series(range(len(documentos)), index=documentos.index)
+        reversa = documentos['REVERSA']
+        
+        for orden, (cuenta, lado, valores, base, h, mascara) in enumerate(lineas):
+            sel = documentos.index[mascara]
+            if len(sel) == 0:
+                continue
+            montos = valores[sel].astype('Int64')
+            en_credito = (reversa[sel] != (lado == 'CREDITO'))
+            bloques.append(pd.DataFrame({
+                'CUENTA': cuenta,
+                'CC': '',
+                'OBSERVACIONES': documentos.loc[sel, 'OBS'],
+                'DEBITO': montos.where(~en_credito),
+                'CREDITO': montos.where(en_credito),
+                'VALOR_BASE': base[sel].astype('Int64') if base is not None else None,
+                'TERCERO': documentos.loc[sel, 'NIT'],
+                'H': h,
+                'DOCUMENTO': documentos.loc[sel, 'DOCUMENTO'],
+                'FECHA': documentos.loc[sel, 'FECHA'],
+                '_POS': posicion[sel],
+                '_ORDEN': orden,
+            }))
+        
+        if not bloques:
+            return pd.DataFrame(columns=self.COLUMNAS_SIIGO + self.COLUMNAS_INTERNAS)
+        
+        registros = pd.concat(bloques, ignore_index=True)
+        registros = registros.sort_values(['_POS', '_ORDEN'], kind='stable')
+        registros = registros.drop(columns=['_POS', '_ORDEN']).reset_index(drop=True)
+        for col in ['DEBITO', 'CREDITO', 'VALOR_BASE', 'H']:
+            registros[col] = pd.to_numeric(registros[col], errors='coerce').astype('Int64')
+        return registros
+    
+    def _calcular_montos(self, documentos):
+        """
+        Calcula en enteros (sin float) los montos en pesos de cada documento:
+        - TOTAL e IVA redondeados al peso (mitad hacia arriba)
+        - SIN_IVA = TOTAL - IVA ya en pesos, así el asiento cuadra exacto
+        - BASE = IVA / tarifa, redondeada al peso (0 si no hay IVA)
+        """
+        tasa = Fraction(str(self.IVA_RATE))
+        total_c, iva_c = documentos['TOTAL'], documentos['IVA']
+        total = self.centavos_a_pesos(total_c)
+        iva = self.centavos_a_pesos(iva_c)
+        base = self.dividir_redondeado(iva_c * tasa.denominator, tasa.numerator * 100)
+        return {
+            'TOTAL': total,
+            'IVA': iva,
+            'SIN_IVA': total - iva,
+            'BASE': base.where(iva_c > 0, 0),
+        }
+    
+    def resumir(self, documentos, montos, registros):
+        """
+        Resúmenes calculados junto con los asientos: {'terceros', 'cuentas', 'iva'}
+        (ver resumir_terceros, resumir_cuentas y resumir_iva). Los de varios bloques se unen
+        con combinar_resumenes.
+        """
+        return {
+            'terceros': self.resumir_terceros(documentos, montos),
+            'cuentas': self.resumir_cuentas(registros),
+            'iva': self.resumir_iva(documentos, montos),
+        }
+    
+    def resumir_terceros(self, documentos, montos):
+        """
+        Totales por tercero calculados junto con los asientos, en una sola agrupación sobre
+        las columnas de los documentos (sin recorrer después el resultado):
+        - DOCUMENTOS y NOTAS_CREDITO; las notas crédito restan en los valores
+        - BASE (Total - IVA), IVA y TOTAL en pesos enteros
+        - BASE_IVA: base gravada que implica el IVA a la tarifa; NO_GRAVADO = BASE - BASE_IVA
+          (exento, excluido u otras tarifas; negativo = más IVA del que admite la base)
+        Ordenado por TOTAL de mayor a menor.
+        """
+        signo = np.where(documentos['REVERSA'], -1, 1)
+        return self._agrupar_terceros([pd.DataFrame({
+            'TERCERO': documentos['NIT'],
+            'NOMBRE': documentos['OBS'],
+            'DOCUMENTOS': 1,
+            'NOTAS_CREDITO': documentos['REVERSA'].astype('int64'),
+            'BASE': montos['SIN_IVA'] * signo,
+            'IVA': montos['IVA'] * signo,
+            'TOTAL': montos['TOTAL'] * signo,
+            'BASE_IVA': montos['BASE'] * signo,
+        })])
+    
+    def resumir_cuentas(self, registros):
+        """
+        Totales por cuenta de las líneas generadas (una sola agrupación): LINEAS, DEBITO, CREDITO,
+        VALOR_BASE y SALDO = DEBITO - CREDITO. Las notas crédito ya vienen reversadas en las líneas.
+        """
+        return self._agrupar_cuentas([registros.groupby('CUENTA', sort=False).agg(
+            LINEAS=('CUENTA', 'size'), DEBITO=('DEBITO', 'sum'), CREDITO=('CREDITO', 'sum'),
+            VALOR_BASE=('VALOR_BASE', 'sum')).reset_index()])
+    
+    def resumir_iva(self, documentos, montos):
+        """
+        Resumen de IVA por tarifa implícita (IVA / base) de cada documento: las tarifas de
+        self.TARIFAS_IVA (±0,5 puntos), 'Sin IVA' u 'Otra'. BASE, IVA y TOTAL en pesos enteros;
+        las notas crédito restan.
+        """
+        signo = np.where(documentos['REVERSA'], -1, 1)
+        base, iva = montos['SIN_IVA'], montos['IVA']
+        tarifa = (iva / base.where(base != 0)).to_numpy(dtype='float64', na_value=np.nan)
+        condiciones = [iva.to_numpy() == 0] + [np.abs(tarifa - t) <= 0.005 for t in self.TARIFAS_IVA]
+        etiquetas = ['Sin IVA'] + [f"{t * 100:g}%" for t in self.TARIFAS_IVA]
+        return self._agrupar_iva([pd.DataFrame({
+            'TARIFA': np.select(condiciones, etiquetas, 'Otra'),
+            'DOCUMENTOS': 1,
+            'BASE': base * signo,
+            'IVA': iva * signo,
+            'TOTAL': montos['TOTAL'] * signo,
+        })])
+    
+    def _agrupar_terceros(self, tablas):
+        sumas = ['DOCUMENTOS', 'NOTAS_CREDITO', 'BASE', 'IVA', 'TOTAL', 'BASE_IVA']
+        tabla = pd.concat(tablas, ignore_index=True)
+        resumen = tabla.groupby('TERCERO', sort=False).agg(
+            NOMBRE=('NOMBRE', 'first'), **{col: (col, 'sum') for col in sumas})
+        for col in sumas:
+            resumen[col] = resumen[col].astype('int64')
+        resumen['NO_GRAVADO'] = resumen['BASE'] - resumen['BASE_IVA']
+        # Empates por NIT: el orden no depende de cómo se partió el archivo en bloques
+        return resumen.reset_index().sort_values(['TOTAL', 'TERCERO'], ascending=[False, True],
+                                                 kind='stable', ignore_index=True)
+    
+    def _agrupar_cuentas(self, tablas):
+        sumas = ['LINEAS', 'DEBITO', 'CREDITO', 'VALOR_BASE']
+        resumen = pd.concat(tablas, ignore_index=True).groupby('CUENTA', sort=True)[sumas].sum()
+        for col in sumas:
+            resumen[col] = resumen[col].astype('int64')
+        resumen['SALDO'] = resumen['DEBITO'] - resumen['CREDITO']
+        return resumen.reset_index()
+    
+    def _agrupar_iva(self, tablas):
+        sumas = ['DOCUMENTOS', 'BASE', 'IVA', 'TOTAL']
+        resumen = pd.concat(tablas, ignore_index=True).groupby('TARIFA', sort=False)[sumas].sum()
+        for col in sumas:
+            resumen[col] = resumen[col].astype('int64')
+        orden = ['Sin IVA'] + [f"{t * 100:g}%" for t in self.TARIFAS_IVA] + ['Otra']
+        return resumen.reindex([t for t in orden if t in resumen.index]).reset_index()
+    
+    def combinar_resumenes(self, resumenes):
+        """Une los resúmenes de varios bloques (ver resumir) en uno solo"""
+        return {
+            'terceros': self._agrupar_terceros([r['terceros'] for r in resumenes]),
+            'cuentas': self._agrupar_cuentas([r['cuentas'] for r in resumenes]),
+            'iva': self._agrupar_iva([r['iva'] for r in resumenes]),
+        }
+    
+    def totales_resumen(self, resumen):
+        """Totales del lote a partir del resumen por tercero (suma de pocas filas)"""
+        terceros = resumen['terceros']
+        totales = {col: int(terceros[col].sum())
+                   for col in ['DOCUMENTOS', 'NOTAS_CREDITO', 'BASE', 'IVA', 'TOTAL', 'BASE_IVA', 'NO_GRAVADO']}
+        totales['terceros'] = len(terceros)
+        totales['cuentas'] = len(resumen['cuentas'])
+        totales['iva_excedido'] = int((terceros['NO_GRAVADO'] < 0).sum())
+        return totales
+    
+    def procesar_compras(self, df):
+        """
+        Procesa COMPRAS según especificaciones:
+        - Débito (gasto) = Total - IVA
+        - Débito (IVA) = IVA original
         - VALOR_BASE = IVA / 0.19 (redondeado al peso)
-        - Todos los valores redondeados al peso más cercano
+        - Todos los valores redondeados al peso más cercano (mitad hacia arriba, en enteros)
+        - Notas crédito: mismo asiento reversado (en crédito); notas débito: asiento adicional
         """
-        registros = []
+        print(f"\nProcesando {len(df)} compras...")
+        print(f"Columnas disponibles: {list(df.columns)}")
+        
+        # Verificar columnas requeridas
+        required_cols = ['Total', 'IVA']
+        missing_cols = [col for col in required_cols if col not in df.columns]
+        if missing_cols:
+            raise Exception(f"Columnas faltantes para compras: {missing_cols}")
+        
+        documentos = self._preparar_documentos(df, 'NIT Emisor', 'Nombre Emisor', 'Compra')
         
+        # Calcular y redondear todos los valores al peso (en enteros, en bloque)
+        montos = self._calcular_montos(documentos)
+        valor_sin_iva, iva_entero, base_iva = montos['SIN_IVA'], montos['IVA'], montos['BASE']
+        con_iva = documentos['IVA'] > 0
+        todos = pd.Series(True, index=documentos.index)
+        
+        registros = self._generar_lineas(documentos, [
+            # Fila 1: Gasto (Débito)
+            (self.CUENTAS_COMPRAS['gasto'], 'DEBITO', valor_sin_iva, None, None, todos),
+            # Fila 2: IVA descontable (Débito)
+            (self.CUENTAS_COMPRAS['iva_descontable'], 'DEBITO', iva_entero, base_iva, 1, con_iva),
+        ])
+        self.resumen = self.resumir(documentos, montos, registros)
+        
+        print(f"\n✅ Registros generados: {len(registros)}")
+        return registros
+    
+    def procesar_ventas(self, df):
+        """
+        Procesa VENTAS según especificaciones:
+        - Crédito (ingresos) = Total - IVA
+        - Crédito (IVA generado) = IVA original
+        - Débito (IVA crédito) = Total factura (Base + IVA), también en ventas sin IVA
+        - VALOR_BASE = IVA / 0.19 (redondeado al peso)
+        - Todos los valores redondeados al peso más cercano (mitad hacia arriba, en enteros)
+        - Notas crédito: mismo asiento reversado (débito ↔ crédito); notas débito: asiento adicional
+        """
         print(f"\nProcesando {len(df)} ventas...")
         print(f"Columnas disponibles: {list(df.columns)}")
         
@@ -424,109 +1596,1187 @@ class ProcesadorContableDIAN:
         if missing_cols:
             raise Exception(f"Columnas faltantes para ventas: {missing_cols}")
         
-        for idx, row in df.iterrows():
-            try:
-                # Obtener valores - ya vienen como float del leer_archivo_dian
-                total = float(row.get('Total', 0))
-                iva = float(row.get('IVA', 0))
-                
-                # DEBUG: Mostrar primeros 3 registros
-                if idx < 3:
-                    print(f"\n📊 Registro {idx + 1}:")
-                    print(f"   Total: {total:,.2f}")
-                    print(f"   IVA: {iva:,.2f}")
-                
-                # Obtener NIT Receptor o usar valor por defecto
-                if 'NIT Receptor' in df.columns:
-                    nit = self.limpiar_nit(row.get('NIT Receptor', ''))
-                else:
-                    # Intentar encontrar columna con NIT
-                    nit_cols = [col for col in df.columns if 'nit' in str(col).lower()]
-                    nit = self.limpiar_nit(row[nit_cols[0]]) if nit_cols else ""
-                
-                # Obtener nombre o usar valor por defecto
-                if 'Nombre Receptor' in df.columns:
-                    obs = str(row.get('Nombre Receptor', f'Venta {idx+1}'))[:50]
+        documentos = self._preparar_documentos(df, 'NIT Receptor', 'Nombre Receptor', 'Venta')
+        
+        # Calcular y redondear todos los valores al peso (en enteros, en bloque)
+        montos = self._calcular_montos(documentos)
+        valor_sin_iva, iva_entero, base_iva = montos['SIN_IVA'], montos['IVA'], montos['BASE']
+        total_entero = montos['TOTAL']
+        con_iva = documentos['IVA'] > 0
+        todos = pd.Series(True, index=documentos.index)
+        
+        registros = self._generar_lineas(documentos, [
+            # Fila 1: Ingresos (Crédito) - Cuenta 41
+            (self.CUENTAS_VENTAS['ingresos'], 'CREDITO', valor_sin_iva, None, None, todos),
+            # Fila 2: IVA Generado (Crédito) - Cuenta 24080101
+            (self.CUENTAS_VENTAS['iva_generado'], 'CREDITO', iva_entero, base_iva, 1, con_iva),
+            # Fila 3: IVA Débito - Cuenta 13050501 - Total factura (Base + IVA); es la contrapartida
+            # del asiento, así que va en todas las ventas, tengan o no IVA
+            (self.CUENTAS_VENTAS['iva_credito'], 'DEBITO', total_entero, None, None, todos),
+        ])
+        self.resumen = self.resumir(documentos, montos, registros)
+        
+        print(f"\n✅ Registros generados: {len(registros)}")
+        return registros
+    
+    def validar_asientos(self, df_facturas, df_resultado, tipo):
+        """
+        Valida la partida doble y detecta anomalías (todo vectorizado):
+        - Suma débitos/créditos por factura y por lote, marca las descuadradas. Las compras no
+          llevan la línea de proveedores: su contrapartida implícita es el total de la factura
+          (crédito; débito en notas crédito), y el cuadre se valida contra ella
+        - IVA mayor que el Total, totales o IVA negativos
+        - IVA / base gravable por encima de la tarifa plausible
+        - Filas omitidas por error durante la generación
+        Devuelve un diccionario con DataFrames listos para mostrar en la interfaz.
+        """
+        col_nit = 'NIT Emisor' if tipo == 'compras' else 'NIT Receptor'
+        documentos = self.identificar_documentos(df_facturas)
+
+        # Montos de las facturas de origen (en centavos)
+        total = pd.to_numeric(df_facturas['Total'], errors='coerce').fillna(0)
+        iva = pd.to_numeric(df_facturas['IVA'], errors='coerce').fillna(0)
+        nota_credito = pd.Series(False, index=df_facturas.index)
+        if 'Clase Documento' in df_facturas.columns:
+            # Las notas pueden venir con signo negativo; se validan por valor absoluto
+            es_nota = df_facturas['Clase Documento'].isin(['Nota crédito', 'Nota débito'])
+            total = total.where(~es_nota, total.abs())
+            iva = iva.where(~es_nota, iva.abs())
+            nota_credito = df_facturas['Clase Documento'] == 'Nota crédito'
+
+        # Partida doble por factura y por lote
+        asientos = df_resultado[['DOCUMENTO', 'TERCERO']].copy()
+        asientos['DEBITO'] = pd.to_numeric(df_resultado['DEBITO'], errors='coerce').fillna(0)
+        asientos['CREDITO'] = pd.to_numeric(df_resultado['CREDITO'], errors='coerce').fillna(0)
+        por_factura = asientos.groupby('DOCUMENTO', sort=False).agg(
+            TERCERO=('TERCERO', 'first'),
+            DEBITO=('DEBITO', 'sum'),
+            CREDITO=('CREDITO', 'sum')).reset_index()
+        if tipo == 'compras':
+            pesos = self.centavos_a_pesos(total.round().astype('int64'))
+            contrapartida = pesos.where(~nota_credito, -pesos).groupby(documentos).sum()
+            por_factura['CONTRAPARTIDA'] = por_factura['DOCUMENTO'].map(contrapartida).fillna(0)
+        else:
+            por_factura['CONTRAPARTIDA'] = 0
+        por_factura['DIFERENCIA'] = por_factura['DEBITO'] - por_factura['CREDITO'] - por_factura['CONTRAPARTIDA']
+        descuadradas = por_factura[por_factura['DIFERENCIA'].abs() >= 1]
+
+        total_debito = asientos['DEBITO'].sum()
+        total_credito = asientos['CREDITO'].sum()
+        total_contrapartida = por_factura['CONTRAPARTIDA'].sum()
+
+        # Anomalías sobre las facturas de origen (máscaras vectorizadas)
+        base = total - iva
+        ratio = (iva / base.where(base > 0)).fillna(0)
+        reglas = [
+            ('IVA mayor que el Total', iva > total),
+            ('Total negativo', total < 0),
+            ('IVA negativo', iva < 0),
+            (f'IVA/base mayor a {self.IVA_MAXIMO_PLAUSIBLE:.0%}',
+             (iva > 0) & (base > 0) & (ratio > self.IVA_MAXIMO_PLAUSIBLE)),
+        ]
+        if col_nit in df_facturas.columns:
+            nits = df_facturas[col_nit]
+        else:
+            nits = pd.Series('', index=df_facturas.index)
+        anomalias = []
+        for motivo, mascara in reglas:
+            if mascara.any():
+                anomalias.append(pd.DataFrame({
+                    'DOCUMENTO': documentos[mascara],
+                    'TERCERO': nits[mascara].map(self.limpiar_nit),
+                    'TOTAL': total[mascara] / 100,
+                    'IVA': iva[mascara] / 100,
+                    'MOTIVO': motivo}))
+        for omitida in self.filas_omitidas:
+            fila = omitida['fila']
+            anomalias.append(pd.DataFrame([{
+                'DOCUMENTO': documentos.get(fila, f"Fila {fila + 1}"),
+                'TERCERO': self.limpiar_nit(nits.get(fila)),
+                'TOTAL': total.get(fila, 0) / 100,
+                'IVA': iva.get(fila, 0) / 100,
+                'MOTIVO': f"Fila omitida: {omitida['error']}"}]))
+        if self.duplicados is not None and len(self.duplicados):
+            anomalias.append(self.duplicados)
+        columnas_anomalias = ['DOCUMENTO', 'TERCERO', 'TOTAL', 'IVA', 'MOTIVO']
+        df_anomalias = (pd.concat(anomalias, ignore_index=True) if anomalias
+                        else pd.DataFrame(columns=columnas_anomalias))
+
+        reporte = {
+            'cuadrado': len(descuadradas) == 0,
+            'totales': {
+                'facturas': len(por_factura),
+                'debito': total_debito,
+                'credito': total_credito,
+                'contrapartida': total_contrapartida,
+                'diferencia': total_debito - total_credito - total_contrapartida,
+                'descuadradas': len(descuadradas),
+                'anomalias': len(df_anomalias),
+            },
+            'por_factura': por_factura,
+            'descuadradas': descuadradas,
+            'anomalias': df_anomalias,
+        }
+
+        print(f"\n🔎 Validación: débitos {total_debito:,.0f} / créditos {total_credito:,.0f} "
+              + (f"/ contrapartida proveedores {total_contrapartida:,.0f} " if tipo == 'compras' else "")
+              + f"/ diferencia {total_debito - total_credito - total_contrapartida:,.0f}")
+        print(f"   Facturas descuadradas: {len(descuadradas)} de {len(por_factura)}")
+        print(f"   Anomalías: {len(df_anomalias)}")
+        return reporte
+
+    def consolidar_registros(self, df_resultado, por_periodo=False):
+        """
+        Consolida los registros por TERCERO + CUENTA (y opcionalmente por mes):
+        - Suma DEBITO, CREDITO y VALOR_BASE en una sola pasada de groupby
+        - FACTURAS = número de facturas agrupadas en cada línea (trazabilidad)
+        - PERIODO = mes de emisión (AAAA-MM) cuando se consolida por periodo
+        """
+        if df_resultado is None or len(df_resultado) == 0:
+            return df_resultado
+
+        df = df_resultado.copy()
+        claves = ['TERCERO', 'CUENTA']
+        if por_periodo:
+            fechas = pd.to_datetime(df['FECHA'], errors='coerce')
+            df['PERIODO'] = fechas.dt.strftime('%Y-%m').fillna('Sin fecha')
+            claves.insert(0, 'PERIODO')
+
+        for col in ['DEBITO', 'CREDITO', 'VALOR_BASE', 'H']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        grupos = df.groupby(claves, sort=True, dropna=False)
+        # min_count=1 conserva vacío (NaN) cuando ninguna factura aportó valor
+        sumas = grupos[['DEBITO', 'CREDITO', 'VALOR_BASE']].sum(min_count=1)
+        otros = grupos.agg(CC=('CC', 'first'),
+                           OBSERVACIONES=('OBSERVACIONES', 'first'),
+                           H=('H', 'max'),
+                           FACTURAS=('DOCUMENTO', 'nunique'),
+                           FECHA=('FECHA', 'max'))
+        consolidado = sumas.join(otros).reset_index()
+
+        columnas = self.COLUMNAS_SIIGO + ['FACTURAS'] + (['PERIODO'] if por_periodo else []) + ['FECHA']
+        consolidado = consolidado[columnas]
+
+        print(f"\n✅ Consolidación: {len(df_resultado)} registros → {len(consolidado)} líneas "
+              f"({'tercero + cuenta + periodo' if por_periodo else 'tercero + cuenta'})")
+        return consolidado
+
+    def leer_auxiliar_siigo(self, ruta_archivo, cuentas=None):
+        """
+        Lee un auxiliar contable exportado de Siigo (.xlsx/.xls/.csv) detectando la fila de
+        encabezados (la que contiene Débito y Crédito). Devuelve un DataFrame con
+        CUENTA, COMPROBANTE, FECHA, TERCERO, DEBITO y CREDITO (en centavos enteros).
+        `cuentas`: prefijos de cuenta a conservar (p. ej. ['2205']); None conserva todas.
+        """
+        extension = Path(ruta_archivo).suffix.lower()
+        if extension in MOTORES_LECTURA['csv']['extensiones']:
+            def leer(**kwargs):
+                return pd.read_csv(ruta_archivo, encoding='utf-8-sig', dtype=str,
+                                   sep=None, engine='python', **kwargs)
+        else:
+            motores = motores_para_archivo(ruta_archivo, self.motor_lectura)
+            if not motores:
+                raise Exception(f"No hay un motor de lectura instalado para '{extension}'")
+            def leer(**kwargs):
+                return pd.read_excel(ruta_archivo, dtype=str, engine=motores[0], **kwargs)
+        
+        # Los auxiliares traen un bloque de títulos (empresa, periodo) antes de la tabla
+        df_raw = leer(header=None, nrows=30)
+        header_row = None
+        for idx, row in df_raw.iterrows():
+            row_str = ' '.join(str(cell) for cell in row if pd.notna(cell)).lower()
+            if re.search(r'd[eé]bito', row_str) and re.search(r'cr[eé]dito', row_str):
+                header_row = idx
+                break
+        if header_row is None:
+            raise Exception("No se encontraron las columnas Débito y Crédito en el auxiliar de Siigo")
+        
+        df = leer(skiprows=header_row, header=0)
+        df.columns = [str(col).strip() for col in df.columns]
+        
+        column_mapping = {}
+        for col in df.columns:
+            col_lower = col.lower()
+            if re.search(r'd[eé]bito', col_lower) and 'DEBITO' not in column_mapping:
+                column_mapping['DEBITO'] = col
+            elif re.search(r'cr[eé]dito', col_lower) and 'CREDITO' not in column_mapping:
+                column_mapping['CREDITO'] = col
+            elif 'fecha' in col_lower and 'FECHA' not in column_mapping:
+                column_mapping['FECHA'] = col
+            elif ('identificaci' in col_lower or 'nit' in col_lower
+                  or (col_lower.startswith('tercero') and 'nombre' not in col_lower)):
+                column_mapping.setdefault('TERCERO', col)
+            elif 'cuenta' in col_lower and 'nombre' not in col_lower and 'CUENTA' not in column_mapping:
+                column_mapping['CUENTA'] = col
+            elif ('comprobante' in col_lower or col_lower == 'documento') and 'COMPROBANTE' not in column_mapping:
+                column_mapping['COMPROBANTE'] = col
+        print(f"Mapeo de columnas del auxiliar: {column_mapping}")
+        if 'TERCERO' not in column_mapping:
+            raise Exception("No se encontró la columna de identificación del tercero en el auxiliar de Siigo")
+        
+        auxiliar = pd.DataFrame({destino: df[origen] for destino, origen in column_mapping.items()})
+        for col in ['CUENTA', 'COMPROBANTE']:
+            if col not in auxiliar.columns:
+                auxiliar[col] = ''
+        auxiliar['CUENTA'] = auxiliar['CUENTA'].fillna('').astype(str).str.strip()
+        # Filas de totales/subtotales del reporte: sin tercero
+        auxiliar['TERCERO'] = (auxiliar['TERCERO'].fillna('').astype(str).str.strip()
+                               .str.replace(r'\.0$', '', regex=True)
+                               .str.replace(r'[^\d]', '', regex=True))
+        auxiliar = auxiliar[auxiliar['TERCERO'] != '']
+        if cuentas:
+            auxiliar = auxiliar[auxiliar['CUENTA'].str.startswith(tuple(cuentas))]
+        
+        auxiliar['DEBITO'] = self.convertir_a_centavos(auxiliar['DEBITO'])
+        auxiliar['CREDITO'] = self.convertir_a_centavos(auxiliar['CREDITO'])
+        auxiliar['FECHA'] = (pd.to_datetime(auxiliar['FECHA'], errors='coerce', dayfirst=True)
+                             if 'FECHA' in auxiliar.columns else pd.NaT)
+        auxiliar = auxiliar[(auxiliar['DEBITO'] != 0) | (auxiliar['CREDITO'] != 0)]
+        print(f"Movimientos del auxiliar: {len(auxiliar)}")
+        return auxiliar[['CUENTA', 'COMPROBANTE', 'FECHA', 'TERCERO', 'DEBITO', 'CREDITO']].reset_index(drop=True)
+    
+    def _emparejar(self, dian, siigo, claves, max_dias=None):
+        """
+        Empareja uno a uno movimientos DIAN y Siigo con un hash join sobre `claves`.
+        Entre candidatos prefiere la menor diferencia de valor y luego de fecha;
+        cada ronda asigna los mejores pares sin conflicto y libera el resto.
+        Con `max_dias` la ventana entra en el join: cada fecha cae en una cubeta de
+        max_dias + 1 días y solo se cruzan cubetas iguales o vecinas, así un NIT con
+        muchos movimientos no genera todos contra todos. Un movimiento sin fecha queda
+        fuera de cualquier ventana; sin ventana se empareja de último.
+        """
+        if max_dias is not None:
+            ancho = max_dias + 1
+            dian = dian[dian['FECHA'].notna()]
+            siigo = siigo[siigo['FECHA'].notna()]
+            dian = dian.assign(_CUBETA=self._dias_desde_epoca(dian['FECHA']) // ancho)
+            cubeta_siigo = self._dias_desde_epoca(siigo['FECHA']) // ancho
+            siigo = pd.concat([siigo.assign(_CUBETA=cubeta_siigo + desfase) for desfase in (-1, 0, 1)],
+                              ignore_index=True)
+            claves = claves + ['_CUBETA']
+        candidatos = dian.merge(siigo, on=claves, suffixes=('_DIAN', '_SIIGO'))
+        if len(candidatos) == 0:
+            return candidatos
+        candidatos = candidatos.drop(columns=['_CUBETA'], errors='ignore')
+        dias = (candidatos['FECHA_SIIGO'] - candidatos['FECHA_DIAN']).dt.days
+        # Sin fecha en alguno de los lados: DIAS vacío, que el orden deja al final
+        candidatos['DIAS'] = dias.abs().astype('Int64')
+        if max_dias is not None:
+            candidatos = candidatos[candidatos['DIAS'] <= max_dias]
+            if len(candidatos) == 0:
+                return candidatos
+        valor_dian = candidatos['VALOR_DIAN'] if 'VALOR_DIAN' in candidatos.columns else candidatos['VALOR']
+        valor_siigo = candidatos['VALOR_SIIGO'] if 'VALOR_SIIGO' in candidatos.columns else candidatos['VALOR']
+        candidatos['_DIF'] = (valor_siigo - valor_dian).abs()
+        candidatos = candidatos.sort_values(['_DIF', 'DIAS', 'ID_DIAN', 'ID_SIIGO'], kind='stable')
+        
+        parejas = []
+        while len(candidatos):
+            ronda = candidatos.drop_duplicates('ID_DIAN').drop_duplicates('ID_SIIGO')
+            parejas.append(ronda)
+            candidatos = candidatos[~candidatos['ID_DIAN'].isin(ronda['ID_DIAN'])
+                                    & ~candidatos['ID_SIIGO'].isin(ronda['ID_SIIGO'])]
+        return pd.concat(parejas, ignore_index=True).drop(columns=['_DIF'])
+    
+    def _dias_desde_epoca(self, fechas):
+        """Días enteros desde 1970-01-01 de una serie de fechas sin vacíos"""
+        return pd.Series(fechas.to_numpy().astype('datetime64[D]').astype('int64'), index=fechas.index)
+    
+    def conciliar_siigo(self, df_facturas, df_auxiliar, tipo, dias_tolerancia=5):
+        """
+        Concilia las facturas DIAN contra el auxiliar de Siigo por NIT + valor (+ ventana de fechas)
+        con hash joins, sin búsquedas fila por fila:
+        - Conciliado: mismo NIT y valor con fechas dentro de la ventana
+        - Fecha fuera de rango: mismo NIT y valor, fechas más separadas que la ventana
+        - Diferencia de valor: mismo NIT y fecha dentro de la ventana, valor distinto
+        Un movimiento sin fecha nunca cae dentro de la ventana: si su NIT y valor coinciden
+        queda como fecha fuera de rango, detrás de los candidatos con fecha.
+        - Falta en Siigo / Sin soporte DIAN: sin contraparte
+        - Duplicado en DIAN / Duplicado en Siigo: la misma factura (NIT + documento en DIAN,
+          NIT + valor sobrante en Siigo) más de una vez
+        Los valores se comparan en pesos con signo (notas crédito en negativo): en compras
+        el valor Siigo es crédito - débito (proveedores); en ventas, débito - crédito (clientes).
+        """
+        if tipo == 'compras':
+            documentos = self._preparar_documentos(df_facturas, 'NIT Emisor', 'Nombre Emisor', 'Compra')
+        else:
+            documentos = self._preparar_documentos(df_facturas, 'NIT Receptor', 'Nombre Receptor', 'Venta')
+        
+        valor = self.centavos_a_pesos(documentos['TOTAL'].astype('int64'))
+        dian = pd.DataFrame({
+            'ID_DIAN': np.arange(len(documentos)),
+            'TERCERO': documentos['NIT'].to_numpy(),
+            'VALOR': np.where(documentos['REVERSA'], -valor, valor),
+            'FECHA': pd.to_datetime(documentos['FECHA'], errors='coerce').to_numpy(),
+            'DOCUMENTO': documentos['DOCUMENTO'].to_numpy(),
+        })
+        if tipo == 'compras':
+            neto = df_auxiliar['CREDITO'] - df_auxiliar['DEBITO']
+        else:
+            neto = df_auxiliar['DEBITO'] - df_auxiliar['CREDITO']
+        siigo = pd.DataFrame({
+            'ID_SIIGO': np.arange(len(df_auxiliar)),
+            'TERCERO': df_auxiliar['TERCERO'].to_numpy(),
+            'VALOR': self.centavos_a_pesos(neto).to_numpy(),
+            'FECHA': pd.to_datetime(df_auxiliar['FECHA'], errors='coerce').to_numpy(),
+            'COMPROBANTE': df_auxiliar['COMPROBANTE'].to_numpy(),
+            'CUENTA': df_auxiliar['CUENTA'].to_numpy(),
+        })
+        
+        # La misma factura (mismo NIT + documento) repetida en el reporte DIAN: el mismo folio
+        # de dos terceros distintos son dos facturas
+        repetida = dian.duplicated(['TERCERO', 'DOCUMENTO']) & ~dian['DOCUMENTO'].str.startswith('Fila ')
+        duplicados_dian = dian[repetida]
+        pendientes_dian = dian[~repetida]
+        pendientes_siigo = siigo
+        
+        bloques = []
+        pasadas = [
+            ('Conciliado', ['TERCERO', 'VALOR'], dias_tolerancia),
+            ('Fecha fuera de rango', ['TERCERO', 'VALOR'], None),
+            ('Diferencia de valor', ['TERCERO'], dias_tolerancia),
+        ]
+        for estado, claves, max_dias in pasadas:
+            parejas = self._emparejar(pendientes_dian, pendientes_siigo, claves, max_dias)
+            if len(parejas) == 0:
+                continue
+            if 'VALOR' in claves:
+                parejas['VALOR_DIAN'] = parejas['VALOR']
+                parejas['VALOR_SIIGO'] = parejas['VALOR']
+            parejas['ESTADO'] = estado
+            bloques.append(parejas)
+            pendientes_dian = pendientes_dian[~pendientes_dian['ID_DIAN'].isin(parejas['ID_DIAN'])]
+            pendientes_siigo = pendientes_siigo[~pendientes_siigo['ID_SIIGO'].isin(parejas['ID_SIIGO'])]
+        
+        # Sobrantes de Siigo con una clave NIT + valor que sí existe en DIAN: registro repetido
+        claves_dian = pd.MultiIndex.from_frame(dian[['TERCERO', 'VALOR']])
+        repetido_siigo = pd.MultiIndex.from_frame(pendientes_siigo[['TERCERO', 'VALOR']]).isin(claves_dian)
+        
+        bloques.extend([
+            duplicados_dian.rename(columns={'FECHA': 'FECHA_DIAN', 'VALOR': 'VALOR_DIAN'})
+                .assign(ESTADO='Duplicado en DIAN'),
+            pendientes_dian.rename(columns={'FECHA': 'FECHA_DIAN', 'VALOR': 'VALOR_DIAN'})
+                .assign(ESTADO='Falta en Siigo'),
+            pendientes_siigo[repetido_siigo].rename(columns={'FECHA': 'FECHA_SIIGO', 'VALOR': 'VALOR_SIIGO'})
+                .assign(ESTADO='Duplicado en Siigo'),
+            pendientes_siigo[~repetido_siigo].rename(columns={'FECHA': 'FECHA_SIIGO', 'VALOR': 'VALOR_SIIGO'})
+                .assign(ESTADO='Sin soporte DIAN'),
+        ])
+        
+        columnas = ['ESTADO', 'TERCERO', 'DOCUMENTO', 'FECHA_DIAN', 'VALOR_DIAN',
+                    'COMPROBANTE', 'CUENTA', 'FECHA_SIIGO', 'VALOR_SIIGO', 'DIFERENCIA', 'DIAS']
+        detalle = pd.concat([b for b in bloques if len(b)], ignore_index=True)
+        detalle = detalle.reindex(columns=columnas + ['ID_DIAN', 'ID_SIIGO'])
+        for col in ['VALOR_DIAN', 'VALOR_SIIGO', 'DIAS']:
+            detalle[col] = detalle[col].astype('Int64')
+        detalle['DIFERENCIA'] = detalle['VALOR_SIIGO'] - detalle['VALOR_DIAN']
+        
+        # Orden del informe: primero lo que requiere atención, luego lo conciliado
+        orden_estados = ['Falta en Siigo', 'Sin soporte DIAN', 'Diferencia de valor', 'Fecha fuera de rango',
+                         'Duplicado en DIAN', 'Duplicado en Siigo', 'Conciliado']
+        detalle['ESTADO'] = pd.Categorical(detalle['ESTADO'], categories=orden_estados)
+        detalle = (detalle.sort_values(['ESTADO', 'TERCERO', 'ID_DIAN', 'ID_SIIGO'], kind='stable')
+                   [columnas].reset_index(drop=True))
+        
+        conteo = detalle['ESTADO'].value_counts()
+        resumen = {estado: int(conteo.get(estado, 0)) for estado in orden_estados}
+        reporte = {
+            'conciliado': resumen['Conciliado'] == len(detalle),
+            'totales': {
+                'facturas_dian': len(dian),
+                'movimientos_siigo': len(siigo),
+                'valor_dian': int(dian['VALOR'].sum()),
+                'valor_siigo': int(siigo['VALOR'].sum()),
+                **resumen,
+            },
+            'detalle': detalle,
+        }
+        
+        print(f"\n⚖ Conciliación: {len(dian)} facturas DIAN / {len(siigo)} movimientos Siigo")
+        for estado in orden_estados:
+            if resumen[estado]:
+                print(f"   {estado}: {resumen[estado]}")
+        return reporte
+    
+    def _huellas_lineas(self, df):
+        """
+        Huellas de 64 bits de cada línea (vectorizado) para comparar corridas:
+        - CLAVE identifica la línea: TERCERO + DOCUMENTO + CUENTA + lado (débito/crédito) en el
+          detalle (el mismo folio de dos terceros son líneas distintas), o [PERIODO +] TERCERO +
+          CUENTA si está consolidado; más el número de repetición
+        - VALOR resume el resto de columnas del layout de Siigo
+        Los valores se normalizan (montos a número, texto a str) para que coincidan sin importar
+        cómo se guardó cada corrida.
+        """
+        if 'DOCUMENTO' in df.columns:
+            claves = [col for col in ['TERCERO', 'DOCUMENTO', 'CUENTA'] if col in df.columns]
+        else:
+            claves = [col for col in ['PERIODO', 'TERCERO', 'CUENTA'] if col in df.columns]
+        
+        def normalizar(col):
+            serie = df[col]
+            if col in ['DEBITO', 'CREDITO', 'VALOR_BASE', 'H', 'FACTURAS']:
+                return pd.Series(pd.to_numeric(serie, errors='coerce').to_numpy(dtype='float64', na_value=np.nan))
+            texto = serie.astype(object)
+            return pd.Series(texto.where(texto.notna(), '').astype(str).to_numpy(dtype=object))
+        
+        llave = pd.DataFrame({col: normalizar(col) for col in claves})
+        if 'DOCUMENTO' in df.columns:
+            llave['_LADO'] = np.where(df['DEBITO'].notna().to_numpy(), 'D', 'C')
+        llave['_N'] = llave.groupby(list(llave.columns), sort=False).cumcount().to_numpy()
+        
+        columnas_valor = [col for col in self.columnas_exportables(df) if col not in claves]
+        valores = pd.DataFrame({col: normalizar(col) for col in columnas_valor})
+        return pd.DataFrame({
+            'CLAVE': pd.util.hash_pandas_object(llave, index=False).to_numpy(),
+            'VALOR': pd.util.hash_pandas_object(valores, index=False).to_numpy(),
+        })
+    
+    def comparar_resultados(self, df_anterior, df_nuevo):
+        """
+        Compara el resultado nuevo contra una corrida anterior del mismo cliente y periodo,
+        con un hash join sobre las huellas de cada línea (ver _huellas_lineas):
+        - agregadas: líneas nuevas; eliminadas: líneas que ya no están
+        - modificadas: misma línea con otros valores (modificadas_antes = cómo estaban)
+        Las tablas conservan el layout de Siigo. Ambas corridas deben tener la misma forma
+        (detalle o consolidado), si no todo aparece como eliminado y agregado.
+        """
+        inicio = time.perf_counter()
+        anterior = self._huellas_lineas(df_anterior)
+        nuevo = self._huellas_lineas(df_nuevo)
+        anterior['FILA'] = np.arange(len(anterior))
+        nuevo['FILA'] = np.arange(len(nuevo))
+        
+        cruce = anterior.merge(nuevo, on='CLAVE', how='outer', suffixes=('_ANTERIOR', '_NUEVO'), indicator=True)
+        ambas = cruce[cruce['_merge'] == 'both']
+        cambiadas = ambas[ambas['VALOR_ANTERIOR'] != ambas['VALOR_NUEVO']]
+        
+        def filas(df, posiciones):
+            return df.iloc[np.sort(posiciones.to_numpy(dtype='int64'))].reset_index(drop=True)
+        
+        cambiadas = cambiadas.sort_values('FILA_NUEVO')
+        diferencias = {
+            'agregadas': filas(df_nuevo, cruce.loc[cruce['_merge'] == 'right_only', 'FILA_NUEVO']),
+            'eliminadas': filas(df_anterior, cruce.loc[cruce['_merge'] == 'left_only', 'FILA_ANTERIOR']),
+            'modificadas': df_nuevo.iloc[cambiadas['FILA_NUEVO'].to_numpy(dtype='int64')].reset_index(drop=True),
+            'modificadas_antes': df_anterior.iloc[cambiadas['FILA_ANTERIOR'].to_numpy(dtype='int64')].reset_index(drop=True),
+        }
+        diferencias['totales'] = {
+            'agregadas': len(diferencias['agregadas']),
+            'eliminadas': len(diferencias['eliminadas']),
+            'modificadas': len(diferencias['modificadas']),
+            'sin_cambios': len(ambas) - len(cambiadas),
+        }
+        diferencias['sin_cambios'] = not any(diferencias['totales'][clave]
+                                             for clave in ['agregadas', 'eliminadas', 'modificadas'])
+        
+        totales = diferencias['totales']
+        print(f"\n🆚 Comparación: {totales['agregadas']} agregadas, {totales['eliminadas']} eliminadas, "
+              f"{totales['modificadas']} modificadas, {totales['sin_cambios']} sin cambios "
+              f"({time.perf_counter() - inicio:.2f} s)")
+        return diferencias
+    
+    def exportar_diferencias(self, diferencias, ruta_archivo):
+        """Escribe las diferencias en un libro con una hoja por tipo de cambio, en el layout de Siigo"""
+        hojas = []
+        for nombre, clave in [('Agregadas', 'agregadas'), ('Eliminadas', 'eliminadas'),
+                              ('Modificadas', 'modificadas'), ('Modificadas (antes)', 'modificadas_antes')]:
+            df = diferencias[clave]
+            hojas.append((nombre, df[self.columnas_exportables(df)]))
+        escribir_libro_siigo(ruta_archivo, hojas)
+        return ruta_archivo
+    
+    def generar_codigo_m(self, df_resultado):
+        """Genera el código Power Query (M) con los registros en valores enteros"""
+        # Solo lectura: se recorre el resultado sin copiarlo (puede estar mapeado en memoria)
+        df_display = df_resultado[self.columnas_exportables(df_resultado)]
+        
+        # Generar código M
+        filas = []
+        for row in df_display.itertuples(index=False, name=None):
+            valores = []
+            for col_name, v in zip(df_display.columns, row):
+                if col_name in ['DEBITO', 'CREDITO', 'VALOR_BASE']:
+                    if pd.isna(v) or v is None:
+                        valores.append('null')
+                    else:
+                        # Ya viene en pesos enteros
+                        valores.append(str(int(v)))
+                elif col_name in ['H', 'FACTURAS']:
+                    if pd.isna(v) or v is None or v == '':
+                        valores.append('null')
+                    else:
+                        valores.append(str(int(v)))
                 else:
-                    obs = f"Venta {idx+1}"
-                
-                if total == 0 and iva == 0:
+                    if pd.isna(v) or v == '':
+                        valores.append('null')
+                    else:
+                        valores.append(f'"{str(v)}"')
+            filas.append(f"    {{ {', '.join(valores)} }}")
+        
+        datos = ",\n".join(filas)
+        headers = ", ".join([f'"{col}"' for col in df_display.columns])
+        
+        codigo_m = f"""let
+    Origen = #table(
+        {{ {headers} }},
+        {{
+{datos}
+        }}
+    ),
+    TipoCambiado = Table.TransformColumnTypes(Origen,{{
+        {{"CUENTA", type text}}, 
+        {{"CC", type text}}, 
+        {{"OBSERVACIONES", type text}}, 
+        {{"DEBITO", Int64.Type}}, 
+        {{"CREDITO", Int64.Type}}, 
+        {{"VALOR_BASE", Int64.Type}},
+        {{"TERCERO", type text}}, 
+        {{"H", Int64.Type}}
+    }}),
+    Limpieza = Table.ReplaceValue(TipoCambiado,null,null,Replacer.ReplaceValue,
+        {{"DEBITO", "CREDITO", "H", "VALOR_BASE"}}),
+    Filtrado = Table.SelectRows(Limpieza, each ([CUENTA] <> null))
+in
+    Filtrado"""
+        return codigo_m
+
+    def tipo_por_nombre(self, nombre_archivo):
+        """Sugiere el tipo por el nombre del archivo: Recibidos → compras, Enviados → ventas"""
+        nombre_lower = Path(nombre_archivo).name.lower()
+        if 'recibido' in nombre_lower:
+            return 'compras'
+        elif 'enviado' in nombre_lower:
+            return 'ventas'
+        return None
+    
+    def detectar_tipo(self, df):
+        """Detecta compras/ventas por las columnas del archivo. Devuelve (tipo, motivo)"""
+        columnas_str = ' '.join([str(c).upper() for c in df.columns])
+        if 'NIT EMISOR' in columnas_str:
+            return "compras", "Tipo detectado: Compras (por NIT Emisor)"
+        elif 'NIT RECEPTOR' in columnas_str:
+            return "ventas", "Tipo detectado: Ventas (por NIT Receptor)"
+        return "compras", "Tipo por defecto: Compras"
+
+    def convertir(self, ruta_archivo, tipo='auto', consolidar=False, por_periodo=False):
+        """
+        Conversión completa sin interfaz: lee el archivo, detecta el tipo,
+        genera los asientos, los valida y (opcionalmente) los consolida.
+        Devuelve un diccionario con tipo, facturas, resultado, validación y resumen por tercero.
+        Las facturas no se registran en el índice: ver registrar_facturas.
+        """
+        df = self.leer_archivo_dian(ruta_archivo)
+        if len(df) == 0 and self.duplicados is not None and len(self.duplicados):
+            raise Exception("Todas las facturas del archivo ya fueron procesadas antes.")
+        if len(df) == 0:
+            raise Exception("No se encontraron facturas en el archivo.")
+        
+        if tipo == 'auto':
+            tipo, motivo = self.detectar_tipo(df)
+            print(motivo)
+        
+        if tipo == 'compras':
+            df_resultado = self.procesar_compras(df)
+        else:
+            df_resultado = self.procesar_ventas(df)
+        if len(df_resultado) == 0:
+            raise Exception("No se generaron registros. Verifica que las facturas tengan valores en Total e IVA.")
+        
+        reporte = self.validar_asientos(df, df_resultado, tipo)
+        if consolidar:
+            df_resultado = self.consolidar_registros(df_resultado, por_periodo=por_periodo)
+        
+        return {'tipo': tipo, 'facturas': df, 'n_facturas': len(df), 'resultado': df_resultado, 'validacion': reporte,
+                'resumen': self.resumen, 'huellas': self.huellas_leidas}
+    
+    def _bloques_dian(self, ruta_archivo, tamano_bloque, saltar=0):
+        """
+        Genera el archivo DIAN en bloques de `tamano_bloque` filas sin cargarlo completo:
+        DataFrames de texto con los encabezados detectados, 'Hoja Origen' e índice = número
+        de fila de datos en el archivo (igual que en la lectura completa).
+        `saltar`: filas de datos ya convertidas (al reanudar); se descartan sin armar DataFrames
+        y los bloques siguientes quedan iguales a los de una lectura desde el principio.
+        - CSV (y .csv.gz): lector por bloques de pandas
+        - .xlsx/.xlsm: openpyxl en modo solo lectura, fila a fila y hoja por hoja
+        - Otros formatos: se leen completos y se entregan en bloques
+        """
+        extension = extension_datos(ruta_archivo)
+        if extension in MOTORES_LECTURA['csv']['extensiones']:
+            crudo = pd.read_csv(ruta_archivo, encoding='utf-8-sig', dtype=str, header=None, nrows=10)
+            filas = [idx for idx, row in crudo.iterrows() if _es_fila_encabezado(row)]
+            if not filas:
+                # Usar la primera fila no vacía como encabezado
+                filas = list(crudo.dropna(how='all').index[:1])
+            if not filas:
+                return
+            encabezado = filas[0]
+            lector = pd.read_csv(ruta_archivo, encoding='utf-8-sig', dtype=str, header=0, chunksize=tamano_bloque,
+                                 skiprows=(lambda i: i < encabezado or encabezado < i <= encabezado + saltar)
+                                 if saltar else encabezado)
+            posicion = saltar
+            for bloque in lector:
+                bloque.columns = [str(col).strip() for col in bloque.columns]
+                bloque.index = pd.RangeIndex(posicion, posicion + len(bloque))
+                bloque['Hoja Origen'] = Path(ruta_archivo).name
+                posicion += len(bloque)
+                yield bloque
+        elif extension in MOTORES_LECTURA['openpyxl']['extensiones'] and motor_disponible('openpyxl'):
+            yield from self._bloques_excel(ruta_archivo, tamano_bloque, saltar)
+        else:
+            df = self._leer_crudo(ruta_archivo)
+            for inicio in range(saltar, len(df), tamano_bloque):
+                yield df.iloc[inicio:inicio + tamano_bloque]
+    
+    def _bloques_excel(self, ruta_archivo, tamano_bloque, saltar=0):
+        """
+        Bloques de un libro .xlsx leído fila a fila (mismas reglas de encabezado y continuación de hojas).
+        Las primeras `saltar` filas de datos se recorren sin convertirlas.
+        """
+        from openpyxl import load_workbook
+        
+        libro = load_workbook(ruta_archivo, read_only=True, data_only=True)
+        try:
+            hojas = libro.sheetnames
+            columnas_referencia = None
+            posicion = 0
+            for hoja in hojas:
+                filas = libro[hoja].iter_rows(values_only=True)
+                inicio = list(itertools.islice(filas, 10))
+                no_vacias = [idx for idx, fila in enumerate(inicio) if any(c is not None for c in fila)]
+                if not no_vacias:
+                    print(f"Hoja '{hoja}' vacía, se ignora")
                     continue
+                encabezado = next((idx for idx, fila in enumerate(inicio) if _es_fila_encabezado(fila)), None)
+                if encabezado is None and columnas_referencia is not None and len(inicio[0]) == len(columnas_referencia):
+                    print(f"Hoja '{hoja}' sin encabezado: se toma como continuación")
+                    columnas, datos = columnas_referencia, itertools.chain(inicio, filas)
+                else:
+                    if encabezado is None and len(hojas) > 1:
+                        print(f"Hoja '{hoja}' sin encabezados reconocibles, se ignora")
+                        continue
+                    if encabezado is None:
+                        # Usar la primera fila no vacía como encabezado
+                        encabezado = no_vacias[0]
+                    columnas = [f"Unnamed: {i}" if celda is None else str(celda).strip()
+                                for i, celda in enumerate(inicio[encabezado])]
+                    columnas_referencia = columnas
+                    datos = itertools.chain(inicio[encabezado + 1:], filas)
                 
-                # Calcular valores
-                valor_sin_iva = total - iva
-                base_iva = iva / self.IVA_RATE if iva > 0 else 0
-                
-                # DEBUG: Mostrar cálculo
-                if idx < 3:
-                    print(f"   Valor sin IVA: {valor_sin_iva:,.2f}")
-                    print(f"   Base IVA: {base_iva:,.2f}")
-                
-                # Redondear todos los valores al peso más cercano
-                valor_sin_iva_entero = self.redondear_peso(valor_sin_iva)
-                iva_entero = self.redondear_peso(iva)
-                base_iva_entero = self.redondear_peso(base_iva)
-                total_entero = self.redondear_peso(total)
-                
-                # DEBUG: Mostrar valores redondeados
-                if idx < 3:
-                    print(f"   Redondeados:")
-                    print(f"   - Valor sin IVA: {valor_sin_iva_entero:,}")
-                    print(f"   - IVA: {iva_entero:,}")
-                    print(f"   - Base IVA: {base_iva_entero:,}")
-                    print(f"   - Total: {total_entero:,}")
-                
-                # Fila 1: Ingresos (Crédito) - Cuenta 41 - VALORES ENTEROS
-                registros.append({
-                    'CUENTA': self.CUENTAS_VENTAS['ingresos'],
-                    'CC': '',
-                    'OBSERVACIONES': obs,
-                    'DEBITO': None,
-                    'CREDITO': valor_sin_iva_entero,
-                    'VALOR_BASE': None,
-                    'TERCERO': nit,
-                    'H': None
-                })
-                
-                # Fila 2: IVA Generado (Crédito) - Cuenta 24080101 - VALORES ENTEROS
-                if iva > 0:
-                    registros.append({
-                        'CUENTA': self.CUENTAS_VENTAS['iva_generado'],
-                        'CC': '',
-                        'OBSERVACIONES': obs,
-                        'DEBITO': None,
-                        'CREDITO': iva_entero,
-                        'VALOR_BASE': base_iva_entero,
-                        'TERCERO': nit,
-                        'H': 1
-                    })
-                    
-                    # Fila 3: IVA Débito - Cuenta 13050501 - VALORES ENTEROS
-                    registros.append({
-                        'CUENTA': self.CUENTAS_VENTAS['iva_credito'],
-                        'CC': '',
-                        'OBSERVACIONES': obs,
-                        'DEBITO': total_entero,  # Total factura (Base + IVA)
-                        'CREDITO': None,
-                        'VALOR_BASE': None,
-                        'TERCERO': nit,
-                        'H': None
-                    })
-                    
-            except Exception as e:
-                print(f"❌ Error procesando fila {idx}: {e}")
-                print(f"   Total: {row.get('Total', 'N/A')}")
-                print(f"   IVA: {row.get('IVA', 'N/A')}")
-                traceback.print_exc()
-                continue
+                ancho = len(columnas)
+                if saltar:
+                    # Descartar las filas ya convertidas (hojas completas o el inicio de esta)
+                    omitidas = sum(1 for _ in itertools.islice(datos, saltar))
+                    saltar -= omitidas
+                    posicion += omitidas
+                    if saltar:
+                        continue
+                while True:
+                    lote = [[_celda_texto(celda) for celda in fila[:ancho]] + [None] * (ancho - len(fila))
+                            for fila in itertools.islice(datos, tamano_bloque)]
+                    if not lote:
+                        break
+                    bloque = pd.DataFrame(lote, columns=columnas,
+                                          index=pd.RangeIndex(posicion, posicion + len(lote)))
+                    bloque['Hoja Origen'] = hoja
+                    posicion += len(lote)
+                    yield bloque
+        finally:
+            libro.close()
+    
+    def estimar_archivo(self, ruta_archivo):
+        """
+        Sondeo rápido del tamaño de los datos, sin leer el archivo completo:
+        - CSV: longitud promedio de línea en la primera muestra (y tamaño sin comprimir de un .gz)
+        - .xlsx/.xlsm: rango <dimension> declarado al inicio de cada hoja
+        - Otros formatos: aproximación por tamaño de archivo
+        Devuelve {'formato', 'tamano', 'filas', 'columnas', 'metodo'}.
+        """
+        extension = extension_datos(ruta_archivo)
+        tamano = os.path.getsize(ruta_archivo)
+        muestra_bytes = 1024 * 1024
         
-        print(f"\n✅ Registros generados: {len(registros)}")
-        return pd.DataFrame(registros)
+        if extension in MOTORES_LECTURA['csv']['extensiones']:
+            comprimido = Path(ruta_archivo).suffix.lower() == '.gz'
+            with (gzip.open(ruta_archivo, 'rb') if comprimido else open(ruta_archivo, 'rb')) as f:
+                muestra = f.read(muestra_bytes)
+            lineas = muestra.count(b'\n') or 1
+            sin_comprimir = tamano
+            if comprimido:
+                # El trailer de gzip guarda el tamaño sin comprimir (módulo 4 GB)
+                with open(ruta_archivo, 'rb') as f:
+                    f.seek(-4, os.SEEK_END)
+                    sin_comprimir = int.from_bytes(f.read(4), 'little')
+                if sin_comprimir < tamano:
+                    sin_comprimir = tamano * 8
+            if len(muestra) < muestra_bytes:
+                filas, metodo = lineas, 'conteo exacto'
+            else:
+                filas, metodo = int(sin_comprimir / (len(muestra) / lineas)), 'muestra de 1 MB'
+            encabezado = pd.read_csv(io.BytesIO(muestra), encoding='utf-8-sig', dtype=str, header=None,
+                                     nrows=10, on_bad_lines='skip')
+            return {'formato': 'csv', 'tamano': tamano, 'filas': filas,
+                    'columnas': encabezado.shape[1], 'metodo': metodo}
+        
+        if extension in ('.xlsx', '.xlsm') and zipfile.is_zipfile(ruta_archivo):
+            filas = columnas = 0
+            with zipfile.ZipFile(ruta_archivo) as libro:
+                hojas = [info for info in libro.infolist()
+                         if info.filename.startswith('xl/worksheets/') and info.filename.endswith('.xml')]
+                for info in hojas:
+                    with libro.open(info) as hoja:
+                        inicio = hoja.read(4096).decode('utf-8', errors='ignore')
+                    rango = re.search(r'<dimension ref="[A-Z]+(\d+)(?::([A-Z]+)(\d+))?"', inicio)
+                    if rango and rango.group(3):
+                        filas += int(rango.group(3)) - int(rango.group(1)) + 1
+                        letras = rango.group(2)
+                        columnas = max(columnas, sum((ord(c) - 64) * 26 ** i for i, c in enumerate(reversed(letras))))
+                    else:
+                        # Sin dimensión declarada: ~60 bytes de XML por celda, 20 columnas
+                        filas += info.file_size // (60 * 20)
+                        columnas = max(columnas, 20)
+            return {'formato': 'excel', 'tamano': tamano, 'filas': filas, 'columnas': columnas or 20,
+                    'metodo': 'dimensión de las hojas'}
+        
+        # .xls, .xlsb, .ods, .zip: ~40 bytes comprimidos por fila de 20 columnas
+        formato = 'csv' if extension == '.zip' else 'excel'
+        return {'formato': formato, 'tamano': tamano, 'filas': tamano // 40, 'columnas': 20,
+                'metodo': 'aproximación por tamaño'}
+    
+    def planificar_conversion(self, ruta_archivo, presupuesto=None):
+        """
+        Decide entre la conversión en memoria y la conversión por bloques según la memoria
+        estimada y el presupuesto (bytes; por defecto self.presupuesto_memoria o FRACCION_MEMORIA
+        de la RAM física). Devuelve el plan con sus estimaciones y el motivo de la decisión.
+        """
+        presupuesto = presupuesto or self.presupuesto_memoria or presupuesto_memoria()
+        estimacion = self.estimar_archivo(ruta_archivo)
+        por_fila = estimacion['columnas'] * self.BYTES_POR_CELDA[estimacion['formato']]
+        resultado = int(estimacion['filas'] * self.LINEAS_POR_FACTURA * self.BYTES_POR_LINEA)
+        en_memoria = estimacion['filas'] * por_fila + resultado
+        
+        advertencia = None
+        if en_memoria <= presupuesto:
+            modo, tamano_bloque = 'memoria', None
+            motivo = "cabe en el presupuesto"
+        elif extension_datos(ruta_archivo) not in (MOTORES_LECTURA['csv']['extensiones'] + ['.xlsx', '.xlsm']):
+            # .xls, .xlsb, .ods y .zip solo se leen completos: por bloques costaría lo mismo más los puntos de control
+            modo, tamano_bloque = 'memoria', None
+            motivo = "excede el presupuesto"
+            advertencia = (f"El archivo necesitaría ~{en_memoria / 1024 ** 2:,.0f} MB y el presupuesto es de "
+                           f"{presupuesto / 1024 ** 2:,.0f} MB, pero su formato no se puede leer por bloques: "
+                           f"se convierte en memoria. Guárdalo como .xlsx o .csv para convertirlo por bloques.")
+        else:
+            modo = 'bloques'
+            # Bloques tan grandes como permita lo que queda del presupuesto tras el resultado
+            disponible = max(presupuesto - resultado, 0)
+            tamano_bloque = int(min(self.TAMANO_BLOQUE, max(self.TAMANO_BLOQUE_MINIMO, disponible // por_fila)))
+            motivo = "excede el presupuesto"
+            if resultado > presupuesto:
+                motivo += " (⚠️ el resultado final por sí solo podría no caber en memoria)"
+        en_bloques = (tamano_bloque or 0) * por_fila + resultado
+        
+        plan = {**estimacion, 'modo': modo, 'tamano_bloque': tamano_bloque, 'presupuesto': presupuesto,
+                'memoria_en_memoria': en_memoria, 'memoria_en_bloques': en_bloques, 'motivo': motivo,
+                'advertencia': advertencia}
+        mb = 1024 * 1024
+        plan['mensaje'] = (
+            f"Plan: {estimacion['tamano'] / mb:,.1f} MB, ~{estimacion['filas']:,} filas × "
+            f"{estimacion['columnas']} columnas ({estimacion['metodo']}); memoria estimada "
+            f"{en_memoria / mb:,.0f} MB de {presupuesto / mb:,.0f} MB → {motivo}: "
+            + ("conversión en memoria" if modo == 'memoria' else
+               f"conversión por bloques de {tamano_bloque:,} filas (~{en_bloques / mb:,.0f} MB)"))
+        print(f"🧮 {plan['mensaje']}")
+        if advertencia:
+            print(f"⚠️ {advertencia}")
+        return plan
+    
+    def _carpeta_avance(self, ruta_archivo):
+        """Carpeta de puntos de control de un archivo (una por ruta absoluta)"""
+        clave = hashlib.sha1(str(Path(ruta_archivo).resolve()).encode('utf-8')).hexdigest()[:16]
+        return CARPETA_AVANCE / clave
+    
+    def _firma_conversion(self, ruta_archivo, tipo, tamano_bloque):
+        """Datos que deben coincidir para reanudar: archivo (tamaño y fecha), tipo, bloque y reglas contables"""
+        estado = os.stat(ruta_archivo)
+        return {
+            'archivo': str(Path(ruta_archivo).resolve()),
+            'tamano': estado.st_size,
+            'modificado': estado.st_mtime,
+            'tipo': tipo,
+            'tamano_bloque': tamano_bloque,
+            'iva': self.IVA_RATE,
+            'cuentas_compras': self.CUENTAS_COMPRAS,
+            'cuentas_ventas': self.CUENTAS_VENTAS,
+            'duplicados': None if self.indice_facturas is None else self.excluir_duplicados,
+        }
+    
+    def avance_pendiente(self, ruta_archivo, tipo='auto', tamano_bloque=None):
+        """
+        Estado guardado de una conversión por bloques interrumpida de este archivo (None si no hay
+        uno válido). Sin tamano_bloque se acepta el tamaño de bloque con el que se empezó.
+        """
+        ruta_estado = self._carpeta_avance(ruta_archivo) / 'estado.json'
+        if not ruta_estado.exists():
+            return None
+        try:
+            with open(ruta_estado, encoding='utf-8') as f:
+                estado = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if tamano_bloque is None:
+            tamano_bloque = (estado.get('firma') or {}).get('tamano_bloque')
+        firma = self._firma_conversion(ruta_archivo, tipo, tamano_bloque)
+        return estado if estado.get('firma') == firma else None
+    
+    def _guardar_avance(self, carpeta, numero, datos_bloque, estado):
+        """Guarda el bloque terminado y luego el estado, ambos con escritura atómica"""
+        ruta_bloque = carpeta / f"bloque_{numero:05d}.pkl"
+        temporal = ruta_bloque.with_suffix('.tmp')
+        pd.to_pickle(datos_bloque, temporal)
+        os.replace(temporal, ruta_bloque)
+        
+        ruta_estado = carpeta / 'estado.json'
+        temporal = ruta_estado.with_suffix('.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, ruta_estado)
+    
+    def combinar_validaciones(self, reportes):
+        """Une los reportes de validación de varios bloques en uno solo (totales sumados)"""
+        por_factura = pd.concat([r['por_factura'] for r in reportes], ignore_index=True)
+        descuadradas = pd.concat([r['descuadradas'] for r in reportes], ignore_index=True)
+        anomalias = pd.concat([r['anomalias'] for r in reportes], ignore_index=True)
+        total_debito = sum(r['totales']['debito'] for r in reportes)
+        total_credito = sum(r['totales']['credito'] for r in reportes)
+        total_contrapartida = sum(r['totales']['contrapartida'] for r in reportes)
+        return {
+            'cuadrado': len(descuadradas) == 0,
+            'totales': {
+                'facturas': len(por_factura),
+                'debito': total_debito,
+                'credito': total_credito,
+                'contrapartida': total_contrapartida,
+                'diferencia': total_debito - total_credito - total_contrapartida,
+                'descuadradas': len(descuadradas),
+                'anomalias': len(anomalias),
+            },
+            'por_factura': por_factura,
+            'descuadradas': descuadradas,
+            'anomalias': anomalias,
+        }
+    
+    def convertir_por_bloques(self, ruta_archivo, tipo='auto', consolidar=False, por_periodo=False,
+                              tamano_bloque=None, reanudar=True, progreso=None):
+        """
+        Conversión por bloques con puntos de control, para archivos grandes:
+        - Lee el archivo en bloques de `tamano_bloque` filas, sin cargarlo completo
+        - Tras cada bloque guarda sus asientos y su validación, y el estado: filas consumidas,
+          bloques terminados, tipo y mapeo de columnas detectado en el primer bloque
+        - Si se interrumpe, la siguiente llamada (reanudar=True) continúa desde el último
+          bloque terminado, con su mismo tamaño de bloque; el resultado es idéntico al de
+          una conversión sin interrupciones
+        - progreso(filas_consumidas, bloques) se llama tras cada bloque
+        Devuelve el mismo diccionario que convertir() ('facturas' es None: no se conservan en memoria).
+        """
+        carpeta = self._carpeta_avance(ruta_archivo)
+        estado = self.avance_pendiente(ruta_archivo, tipo) if reanudar else None
+        if estado is None:
+            tamano_bloque = tamano_bloque or self.TAMANO_BLOQUE
+            shutil.rmtree(carpeta, ignore_errors=True)
+            carpeta.mkdir(parents=True, exist_ok=True)
+            estado = {'firma': self._firma_conversion(ruta_archivo, tipo, tamano_bloque),
+                      'filas_consumidas': 0, 'bloques': 0, 'tipo': None, 'mapeo': None}
+        else:
+            tamano_bloque = estado['firma']['tamano_bloque']
+            print(f"↻ Reanudando: {estado['bloques']} bloques ({estado['filas_consumidas']} filas) ya convertidos")
+        
+        inicio = time.perf_counter()
+        huellas_vistas = [pd.read_pickle(carpeta / f"bloque_{numero:05d}.pkl")['huellas']
+                          for numero in range(estado['bloques'])]
+        
+        # Al reanudar, el lector salta directamente las filas ya convertidas
+        bloques_archivo = self._bloques_dian(ruta_archivo, tamano_bloque, saltar=estado['filas_consumidas'])
+        for numero, bloque in enumerate(bloques_archivo, start=estado['bloques']):
+            if estado['mapeo'] is None:
+                estado['mapeo'] = self.detectar_columnas(bloque)
+                estado['tipo'] = tipo
+                if tipo == 'auto':
+                    estado['tipo'], motivo = self.detectar_tipo(bloque.rename(columns=estado['mapeo']['columnas']))
+                    print(motivo)
+            
+            df = self.normalizar_facturas(bloque, estado['mapeo'])
+            huellas = np.empty(0, dtype=np.uint64)
+            self.duplicados = None
+            if self.indice_facturas is not None:
+                vistas = np.concatenate(huellas_vistas) if huellas_vistas else None
+                df = self.revisar_duplicados(df, vistas=vistas)
+                huellas = self.huellas_leidas
+            huellas_vistas.append(huellas)
+            
+            self.resumen = None
+            if len(df):
+                if estado['tipo'] == 'compras':
+                    resultado = self.procesar_compras(df)
+                else:
+                    resultado = self.procesar_ventas(df)
+            else:
+                resultado = pd.DataFrame(columns=self.COLUMNAS_SIIGO + self.COLUMNAS_INTERNAS)
+                self.filas_omitidas = []
+            # Siempre: un bloque sin asientos puede traer duplicadas o filas omitidas que reportar
+            validacion = self.validar_asientos(df, resultado, estado['tipo'])
+            
+            estado['bloques'] = numero + 1
+            estado['filas_consumidas'] += len(bloque)
+            self._guardar_avance(carpeta, numero, {
+                'resultado': resultado,
+                'validacion': validacion,
+                'facturas': len(df),
+                'duplicados': len(self.duplicados) if self.duplicados is not None else 0,
+                'huellas': huellas,
+                'resumen': self.resumen,
+            }, estado)
+            print(f"💾 Bloque {numero + 1}: {estado['filas_consumidas']} filas consumidas")
+            if progreso:
+                progreso(estado['filas_consumidas'], estado['bloques'])
+        
+        # Unir los bloques guardados (los de esta ejecución y los de ejecuciones anteriores)
+        bloques = [pd.read_pickle(carpeta / f"bloque_{numero:05d}.pkl") for numero in range(estado['bloques'])]
+        n_facturas = sum(b['facturas'] for b in bloques)
+        resultados = [b['resultado'] for b in bloques if len(b['resultado'])]
+        if n_facturas == 0 and sum(b.get('duplicados', 0) for b in bloques):
+            raise Exception("Todas las facturas del archivo ya fueron procesadas antes.")
+        if n_facturas == 0:
+            raise Exception("No se encontraron facturas en el archivo.")
+        if not resultados:
+            raise Exception("No se generaron registros. Verifica que las facturas tengan valores en Total e IVA.")
+        df_resultado = pd.concat(resultados, ignore_index=True)
+        reporte = self.combinar_validaciones([b['validacion'] for b in bloques if b['validacion'] is not None])
+        self.resumen = self.combinar_resumenes([b['resumen'] for b in bloques if b['resumen'] is not None])
+        if consolidar:
+            df_resultado = self.consolidar_registros(df_resultado, por_periodo=por_periodo)
+        
+        if self.indice_facturas is not None:
+            self.huellas_leidas = np.concatenate([b['huellas'] for b in bloques])
+        shutil.rmtree(carpeta, ignore_errors=True)
+        
+        segundos = time.perf_counter() - inicio
+        self.ultima_lectura = {'motor': 'por bloques', 'segundos': segundos}
+        print(f"✅ Conversión por bloques: {estado['bloques']} bloques, {estado['filas_consumidas']} filas "
+              f"({segundos:.2f} s)")
+        return {'tipo': estado['tipo'], 'facturas': None, 'n_facturas': n_facturas,
+                'resultado': df_resultado, 'validacion': reporte, 'resumen': self.resumen,
+                'huellas': self.huellas_leidas}
+    
+    def guardar_salidas(self, df_resultado, carpeta, nombre_base, formatos=('xlsx', 'csv', 'm')):
+        """
+        Escribe las salidas para Siigo en `carpeta`: Excel (.xlsx), CSV (;) y código Power Query (.m).
+        Devuelve {formato: ruta}.
+        """
+        carpeta = Path(carpeta)
+        columnas = self.columnas_exportables(df_resultado)
+        rutas = {}
+        
+        if 'xlsx' in formatos:
+            rutas['xlsx'] = carpeta / f"{nombre_base}.xlsx"
+            if len(df_resultado) > self.MAX_FILAS_HOJA:
+                self.exportar_particiones(df_resultado, rutas['xlsx'], por_periodo=False, en_hojas=True)
+            else:
+                escribir_libro_siigo(rutas['xlsx'], [('Siigo', df_resultado[columnas])])
+        if 'csv' in formatos:
+            rutas['csv'] = carpeta / f"{nombre_base}.csv"
+            df_resultado[columnas].to_csv(rutas['csv'], index=False, sep=';', encoding='utf-8-sig')
+        if 'm' in formatos:
+            rutas['m'] = carpeta / f"{nombre_base}.m"
+            rutas['m'].write_text(self.generar_codigo_m(df_resultado), encoding='utf-8')
+        return rutas
+    
+    def cuentas_no_puc(self, df_resultado):
+        """Cuentas del resultado que no son un código PUC (solo dígitos), p. ej. '14, 51, 61'"""
+        return sorted({c for c in df_resultado['CUENTA'].astype(str).unique() if not c.isdigit()})
+    
+    def descuadre_por_documento(self, df_resultado):
+        """Débitos - créditos de las líneas de cada DOCUMENTO (0 si la factura cuadra)"""
+        return (pd.to_numeric(df_resultado['DEBITO'], errors='coerce').fillna(0)
+                - pd.to_numeric(df_resultado['CREDITO'], errors='coerce').fillna(0)
+                ).groupby(df_resultado['DOCUMENTO'], sort=False).sum().round()
+    
+    def construir_comprobantes(self, df_resultado, id_documento, centro_costo=None, cuenta_contrapartida=None,
+                               cuentas=None):
+        """
+        Arma un comprobante contable de Siigo (POST /v1/journals) por factura (DOCUMENTO: CUFE o
+        NIT emisor + prefijo + folio, así facturas de proveedores distintos con el mismo folio no
+        se unen). Cada comprobante lleva una Idempotency-Key derivada del contenido de la factura,
+        así reenviar el mismo archivo no duplica comprobantes.
+        La API solo acepta códigos PUC: `cuentas` ({cuenta del resultado: código}) reemplaza las
+        que no lo son (p. ej. la cuenta de gasto por defecto '14, 51, 61'); si queda alguna, no se
+        arma ningún comprobante.
+        Siigo rechaza comprobantes descuadrados: las facturas cuyos débitos no igualan sus créditos
+        (p. ej. compras, que no llevan la línea de proveedores) se cuadran con una línea por la
+        diferencia en `cuenta_contrapartida`; sin ella no se arma ningún comprobante.
+        Requiere el detalle por factura (no sirve con el resultado consolidado).
+        """
+        if 'DOCUMENTO' not in df_resultado.columns:
+            raise Exception("El envío a Siigo requiere el detalle por factura (desactiva la consolidación)")
+        
+        if cuentas:
+            df_resultado = df_resultado.assign(
+                CUENTA=df_resultado['CUENTA'].astype(str).replace({c: str(v).strip() for c, v in cuentas.items()}))
+        cuentas_invalidas = self.cuentas_no_puc(df_resultado)
+        if cuenta_contrapartida is not None:
+            cuenta_contrapartida = str(cuenta_contrapartida).strip()
+            if not cuenta_contrapartida.isdigit():
+                cuentas_invalidas.append(cuenta_contrapartida)
+        if cuentas_invalidas:
+            raise Exception(f"La API de Siigo solo acepta códigos PUC (solo dígitos) y estas cuentas no lo son: "
+                            f"{', '.join(repr(c) for c in cuentas_invalidas)}. "
+                            f"Indica una cuenta específica (p. ej. 51350501) en lugar de '{cuentas_invalidas[0]}'")
+        
+        diferencias = self.descuadre_por_documento(df_resultado)
+        descuadradas = diferencias[diferencias != 0]
+        if len(descuadradas) and cuenta_contrapartida is None:
+            raise Exception(f"{len(descuadradas)} facturas no cuadran (débitos ≠ créditos) y Siigo las "
+                            f"rechazaría (p. ej. {', '.join(map(str, descuadradas.index[:3]))}). "
+                            f"Indica una cuenta de contrapartida para cuadrarlas")
+        
+        hoy = datetime.now().strftime('%Y-%m-%d')
+        comprobantes = []
+        for documento, lineas in df_resultado.groupby('DOCUMENTO', sort=False):
+            items = []
+            for linea in lineas.itertuples(index=False):
+                es_debito = pd.notna(linea.DEBITO)
+                item = {
+                    'account': {'code': str(linea.CUENTA), 'movement': 'Debit' if es_debito else 'Credit'},
+                    'customer': {'identification': linea.TERCERO, 'branch_office': 0},
+                    'description': linea.OBSERVACIONES,
+                    'value': int(linea.DEBITO if es_debito else linea.CREDITO),
+                }
+                if centro_costo:
+                    item['cost_center'] = centro_costo
+                items.append(item)
+            
+            diferencia = int(round(diferencias[documento]))
+            if diferencia != 0:
+                item = {
+                    'account': {'code': cuenta_contrapartida, 'movement': 'Credit' if diferencia > 0 else 'Debit'},
+                    'customer': {'identification': lineas['TERCERO'].iloc[0], 'branch_office': 0},
+                    'description': lineas['OBSERVACIONES'].iloc[0],
+                    'value': abs(diferencia),
+                }
+                if centro_costo:
+                    item['cost_center'] = centro_costo
+                items.append(item)
+            
+            fecha = lineas['FECHA'].iloc[0]
+            huella = json.dumps([documento, items], sort_keys=True, ensure_ascii=False)
+            comprobantes.append({
+                'documento': documento,
+                'idempotency_key': hashlib.sha256(huella.encode('utf-8')).hexdigest()[:32],
+                'cuerpo': {
+                    'document': {'id': int(id_documento)},
+                    'date': fecha.strftime('%Y-%m-%d') if pd.notna(fecha) else hoy,
+                    'items': items,
+                    'observations': f"DIAN {documento}",
+                },
+            })
+        return comprobantes
+    
+    def particionar_resultado(self, df_resultado, por_periodo=True, max_filas=None):
+        """
+        Divide el resultado en particiones (nombre, DataFrame):
+        - Por mes de emisión (AAAA-MM), a partir de la columna FECHA
+        - Por máximo de filas (por defecto el límite de filas de una hoja de Excel),
+          cortando solo entre documentos
+        """
+        max_filas = min(max_filas or self.MAX_FILAS_HOJA, self.MAX_FILAS_HOJA)
+        
+        if por_periodo and 'FECHA' in df_resultado.columns:
+            periodos = pd.to_datetime(df_resultado['FECHA'], errors='coerce').dt.strftime('%Y-%m')
+            grupos = df_resultado.groupby(periodos.fillna('Sin fecha'), sort=True)
+        else:
+            grupos = [('Siigo', df_resultado)]
+        
+        particiones = []
+        for nombre, grupo in grupos:
+            cortes = self._cortes_por_documento(grupo, max_filas)
+            partes = list(zip(cortes[:-1], cortes[1:]))
+            for num, (inicio, fin) in enumerate(partes, start=1):
+                sufijo = f"_parte{num}" if len(partes) > 1 else ''
+                particiones.append((f"{nombre}{sufijo}", grupo.iloc[inicio:fin]))
+        return particiones
+    
+    def _cortes_por_documento(self, grupo, max_filas):
+        """
+        Posiciones donde cortar `grupo` en partes de hasta max_filas filas sin separar
+        las líneas de un mismo DOCUMENTO. Solo un documento con más de max_filas líneas
+        se corta por dentro. Sin columna DOCUMENTO se corta cada max_filas filas.
+        """
+        if len(grupo) == 0:
+            return [0, 0]
+        if 'DOCUMENTO' not in grupo.columns:
+            return list(range(0, len(grupo), max_filas)) + [len(grupo)]
+        codigos = pd.factorize(grupo['DOCUMENTO'])[0]
+        inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+        cortes = [0]
+        while len(grupo) - cortes[-1] > max_filas:
+            limite = cortes[-1] + max_filas
+            # Último documento que empieza dentro del límite
+            siguiente = inicios[np.searchsorted(inicios, limite, side='right') - 1]
+            cortes.append(int(siguiente) if siguiente > cortes[-1] else limite)
+        cortes.append(len(grupo))
+        return cortes
+    
+    def exportar_particiones(self, df_resultado, ruta_archivo, por_periodo=True, max_filas=None, en_hojas=False):
+        """
+        Exporta el resultado particionado (ver particionar_resultado):
+        - en_hojas=False: un libro por partición (<nombre>_<partición>.xlsx), escritos en paralelo
+        - en_hojas=True: una hoja por partición dentro de `ruta_archivo`
+        Escribe además <nombre>_manifiesto.csv con los totales de cada partición
+        y lo devuelve como DataFrame.
+        """
+        ruta = Path(ruta_archivo)
+        columnas = self.columnas_exportables(df_resultado)
+        particiones = self.particionar_resultado(df_resultado, por_periodo, max_filas)
+        
+        manifiesto = []
+        for nombre, parte in particiones:
+            manifiesto.append({
+                'PARTICION': nombre,
+                'ARCHIVO': ruta.name if en_hojas else f"{ruta.stem}_{nombre}{ruta.suffix}",
+                'HOJA': nombre if en_hojas else 'Siigo',
+                'FILAS': len(parte),
+                'DEBITO': pd.to_numeric(parte['DEBITO'], errors='coerce').sum(),
+                'CREDITO': pd.to_numeric(parte['CREDITO'], errors='coerce').sum(),
+                # En resultados consolidados no hay detalle por factura
+                'FACTURAS': parte['DOCUMENTO'].nunique() if 'DOCUMENTO' in parte.columns else None,
+            })
+        
+        if en_hojas:
+            escribir_libro_siigo(ruta, [(nombre, parte[columnas]) for nombre, parte in particiones])
+        else:
+            rutas = [ruta.with_name(fila['ARCHIVO']) for fila in manifiesto]
+            hojas = [[('Siigo', parte[columnas])] for _, parte in particiones]
+            try:
+                trabajadores = min(len(rutas), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+                    list(pool.map(escribir_libro_siigo, rutas, hojas))
+            except (BrokenProcessPool, OSError) as e:
+                print(f"⚠️ No se pudo usar escritura paralela ({e}), escribiendo en secuencia")
+                list(map(escribir_libro_siigo, rutas, hojas))
+        
+        df_manifiesto = pd.DataFrame(manifiesto)
+        ruta_manifiesto = ruta.with_name(f"{ruta.stem}_manifiesto.csv")
+        df_manifiesto.to_csv(ruta_manifiesto, index=False, sep=';', encoding='utf-8-sig')
+        print(f"✅ {len(particiones)} particiones exportadas, manifiesto: {ruta_manifiesto}")
+        return df_manifiesto
 
 
 class AplicacionDIAN:
     """Interfaz gráfica"""
     
+    SIN_CLIENTE = "(sin cliente)"
+    
     def __init__(self, root):
         self.root = root
         self.root.title("DIAN → Siigo | Conversor Contable v3.1")
@@ -554,10 +2804,34 @@ class AplicacionDIAN:
         self.root.configure(bg=self.COLORES['fondo_principal'])
         
         self.procesador = ProcesadorContableDIAN()
+        try:
+            self.procesador.indice_facturas = IndiceFacturas(ARCHIVO_INDICE_FACTURAS)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo abrir el índice de facturas ({e}), no se revisarán duplicadas")
         self.archivo_actual = None
         self.df_resultado = None
+        self.reporte_validacion = None
+        self.df_facturas = None
+        self.tipo_actual = None
+        self.resumen = None
+        
+        # Espacio de trabajo multi-cliente y su cola de conversiones en segundo plano
+        self.cuentas_base = (dict(self.procesador.CUENTAS_COMPRAS), dict(self.procesador.CUENTAS_VENTAS))
+        self.planificador = None
+        # Proceso para las conversiones por bloques (el resultado llega mapeado en memoria)
+        self.pool_conversion = None
+        limpiar_resultados()
+        try:
+            self.espacio = EspacioTrabajo(ARCHIVO_ESPACIO_TRABAJO)
+        except (OSError, sqlite3.Error) as e:
+            self.espacio = None
+            print(f"⚠️ No se pudo abrir el espacio de trabajo ({e}), la cola no estará disponible")
         
         self.crear_widgets()
+        
+        # Continuar la cola que quedó pendiente en la sesión anterior
+        if self.espacio is not None and self.espacio.pendientes():
+            self.iniciar_planificador()
     
     def crear_widgets(self):
         main_frame = tk.Frame(self.root, bg=self.COLORES['fondo_principal'], padx=30, pady=20)
@@ -600,6 +2874,33 @@ class AplicacionDIAN:
                  activebackground=self.COLORES['boton_accion'],
                  activeforeground='white').pack(side=tk.LEFT)
         
+        # Cliente del espacio de trabajo (cuentas propias) y cola de conversiones
+        frame_cliente = tk.Frame(main_frame, bg=self.COLORES['fondo_principal'])
+        frame_cliente.pack(fill=tk.X)
+        
+        tk.Label(frame_cliente, text="Cliente:", 
+                font=('Helvetica', 11, 'bold'), 
+                bg=self.COLORES['fondo_principal'], 
+                fg=self.COLORES['texto_principal']).pack(side=tk.LEFT)
+        self.cliente_var = tk.StringVar(value=self.SIN_CLIENTE)
+        self.combo_cliente = ttk.Combobox(frame_cliente, textvariable=self.cliente_var,
+                                          state='readonly', width=30, font=('Helvetica', 11))
+        self.combo_cliente.pack(side=tk.LEFT, padx=10)
+        self.combo_cliente.bind('<<ComboboxSelected>>', self.seleccionar_cliente)
+        self.actualizar_clientes()
+        
+        for texto, comando in [("👤 Cliente...", self.editar_cliente), ("🗂 Cola de trabajos", self.ver_cola)]:
+            tk.Button(frame_cliente, text=texto, command=comando,
+                     state=tk.NORMAL if self.espacio is not None else tk.DISABLED,
+                     bg=self.COLORES['boton_secundario'], 
+                     fg=self.COLORES['texto_principal'],
+                     font=('Helvetica', 10, 'bold'),
+                     relief=tk.RAISED, 
+                     padx=12, pady=3,
+                     cursor='hand2',
+                     activebackground=self.COLORES['boton_accion'],
+                     activeforeground='white').pack(side=tk.LEFT, padx=(0, 10))
+        
         # Frame de tipo
         frame_tipo = tk.LabelFrame(main_frame, text=" 2. Tipo de Documento ", 
                                   bg=self.COLORES['fondo_frame'],
@@ -628,8 +2929,36 @@ class AplicacionDIAN:
                           activebackground=self.COLORES['fondo_frame'],
                           activeforeground=self.COLORES['texto_principal']).pack(anchor=tk.W, pady=4)
         
+        # Opciones de salida
+        frame_opciones = tk.Frame(frame_tipo, bg=self.COLORES['fondo_frame'])
+        frame_opciones.pack(anchor=tk.W, pady=(8, 0))
+        
+        self.consolidar_var = tk.BooleanVar(value=False)
+        self.por_periodo_var = tk.BooleanVar(value=False)
+        self.excluir_duplicadas_var = tk.BooleanVar(value=False)
+        
+        for texto, variable in [("📦 Consolidar por tercero y cuenta", self.consolidar_var),
+                                ("📅 Separar por mes de emisión", self.por_periodo_var),
+                                ("🔁 Omitir facturas ya procesadas", self.excluir_duplicadas_var)]:
+            tk.Checkbutton(frame_opciones, text=texto, variable=variable,
+                          bg=self.COLORES['fondo_frame'],
+                          fg=self.COLORES['texto_principal'],
+                          font=('Helvetica', 11),
+                          selectcolor=self.COLORES['boton_principal'],
+                          activebackground=self.COLORES['fondo_frame'],
+                          activeforeground=self.COLORES['texto_principal']).pack(side=tk.LEFT, padx=(0, 15))
+        
+        # Presupuesto de memoria para elegir entre conversión en memoria o por bloques
+        tk.Label(frame_opciones, text="🧮 Memoria (MB):",
+                bg=self.COLORES['fondo_frame'],
+                fg=self.COLORES['texto_principal'],
+                font=('Helvetica', 11)).pack(side=tk.LEFT)
+        self.memoria_var = tk.IntVar(value=presupuesto_memoria() // (1024 * 1024))
+        tk.Spinbox(frame_opciones, from_=256, to=1024 * 1024, increment=256, width=8,
+                  textvariable=self.memoria_var, font=('Helvetica', 11)).pack(side=tk.LEFT, padx=(5, 0))
+        
         # Botón procesar
-        tk.Button(main_frame, text="⚡ PROCESAR ARCHIVO", 
+        self.btn_procesar = tk.Button(main_frame, text="⚡ PROCESAR ARCHIVO", 
                  command=self.procesar_archivo,
                  bg=self.COLORES['boton_accion'], 
                  fg='white',
@@ -638,7 +2967,8 @@ class AplicacionDIAN:
                  padx=40, pady=15,
                  cursor='hand2',
                  activebackground=self.COLORES['boton_exito'],
-                 activeforeground='white').pack(pady=20)
+                 activeforeground='white')
+        self.btn_procesar.pack(pady=20)
         
         # Barra de progreso
         style = ttk.Style()
@@ -671,10 +3001,15 @@ class AplicacionDIAN:
         self.lbl_estado.pack(pady=5)
         
         # Botones
+        # Botones en dos filas (exportar / revisar y enviar) para que quepan en la ventana
         self.frame_botones = tk.Frame(self.frame_resultados, bg=self.COLORES['fondo_frame'])
         self.frame_botones.pack(pady=5)
+        self.fila_exportar = tk.Frame(self.frame_botones, bg=self.COLORES['fondo_frame'])
+        self.fila_exportar.pack()
+        self.fila_revision = tk.Frame(self.frame_botones, bg=self.COLORES['fondo_frame'])
+        self.fila_revision.pack(pady=(8, 0))
         
-        self.btn_ver = tk.Button(self.frame_botones, text="👁 Ver Vista Previa", 
+        self.btn_ver = tk.Button(self.fila_exportar, text="👁 Ver Vista Previa", 
                                 command=self.ver_preview, state=tk.DISABLED,
                                 bg=self.COLORES['boton_peligro'], 
                                 fg='white',
@@ -687,7 +3022,7 @@ class AplicacionDIAN:
                                 disabledforeground='white')
         self.btn_ver.pack(side=tk.LEFT, padx=5)
         
-        self.btn_excel = tk.Button(self.frame_botones, text="💾 Descargar Excel", 
+        self.btn_excel = tk.Button(self.fila_exportar, text="💾 Descargar Excel", 
                                   command=self.guardar_excel, state=tk.DISABLED,
                                   bg=self.COLORES['boton_peligro'], 
                                   fg='white',
@@ -700,7 +3035,7 @@ class AplicacionDIAN:
                                   disabledforeground='white')
         self.btn_excel.pack(side=tk.LEFT, padx=5)
         
-        self.btn_query = tk.Button(self.frame_botones, text="📋 Power Query", 
+        self.btn_query = tk.Button(self.fila_exportar, text="📋 Power Query", 
                                   command=self.mostrar_power_query, state=tk.DISABLED,
                                   bg=self.COLORES['boton_peligro'], 
                                   fg='white',
@@ -713,6 +3048,97 @@ class AplicacionDIAN:
                                   disabledforeground='white')
         self.btn_query.pack(side=tk.LEFT, padx=5)
         
+        self.btn_particion = tk.Button(self.fila_exportar, text="🗂 Exportar por Mes", 
+                                      command=self.exportar_por_mes, state=tk.DISABLED,
+                                      bg=self.COLORES['boton_peligro'], 
+                                      fg='white',
+                                      font=('Helvetica', 11, 'bold'),
+                                      relief=tk.RAISED, 
+                                      padx=15, pady=8,
+                                      cursor='hand2',
+                                      activebackground='#C71585',
+                                      activeforeground='white',
+                                      disabledforeground='white')
+        self.btn_particion.pack(side=tk.LEFT, padx=5)
+        
+        self.btn_plantilla = tk.Button(self.fila_exportar, text="📄 En Plantilla", 
+                                      command=self.exportar_a_plantilla, state=tk.DISABLED,
+                                      bg=self.COLORES['boton_peligro'], 
+                                      fg='white',
+                                      font=('Helvetica', 11, 'bold'),
+                                      relief=tk.RAISED, 
+                                      padx=15, pady=8,
+                                      cursor='hand2',
+                                      activebackground='#C71585',
+                                      activeforeground='white',
+                                      disabledforeground='white')
+        self.btn_plantilla.pack(side=tk.LEFT, padx=5)
+        
+        self.btn_siigo = tk.Button(self.fila_revision, text="☁ Enviar a Siigo", 
+                                  command=self.enviar_a_siigo, state=tk.DISABLED,
+                                  bg=self.COLORES['boton_peligro'], 
+                                  fg='white',
+                                  font=('Helvetica', 11, 'bold'),
+                                  relief=tk.RAISED, 
+                                  padx=15, pady=8,
+                                  cursor='hand2',
+                                  activebackground='#C71585',
+                                  activeforeground='white',
+                                  disabledforeground='white')
+        self.btn_siigo.pack(side=tk.LEFT, padx=5)
+        
+        self.btn_conciliar = tk.Button(self.fila_revision, text="⚖ Conciliar", 
+                                      command=self.conciliar_con_siigo, state=tk.DISABLED,
+                                      bg=self.COLORES['boton_peligro'], 
+                                      fg='white',
+                                      font=('Helvetica', 11, 'bold'),
+                                      relief=tk.RAISED, 
+                                      padx=15, pady=8,
+                                      cursor='hand2',
+                                      activebackground='#C71585',
+                                      activeforeground='white',
+                                      disabledforeground='white')
+        self.btn_conciliar.pack(side=tk.LEFT, padx=5)
+        
+        self.btn_validacion = tk.Button(self.fila_revision, text="🔎 Validación", 
+                                       command=self.ver_validacion, state=tk.DISABLED,
+                                       bg=self.COLORES['boton_peligro'], 
+                                       fg='white',
+                                       font=('Helvetica', 11, 'bold'),
+                                       relief=tk.RAISED, 
+                                       padx=15, pady=8,
+                                       cursor='hand2',
+                                       activebackground='#C71585',
+                                       activeforeground='white',
+                                       disabledforeground='white')
+        self.btn_validacion.pack(side=tk.LEFT, padx=5)
+        
+        self.btn_totales = tk.Button(self.fila_revision, text="📈 Totales", 
+                                     command=self.ver_totales, state=tk.DISABLED,
+                                     bg=self.COLORES['boton_peligro'], 
+                                     fg='white',
+                                     font=('Helvetica', 11, 'bold'),
+                                     relief=tk.RAISED, 
+                                     padx=15, pady=8,
+                                     cursor='hand2',
+                                     activebackground='#C71585',
+                                     activeforeground='white',
+                                     disabledforeground='white')
+        self.btn_totales.pack(side=tk.LEFT, padx=5)
+        
+        self.btn_cambios = tk.Button(self.fila_revision, text="🆚 Cambios", 
+                                    command=self.comparar_con_anterior, state=tk.DISABLED,
+                                    bg=self.COLORES['boton_peligro'], 
+                                    fg='white',
+                                    font=('Helvetica', 11, 'bold'),
+                                    relief=tk.RAISED, 
+                                    padx=15, pady=8,
+                                    cursor='hand2',
+                                    activebackground='#C71585',
+                                    activeforeground='white',
+                                    disabledforeground='white')
+        self.btn_cambios.pack(side=tk.LEFT, padx=5)
+        
         # Resumen
         self.lbl_resumen = tk.Label(self.frame_resultados, text="", 
                                    bg=self.COLORES['fondo_frame'], 
@@ -746,8 +3172,9 @@ class AplicacionDIAN:
         archivo = filedialog.askopenfilename(
             title="Seleccionar archivo de la DIAN",
             filetypes=[
-                ("Archivos Excel", "*.xlsx *.xls"),
-                ("Archivos CSV", "*.csv"),
+                ("Archivos Excel", "*.xlsx *.xlsm *.xls *.xlsb *.ods"),
+                ("Archivos CSV", "*.csv *.csv.gz"),
+                ("Archivos comprimidos", "*.zip *.gz"),
                 ("Todos los archivos", "*.*")
             ]
         )
@@ -760,14 +3187,223 @@ class AplicacionDIAN:
             self.log(f"Archivo seleccionado: {nombre}")
             
             # Detectar tipo por nombre
-            nombre_lower = nombre.lower()
-            if 'recibido' in nombre_lower:
+            tipo = self.procesador.tipo_por_nombre(nombre)
+            if tipo == 'compras':
                 self.tipo_var.set('compras')
                 self.log("Tipo sugerido: Compras")
-            elif 'enviado' in nombre_lower:
+            elif tipo == 'ventas':
                 self.tipo_var.set('ventas')
                 self.log("Tipo sugerido: Ventas")
     
+    def actualizar_clientes(self):
+        """Recarga la lista de clientes del espacio de trabajo"""
+        nombres = [c['nombre'] for c in self.espacio.clientes()] if self.espacio is not None else []
+        self.combo_cliente.config(values=[self.SIN_CLIENTE] + nombres)
+        if self.cliente_var.get() not in nombres:
+            self.cliente_var.set(self.SIN_CLIENTE)
+    
+    def seleccionar_cliente(self, event=None):
+        """Aplica las cuentas propias y el índice de facturas del cliente elegido"""
+        cuentas_compras, cuentas_ventas = self.cuentas_base
+        self.procesador.CUENTAS_COMPRAS = dict(cuentas_compras)
+        self.procesador.CUENTAS_VENTAS = dict(cuentas_ventas)
+        ruta_indice = ARCHIVO_INDICE_FACTURAS
+        
+        cliente = self.espacio.cliente(self.cliente_var.get()) if self.espacio is not None else None
+        if cliente is not None:
+            self.procesador.CUENTAS_COMPRAS.update(cliente['cuentas_compras'])
+            self.procesador.CUENTAS_VENTAS.update(cliente['cuentas_ventas'])
+            ruta_indice = self.espacio.ruta_indice(cliente['id'])
+            opciones = cliente['opciones']
+            self.consolidar_var.set(opciones.get('consolidar', self.consolidar_var.get()))
+            self.por_periodo_var.set(opciones.get('por_periodo', self.por_periodo_var.get()))
+            self.excluir_duplicadas_var.set(opciones.get('excluir_duplicados', self.excluir_duplicadas_var.get()))
+            propias = {**cliente['cuentas_compras'], **cliente['cuentas_ventas']}
+            self.log(f"👤 Cliente: {cliente['nombre']}" + 
+                     (f" (cuentas propias: {', '.join(f'{k}={v}' for k, v in propias.items())})" if propias else ""))
+        
+        try:
+            self.procesador.indice_facturas = IndiceFacturas(ruta_indice)
+        except (OSError, ValueError) as e:
+            self.procesador.indice_facturas = None
+            self.log(f"⚠️ No se pudo abrir el índice de facturas ({e}), no se revisarán duplicadas")
+    
+    def editar_cliente(self):
+        """Crea o edita un cliente: nombre, cuentas propias y opciones de salida"""
+        cliente = self.espacio.cliente(self.cliente_var.get()) or {
+            'nombre': '', 'cuentas_compras': {}, 'cuentas_ventas': {}, 'opciones': {}}
+        cuentas_compras, cuentas_ventas = self.cuentas_base
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Cliente")
+        ventana.configure(bg=self.COLORES['fondo_principal'], padx=20, pady=15)
+        
+        campos = {}
+        filas = [('nombre', "Nombre", cliente['nombre'])]
+        filas += [(f"compras:{clave}", f"Compras - {clave}", cliente['cuentas_compras'].get(clave, cuenta))
+                  for clave, cuenta in cuentas_compras.items()]
+        filas += [(f"ventas:{clave}", f"Ventas - {clave}", cliente['cuentas_ventas'].get(clave, cuenta))
+                  for clave, cuenta in cuentas_ventas.items()]
+        for fila, (clave, etiqueta, valor) in enumerate(filas):
+            tk.Label(ventana, text=etiqueta, font=('Helvetica', 11),
+                     bg=self.COLORES['fondo_principal'], fg=self.COLORES['texto_principal']).grid(
+                row=fila, column=0, sticky='w', pady=3)
+            entrada = tk.Entry(ventana, font=('Helvetica', 11), width=30)
+            entrada.insert(0, valor)
+            entrada.grid(row=fila, column=1, pady=3, padx=(10, 0))
+            campos[clave] = entrada
+        
+        opciones = {}
+        for fila, (clave, texto) in enumerate([('consolidar', "Consolidar por tercero y cuenta"),
+                                                ('por_periodo', "Separar por mes de emisión"),
+                                                ('excluir_duplicados', "Omitir facturas ya procesadas")],
+                                               start=len(filas)):
+            opciones[clave] = tk.BooleanVar(value=cliente['opciones'].get(clave, clave == 'excluir_duplicados'))
+            tk.Checkbutton(ventana, text=texto, variable=opciones[clave], font=('Helvetica', 11),
+                           bg=self.COLORES['fondo_principal'], fg=self.COLORES['texto_principal'],
+                           selectcolor=self.COLORES['boton_principal']).grid(
+                row=fila, column=0, columnspan=2, sticky='w')
+        
+        def guardar():
+            nombre = campos['nombre'].get().strip()
+            if not nombre:
+                messagebox.showwarning("Atención", "El cliente necesita un nombre.", parent=ventana)
+                return
+            # Solo se guardan las cuentas que difieren de las predeterminadas
+            propias = {'compras': {}, 'ventas': {}}
+            for clave, entrada in campos.items():
+                if clave == 'nombre':
+                    continue
+                grupo, cuenta = clave.split(':')
+                base = (cuentas_compras if grupo == 'compras' else cuentas_ventas)[cuenta]
+                if entrada.get().strip() and entrada.get().strip() != base:
+                    propias[grupo][cuenta] = entrada.get().strip()
+            try:
+                self.espacio.guardar_cliente(nombre, cuentas_compras=propias['compras'],
+                                             cuentas_ventas=propias['ventas'],
+                                             opciones={clave: var.get() for clave, var in opciones.items()})
+            except (ValueError, sqlite3.Error) as e:
+                messagebox.showerror("Error", f"No se pudo guardar el cliente:\n{str(e)}", parent=ventana)
+                return
+            self.actualizar_clientes()
+            self.cliente_var.set(nombre)
+            self.seleccionar_cliente()
+            ventana.destroy()
+        
+        tk.Button(ventana, text="💾 Guardar", command=guardar,
+                 bg=self.COLORES['boton_exito'], fg='white',
+                 font=('Helvetica', 10, 'bold'), padx=15, pady=5,
+                 cursor='hand2').grid(row=len(filas) + 3, column=0, columnspan=2, pady=(10, 0))
+    
+    def iniciar_planificador(self):
+        """Arranca (una sola vez) el planificador de la cola en un hilo de fondo"""
+        if self.planificador is None:
+            self.planificador = PlanificadorTrabajos(self.espacio, memoria=self.procesador.presupuesto_memoria)
+        self.planificador.iniciar()
+    
+    def ver_cola(self):
+        """Cola de trabajos del espacio de trabajo: agregar archivos, reintentar, cancelar"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Cola de trabajos")
+        ventana.geometry("1100x550")
+        ventana.configure(bg=self.COLORES['fondo_principal'])
+        
+        lbl_estado = tk.Label(ventana, text="",
+                              fg=self.COLORES['texto_principal'],
+                              bg=self.COLORES['fondo_principal'],
+                              font=('Helvetica', 11, 'bold'))
+        lbl_estado.pack(pady=10)
+        
+        frame = tk.Frame(ventana, padx=10, pady=10, bg=self.COLORES['fondo_principal'])
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        columnas = ['ID', 'CLIENTE', 'ARCHIVO', 'PERIODO', 'PRIORIDAD', 'ESTADO', 'INTENTOS', 'TERMINADO', 'DETALLE']
+        tree = ttk.Treeview(frame, columns=columnas, show='headings', height=18)
+        for col in columnas:
+            tree.heading(col, text=col)
+            tree.column(col, width=250 if col in ['ARCHIVO', 'DETALLE'] else 90, anchor='center')
+        
+        scrollbar_y = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar_y.set)
+        tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar_y.grid(row=0, column=1, sticky='ns')
+        frame.grid_rowconfigure(0, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+        
+        def refrescar():
+            if not ventana.winfo_exists():
+                return
+            trabajos = self.espacio.trabajos()
+            seleccion = tree.selection()
+            tree.delete(*tree.get_children())
+            for row in trabajos.itertuples(index=False):
+                if row.estado == 'terminado':
+                    resumen = json.loads(row.resumen)
+                    detalle = f"{resumen['facturas']} facturas → {resumen['filas']} registros"
+                    cambios = resumen.get('cambios')
+                    if cambios:
+                        detalle += (f" (+{cambios['agregadas']} / -{cambios['eliminadas']} / "
+                                    f"~{cambios['modificadas']})")
+                else:
+                    detalle = row.error or ''
+                tree.insert('', tk.END, iid=str(row.id), values=[
+                    row.id, row.cliente, Path(row.ruta).name, row.periodo or '', row.prioridad,
+                    row.estado, row.intentos, row.terminado or '', detalle])
+            tree.selection_set([i for i in seleccion if tree.exists(i)])
+            conteo = trabajos['estado'].value_counts()
+            lbl_estado.config(text='   '.join(f"{estado.capitalize()}: {conteo.get(estado, 0)}"
+                                               for estado in EspacioTrabajo.ESTADOS))
+            ventana.after(2000, refrescar)
+        
+        def agregar():
+            cliente = self.cliente_var.get()
+            if self.espacio.cliente(cliente) is None:
+                messagebox.showwarning("Atención", "Elige o crea primero un cliente.", parent=ventana)
+                return
+            archivos = filedialog.askopenfilenames(
+                parent=ventana,
+                title=f"Archivos de la DIAN para {cliente}",
+                filetypes=[("Archivos Excel, CSV o comprimidos", "*.xlsx *.xls *.csv *.zip *.gz"),
+                           ("Todos los archivos", "*.*")])
+            if not archivos:
+                return
+            prioridad = simpledialog.askinteger("Prioridad", "Prioridad (mayor = antes):",
+                                                initialvalue=0, parent=ventana)
+            if prioridad is None:
+                return
+            periodo = simpledialog.askstring("Periodo", "Periodo (AAAA-MM, opcional):", parent=ventana)
+            ids = self.espacio.encolar(cliente, archivos, prioridad=prioridad, periodo=periodo or None)
+            self.log(f"📥 {len(ids)} archivos en cola para {cliente}")
+            self.iniciar_planificador()
+        
+        def seleccionados():
+            return [int(i) for i in tree.selection()]
+        
+        def reintentar():
+            self.espacio.reintentar(seleccionados())
+            self.iniciar_planificador()
+        
+        def marcar_importado():
+            marcados = self.espacio.marcar_importado(seleccionados())
+            if marcados:
+                self.log(f"📌 {marcados} corridas marcadas como importadas")
+            else:
+                messagebox.showinfo("Cola de trabajos",
+                                    "Elige trabajos terminados con periodo para marcarlos como importados.",
+                                    parent=ventana)
+        
+        frame_acciones = tk.Frame(ventana, bg=self.COLORES['fondo_principal'])
+        frame_acciones.pack(pady=5)
+        for texto, comando in [("➕ Agregar archivos", agregar), ("↻ Reintentar", reintentar),
+                               ("✖ Cancelar", lambda: self.espacio.cancelar(seleccionados())),
+                               ("📌 Marcar importado", marcar_importado)]:
+            tk.Button(frame_acciones, text=texto, command=comando,
+                     bg=self.COLORES['boton_exito'], fg='white',
+                     font=('Helvetica', 10, 'bold'), padx=15, pady=5,
+                     cursor='hand2').pack(side=tk.LEFT, padx=5)
+        
+        refrescar()
+    
     def procesar_archivo(self):
         """Procesa el archivo seleccionado"""
         if not self.archivo_actual:
@@ -783,11 +3419,38 @@ class AplicacionDIAN:
             self.progress['value'] = 10
             self.root.update()
             
+            self.procesador.excluir_duplicados = self.excluir_duplicadas_var.get()
+            try:
+                memoria_mb = self.memoria_var.get()
+            except tk.TclError:
+                memoria_mb = 0
+            if memoria_mb <= 0:
+                raise Exception("El presupuesto de memoria debe ser un número de MB mayor que cero.")
+            self.procesador.presupuesto_memoria = memoria_mb * 1024 * 1024
+            
+            # Estimar la memoria necesaria y elegir entre conversión en memoria o por bloques
+            plan = self.procesador.planificar_conversion(self.archivo_actual)
+            self.log(plan['mensaje'])
+            if plan['advertencia']:
+                self.log(f"⚠️ {plan['advertencia']}")
+                messagebox.showwarning("Memoria", plan['advertencia'])
+            if plan['modo'] == 'bloques':
+                self.procesar_por_bloques(plan['tamano_bloque'])
+                return
+            
             # Leer archivo
             self.log("Leyendo archivo...")
             df = self.procesador.leer_archivo_dian(self.archivo_actual)
+            lectura = self.procesador.ultima_lectura
+            self.log(f"Motor de lectura: {lectura['motor']} ({lectura['segundos']:.2f} s)")
             self.log(f"Filas leídas: {len(df)}")
+            duplicados = self.procesador.duplicados
+            if duplicados is not None and len(duplicados):
+                accion = "omitidas" if self.procesador.excluir_duplicados else "marcadas en la validación"
+                self.log(f"🔁 Facturas duplicadas o ya procesadas: {len(duplicados)} ({accion})")
             
+            if len(df) == 0 and duplicados is not None and len(duplicados):
+                raise Exception("Todas las facturas del archivo ya fueron procesadas antes.")
             if len(df) == 0:
                 raise Exception("No se encontraron facturas en el archivo.")
             
@@ -799,16 +3462,8 @@ class AplicacionDIAN:
             # Determinar tipo
             tipo = self.tipo_var.get()
             if tipo == "auto":
-                columnas_str = ' '.join([str(c).upper() for c in df.columns])
-                if 'NIT EMISOR' in columnas_str:
-                    tipo = "compras"
-                    self.log("Tipo detectado: Compras (por NIT Emisor)")
-                elif 'NIT RECEPTOR' in columnas_str:
-                    tipo = "ventas"
-                    self.log("Tipo detectado: Ventas (por NIT Receptor)")
-                else:
-                    tipo = "compras"
-                    self.log("Tipo por defecto: Compras")
+                tipo, motivo = self.procesador.detectar_tipo(df)
+                self.log(motivo)
             
             self.progress['value'] = 50
             
@@ -841,6 +3496,28 @@ class AplicacionDIAN:
                 self.df_resultado = self.procesador.procesar_ventas(df)
                 tipo_nombre = "Ventas/Enviados"
             
+            self.df_facturas = df
+            self.tipo_actual = tipo
+            self.resumen = self.procesador.resumen
+            
+            # Validar partida doble y anomalías (antes de consolidar, por factura)
+            if len(self.df_resultado) > 0:
+                self.reporte_validacion = self.procesador.validar_asientos(df, self.df_resultado, tipo)
+                totales = self.reporte_validacion['totales']
+                self.log(f"Validación: débitos {self.procesador.formato_pesos_display(totales['debito'])} / "
+                         f"créditos {self.procesador.formato_pesos_display(totales['credito'])}")
+                if not self.reporte_validacion['cuadrado']:
+                    self.log(f"⚠️ Facturas descuadradas: {totales['descuadradas']} de {totales['facturas']}")
+                if totales['anomalias'] > 0:
+                    self.log(f"⚠️ Anomalías detectadas: {totales['anomalias']} (ver 'Validación')")
+            
+            # Consolidar por tercero + cuenta (opcional)
+            if self.consolidar_var.get() and len(self.df_resultado) > 0:
+                filas_detalle = len(self.df_resultado)
+                self.df_resultado = self.procesador.consolidar_registros(
+                    self.df_resultado, por_periodo=self.por_periodo_var.get())
+                self.log(f"Consolidado: {filas_detalle} registros → {len(self.df_resultado)} líneas")
+            
             self.progress['value'] = 100
             
             # Verificar resultado
@@ -852,28 +3529,7 @@ class AplicacionDIAN:
                 self.progress['value'] = 0
                 return
             
-            # Éxito
-            self.log(f"✅ ÉXITO: {len(self.df_resultado)} filas generadas")
-            self.lbl_estado.config(text=f"✅ Completado: {tipo_nombre}", fg=self.COLORES['boton_exito'])
-            self.lbl_resumen.config(text=f"Tipo: {tipo_nombre}\n"
-                                        f"Filas generadas: {len(self.df_resultado)}\n"
-                                        f"Facturas procesadas: {len(df)}\n"
-                                        f"Valores redondeados al peso más cercano")
-            
-            # Habilitar botones
-            self.btn_ver.config(state=tk.NORMAL, bg=self.COLORES['boton_accion'], fg='white')
-            self.btn_excel.config(state=tk.NORMAL)
-            self.btn_query.config(state=tk.NORMAL)
-            
-            messagebox.showinfo("Éxito", 
-                f"Procesamiento completado.\n\n"
-                f"Tipo: {tipo_nombre}\n"
-                f"Facturas: {len(df)}\n"
-                f"Registros Siigo: {len(self.df_resultado)}\n\n"
-                f"NOTAS:\n"
-                f"✓ Todos los valores redondeados al peso más cercano\n"
-                f"✓ VALOR_BASE calculado como IVA/0.19 (sin decimales)\n"
-                f"✓ Formato colombiano: 200.000,00")
+            self.mostrar_exito(tipo_nombre, len(df))
             
         except Exception as e:
             self.progress['value'] = 0
@@ -882,13 +3538,159 @@ class AplicacionDIAN:
             self.log(traceback.format_exc())
             messagebox.showerror("Error", f"Error al procesar:\n\n{error_msg}")
     
+    def procesar_por_bloques(self, tamano_bloque=None):
+        """
+        Procesa un archivo grande por bloques con puntos de control: si una conversión
+        anterior del mismo archivo quedó a medias, ofrece reanudarla desde el último bloque.
+        La conversión corre en un proceso aparte (la ventana sigue respondiendo) y el resultado
+        llega mapeado en memoria, sin copiarlo al proceso de la interfaz.
+        """
+        tipo = self.tipo_var.get()
+        reanudar = True
+        pendiente = self.procesador.avance_pendiente(self.archivo_actual, tipo)
+        if pendiente is not None:
+            reanudar = messagebox.askyesno("Reanudar",
+                f"Hay una conversión de este archivo interrumpida con "
+                f"{pendiente['filas_consumidas']:,} filas ya convertidas.\n\n"
+                f"¿Reanudar desde ahí? (No = empezar de nuevo)")
+        
+        if pendiente is not None and reanudar:
+            self.log(f"Reanudando con bloques de {pendiente['firma']['tamano_bloque']:,} filas")
+        
+        indice = self.procesador.indice_facturas
+        opciones = {
+            'tipo': tipo,
+            'consolidar': self.consolidar_var.get(),
+            'por_periodo': self.por_periodo_var.get(),
+            'tamano_bloque': tamano_bloque,
+            'reanudar': reanudar,
+            'cuentas_compras': dict(self.procesador.CUENTAS_COMPRAS),
+            'cuentas_ventas': dict(self.procesador.CUENTAS_VENTAS),
+            'indice_facturas': str(indice.ruta) if indice is not None else None,
+            'excluir_duplicados': self.procesador.excluir_duplicados,
+        }
+        try:
+            if self.pool_conversion is None:
+                self.pool_conversion = ProcessPoolExecutor(max_workers=1)
+            futuro = self.pool_conversion.submit(_conversion_compartida, self.archivo_actual, opciones)
+        except (BrokenProcessPool, OSError) as e:
+            self.pool_conversion = None
+            self.log(f"⚠️ No se pudo convertir en un proceso aparte ({e}), convirtiendo aquí")
+            
+            def progreso(filas, bloques):
+                self.log(f"  Bloque {bloques} guardado ({filas:,} filas convertidas)")
+                self.progress['value'] = min(95, self.progress['value'] + 5)
+            
+            conversion = self.procesador.convertir_por_bloques(
+                self.archivo_actual, tipo=tipo,
+                consolidar=opciones['consolidar'], por_periodo=opciones['por_periodo'],
+                tamano_bloque=tamano_bloque, reanudar=reanudar, progreso=progreso)
+            self.terminar_por_bloques(conversion)
+            return
+        
+        self.btn_procesar.config(state=tk.DISABLED)
+        self.lbl_estado.config(text="⏳ Convirtiendo por bloques...", fg=self.COLORES['texto_secundario'])
+        self.esperar_conversion(futuro, tipo, self.archivo_actual, bloques_vistos=0)
+    
+    def esperar_conversion(self, futuro, tipo, ruta_archivo, bloques_vistos):
+        """Sigue la conversión del proceso aparte (leyendo su punto de control) sin bloquear la ventana"""
+        if not futuro.done():
+            estado = self.procesador.avance_pendiente(ruta_archivo, tipo)
+            if estado is not None and estado['bloques'] > bloques_vistos:
+                bloques_vistos = estado['bloques']
+                self.log(f"  Bloque {bloques_vistos} guardado ({estado['filas_consumidas']:,} filas convertidas)")
+                self.progress['value'] = min(95, self.progress['value'] + 5)
+            self.root.after(500, self.esperar_conversion, futuro, tipo, ruta_archivo, bloques_vistos)
+            return
+        
+        self.btn_procesar.config(state=tk.NORMAL)
+        try:
+            conversion = futuro.result()
+            conversion['resultado'] = abrir_resultado(conversion['resultado'])
+            conversion['validacion']['por_factura'] = abrir_resultado(conversion['validacion']['por_factura'])
+            self.log(f"Resultado recibido en memoria compartida ({conversion['resultado'].shape[0]:,} filas)")
+            self.terminar_por_bloques(conversion)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.pool_conversion = None
+            self.progress['value'] = 0
+            self.lbl_estado.config(text="❌ Error", fg=self.COLORES['texto_principal'])
+            self.log(f"❌ ERROR: {str(e)}")
+            messagebox.showerror("Error", f"Error al procesar:\n\n{str(e)}")
+    
+    def terminar_por_bloques(self, conversion):
+        """Toma el resultado de una conversión por bloques y muestra el resumen"""
+        self.df_resultado = conversion['resultado']
+        self.reporte_validacion = conversion['validacion']
+        # Las facturas no se conservan en memoria: la conciliación no está disponible
+        self.df_facturas = None
+        self.tipo_actual = conversion['tipo']
+        self.resumen = conversion['resumen']
+        # Se registran en el índice cuando el resultado se guarde o envíe (ver facturas_exportadas)
+        self.procesador.huellas_leidas = conversion['huellas']
+        
+        totales = self.reporte_validacion['totales']
+        self.log(f"Validación: débitos {self.procesador.formato_pesos_display(totales['debito'])} / "
+                 f"créditos {self.procesador.formato_pesos_display(totales['credito'])}")
+        if totales['anomalias'] > 0:
+            self.log(f"⚠️ Anomalías detectadas: {totales['anomalias']} (ver 'Validación')")
+        
+        self.progress['value'] = 100
+        tipo_nombre = "Compras/Recibidos" if conversion['tipo'] == "compras" else "Ventas/Enviados"
+        self.mostrar_exito(tipo_nombre, conversion['n_facturas'])
+    
+    def mostrar_exito(self, tipo_nombre, n_facturas):
+        """Muestra el resumen del procesamiento y habilita los botones de exportación"""
+        self.log(f"✅ ÉXITO: {len(self.df_resultado)} filas generadas")
+        self.lbl_estado.config(text=f"✅ Completado: {tipo_nombre}", fg=self.COLORES['boton_exito'])
+        texto_resumen = (f"Tipo: {tipo_nombre}\n"
+                         f"Filas generadas: {len(self.df_resultado)}\n"
+                         f"Facturas procesadas: {n_facturas}\n"
+                         f"Valores redondeados al peso más cercano")
+        if self.resumen is not None:
+            # Totales ya calculados durante la generación de asientos
+            totales = self.procesador.totales_resumen(self.resumen)
+            fmt = self.procesador.formato_pesos_display
+            texto_resumen += (f"\nTerceros: {totales['terceros']}   Base: {fmt(totales['BASE'])}   "
+                              f"IVA: {fmt(totales['IVA'])}   Total: {fmt(totales['TOTAL'])}\n"
+                              f"Base gravada (IVA/{self.procesador.IVA_RATE}): {fmt(totales['BASE_IVA'])}   "
+                              f"No gravado: {fmt(totales['NO_GRAVADO'])}")
+            texto_resumen += "\nIVA por tarifa: " + "   ".join(
+                f"{fila.TARIFA}: base {fmt(fila.BASE)} / IVA {fmt(fila.IVA)}"
+                for fila in self.resumen['iva'].itertuples(index=False))
+            for fila in self.resumen['terceros'].head(3).itertuples(index=False):
+                texto_resumen += f"\n  • {fila.NOMBRE} ({fila.TERCERO}): {fmt(fila.TOTAL)}"
+        self.lbl_resumen.config(text=texto_resumen)
+        
+        # Habilitar botones
+        self.btn_ver.config(state=tk.NORMAL, bg=self.COLORES['boton_accion'], fg='white')
+        self.btn_excel.config(state=tk.NORMAL)
+        self.btn_query.config(state=tk.NORMAL)
+        self.btn_validacion.config(state=tk.NORMAL)
+        self.btn_totales.config(state=tk.NORMAL if self.resumen is not None else tk.DISABLED)
+        self.btn_cambios.config(state=tk.NORMAL if self.espacio is not None else tk.DISABLED)
+        self.btn_particion.config(state=tk.NORMAL)
+        self.btn_plantilla.config(state=tk.NORMAL)
+        self.btn_siigo.config(state=tk.NORMAL)
+        self.btn_conciliar.config(state=tk.NORMAL if self.df_facturas is not None else tk.DISABLED)
+        
+        messagebox.showinfo("Éxito", 
+            f"Procesamiento completado.\n\n"
+            f"Tipo: {tipo_nombre}\n"
+            f"Facturas: {n_facturas}\n"
+            f"Registros Siigo: {len(self.df_resultado)}\n\n"
+            f"NOTAS:\n"
+            f"✓ Todos los valores redondeados al peso más cercano\n"
+            f"✓ VALOR_BASE calculado como IVA/0.19 (sin decimales)\n"
+            f"✓ Formato colombiano: 200.000,00")
+    
     def formato_display(self, valor):
         """Formatea un valor numérico para mostrar en la vista previa"""
         if pd.isna(valor) or valor is None:
             return ""
-        if isinstance(valor, (int, float)):
-            # Redondear al entero más cercano
-            valor_entero = int(round(float(valor), 0))
+        if isinstance(valor, (int, float, np.integer, np.floating)):
+            # Redondear al entero más cercano (mitad hacia arriba)
+            valor_entero = self.procesador.redondear_peso(valor)
             # Formato colombiano: 200.000,00
             return f"{valor_entero:,}".replace(",", ".") + ",00"
         return str(valor)
@@ -906,7 +3708,7 @@ class AplicacionDIAN:
         frame = tk.Frame(ventana, padx=10, pady=10, bg=self.COLORES['fondo_principal'])
         frame.pack(fill=tk.BOTH, expand=True)
         
-        columnas = list(self.df_resultado.columns)
+        columnas = self.procesador.columnas_exportables(self.df_resultado)
         tree = ttk.Treeview(frame, columns=columnas, show='headings', height=20)
         
         # Configurar estilo para el treeview
@@ -926,7 +3728,7 @@ class AplicacionDIAN:
             tree.column(col, width=ancho, anchor='center')
         
         # Insertar datos con formato de display
-        for idx, row in self.df_resultado.head(100).iterrows():
+        for idx, row in self.df_resultado[columnas].head(100).iterrows():
             valores_display = []
             for col in columnas:
                 valor = row[col]
@@ -954,6 +3756,247 @@ class AplicacionDIAN:
                 bg=self.COLORES['fondo_principal'],
                 font=('Helvetica', 9)).pack(pady=5)
     
+    def ver_validacion(self):
+        """Muestra el reporte de validación: totales del lote y anomalías por factura"""
+        if self.reporte_validacion is None:
+            return
+        
+        reporte = self.reporte_validacion
+        totales = reporte['totales']
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Validación - Partida doble y anomalías")
+        ventana.geometry("1000x600")
+        ventana.configure(bg=self.COLORES['fondo_principal'])
+        
+        estado = "✅ Lote cuadrado" if reporte['cuadrado'] else "⚠️ Lote descuadrado"
+        tk.Label(ventana, text=f"{estado}\n"
+                              f"Débitos: {self.procesador.formato_pesos_display(totales['debito'])}   "
+                              f"Créditos: {self.procesador.formato_pesos_display(totales['credito'])}   "
+                              + (f"Proveedores (implícita): "
+                                 f"{self.procesador.formato_pesos_display(totales['contrapartida'])}   "
+                                 if totales['contrapartida'] else "")
+                              + f"Diferencia: {self.procesador.formato_pesos_display(totales['diferencia'])}\n"
+                              f"Facturas descuadradas: {totales['descuadradas']} de {totales['facturas']}   "
+                              f"Anomalías: {totales['anomalias']}",
+                fg=self.COLORES['texto_principal'],
+                bg=self.COLORES['fondo_principal'],
+                font=('Helvetica', 11, 'bold'),
+                justify=tk.LEFT).pack(pady=10)
+        
+        frame = tk.Frame(ventana, padx=10, pady=10, bg=self.COLORES['fondo_principal'])
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        columnas = ['DOCUMENTO', 'TERCERO', 'TOTAL / DÉBITO', 'IVA / CRÉDITO', 'DIFERENCIA', 'MOTIVO']
+        tree = ttk.Treeview(frame, columns=columnas, show='headings', height=20)
+        for col in columnas:
+            tree.heading(col, text=col)
+            tree.column(col, width=300 if col == 'MOTIVO' else 120, anchor='center')
+        
+        # Anomalías primero, luego facturas descuadradas (máximo 500 filas en pantalla)
+        for row in reporte['anomalias'].head(500).itertuples(index=False):
+            tree.insert('', tk.END, values=[row.DOCUMENTO, row.TERCERO,
+                                            self.formato_display(row.TOTAL), self.formato_display(row.IVA),
+                                            '', row.MOTIVO])
+        for row in reporte['descuadradas'].head(500).itertuples(index=False):
+            tree.insert('', tk.END, values=[row.DOCUMENTO, row.TERCERO,
+                                            self.formato_display(row.DEBITO), self.formato_display(row.CREDITO),
+                                            self.formato_display(row.DIFERENCIA), 'Factura descuadrada'])
+        
+        scrollbar_y = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar_y.set)
+        tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar_y.grid(row=0, column=1, sticky='ns')
+        frame.grid_rowconfigure(0, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+    
+    def ver_totales(self):
+        """Muestra los totales por tercero, por cuenta y el resumen de IVA, y permite exportarlos"""
+        if self.resumen is None:
+            return
+        
+        resumen = self.resumen
+        totales = self.procesador.totales_resumen(resumen)
+        fmt = self.procesador.formato_pesos_display
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Totales")
+        ventana.geometry("1200x600")
+        ventana.configure(bg=self.COLORES['fondo_principal'])
+        
+        aviso = (f"   ⚠️ Terceros con más IVA del que admite la base: {totales['iva_excedido']}"
+                 if totales['iva_excedido'] else "")
+        tk.Label(ventana, text=f"Terceros: {totales['terceros']}   Cuentas: {totales['cuentas']}   "
+                              f"Documentos: {totales['DOCUMENTOS']} (notas crédito: {totales['NOTAS_CREDITO']})\n"
+                              f"Base: {fmt(totales['BASE'])}   IVA: {fmt(totales['IVA'])}   "
+                              f"Total: {fmt(totales['TOTAL'])}\n"
+                              f"Base gravada: {fmt(totales['BASE_IVA'])}   "
+                              f"No gravado: {fmt(totales['NO_GRAVADO'])}" + aviso,
+                fg=self.COLORES['texto_principal'],
+                bg=self.COLORES['fondo_principal'],
+                font=('Helvetica', 11, 'bold'),
+                justify=tk.LEFT).pack(pady=10)
+        
+        pestanas = ttk.Notebook(ventana)
+        pestanas.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        montos = ['BASE', 'IVA', 'TOTAL', 'BASE_IVA', 'NO_GRAVADO', 'DEBITO', 'CREDITO', 'VALOR_BASE', 'SALDO']
+        tablas = [('Por tercero', 'terceros'), ('Por cuenta', 'cuentas'), ('IVA', 'iva')]
+        
+        for titulo, clave in tablas:
+            tabla = resumen[clave]
+            frame = tk.Frame(pestanas, padx=10, pady=10, bg=self.COLORES['fondo_principal'])
+            pestanas.add(frame, text=titulo)
+            
+            columnas = list(tabla.columns)
+            tree = ttk.Treeview(frame, columns=columnas, show='headings', height=18)
+            for col in columnas:
+                tree.heading(col, text=col)
+                tree.column(col, width=250 if col == 'NOMBRE' else 110, anchor='center')
+            
+            # Máximo 500 filas en pantalla (los terceros van de mayor a menor total)
+            for row in tabla.head(500).itertuples(index=False):
+                tree.insert('', tk.END, values=[
+                    self.formato_display(valor) if col in montos else valor
+                    for col, valor in zip(columnas, row)])
+            
+            scrollbar_y = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar_y.set)
+            tree.grid(row=0, column=0, sticky='nsew')
+            scrollbar_y.grid(row=0, column=1, sticky='ns')
+            frame.grid_rowconfigure(0, weight=1)
+            frame.grid_columnconfigure(0, weight=1)
+        
+        def exportar():
+            titulo, clave = tablas[pestanas.index(pestanas.select())]
+            destino = filedialog.asksaveasfilename(
+                parent=ventana,
+                defaultextension=".csv",
+                filetypes=[("CSV", "*.csv")],
+                initialfile=f"{clave.capitalize()}_{datetime.now().strftime('%Y%m%d')}.csv")
+            if destino:
+                resumen[clave].to_csv(destino, index=False, sep=';', encoding='utf-8-sig')
+                self.log(f"✅ Totales ({titulo.lower()}) guardados: {destino}")
+        
+        tk.Button(ventana, text="💾 Exportar pestaña", command=exportar,
+                 bg=self.COLORES['boton_exito'], fg='white',
+                 font=('Helvetica', 10, 'bold'), padx=15, pady=5,
+                 cursor='hand2').pack(pady=5)
+    
+    def comparar_con_anterior(self):
+        """
+        Compara el resultado con la corrida ya importada del mismo cliente y periodo: muestra solo
+        las líneas agregadas, eliminadas y modificadas, y permite dejar este resultado como la nueva base
+        """
+        if self.df_resultado is None or self.espacio is None:
+            return
+        cliente = self.espacio.cliente(self.cliente_var.get())
+        if cliente is None:
+            messagebox.showwarning("Cambios", "Seleccione un cliente para comparar con sus corridas anteriores")
+            return
+        
+        tipo = self.tipo_actual
+        meses = pd.to_datetime(self.df_resultado['FECHA'], errors='coerce').dt.strftime('%Y-%m').dropna()
+        periodo = simpledialog.askstring("Cambios", "Periodo (AAAA-MM):",
+                                         initialvalue=meses.mode().iloc[0] if len(meses) else '',
+                                         parent=self.root)
+        if not periodo:
+            return
+        periodo = periodo.strip()
+        
+        anterior = self.espacio.ultima_corrida(cliente['id'], periodo, tipo)
+        if anterior is None:
+            if messagebox.askyesno("Cambios",
+                                   f"No hay una corrida guardada de {tipo} {periodo} para {cliente['nombre']}.\n\n"
+                                   f"¿Guardar este resultado como la corrida importada?"):
+                self.espacio.guardar_corrida(cliente['id'], periodo, tipo, self.df_resultado)
+                self.log(f"🆚 Corrida guardada: {cliente['nombre']} {tipo} {periodo}")
+            return
+        
+        try:
+            diferencias = self.procesador.comparar_resultados(pd.read_pickle(anterior), self.df_resultado)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo comparar con la corrida anterior:\n{str(e)}")
+            return
+        totales = diferencias['totales']
+        self.log(f"🆚 Cambios vs {anterior.name}: {totales['agregadas']} agregadas, "
+                 f"{totales['eliminadas']} eliminadas, {totales['modificadas']} modificadas")
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Cambios - {cliente['nombre']} {tipo} {periodo}")
+        ventana.geometry("1200x600")
+        ventana.configure(bg=self.COLORES['fondo_principal'])
+        
+        tk.Label(ventana, text=f"Agregadas: {totales['agregadas']}   Eliminadas: {totales['eliminadas']}   "
+                              f"Modificadas: {totales['modificadas']}   Sin cambios: {totales['sin_cambios']}",
+                fg=self.COLORES['texto_principal'],
+                bg=self.COLORES['fondo_principal'],
+                font=('Helvetica', 11, 'bold')).pack(pady=10)
+        
+        frame = tk.Frame(ventana, padx=10, pady=10, bg=self.COLORES['fondo_principal'])
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        columnas_siigo = self.procesador.columnas_exportables(self.df_resultado)
+        columnas = ['CAMBIO'] + columnas_siigo
+        tree = ttk.Treeview(frame, columns=columnas, show='headings', height=20)
+        for col in columnas:
+            tree.heading(col, text=col)
+            tree.column(col, width=200 if col == 'OBSERVACIONES' else 100, anchor='center')
+        
+        # Máximo 500 filas por tipo de cambio en pantalla
+        for etiqueta, clave in [('Agregada', 'agregadas'), ('Eliminada', 'eliminadas'),
+                                ('Modificada', 'modificadas'), ('Antes', 'modificadas_antes')]:
+            df = diferencias[clave]
+            for row in df[[col for col in columnas_siigo if col in df.columns]].head(500).itertuples(index=False):
+                tree.insert('', tk.END, values=[etiqueta] + [self.formato_display(valor) for valor in row])
+        
+        scrollbar_y = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        scrollbar_x = ttk.Scrollbar(frame, orient=tk.HORIZONTAL, command=tree.xview)
+        tree.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+        tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar_y.grid(row=0, column=1, sticky='ns')
+        scrollbar_x.grid(row=1, column=0, sticky='ew')
+        frame.grid_rowconfigure(0, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+        
+        def exportar():
+            prefijo = "Compras" if tipo == "compras" else "Ventas"
+            destino = filedialog.asksaveasfilename(
+                parent=ventana,
+                defaultextension=".xlsx",
+                filetypes=[("Excel", "*.xlsx")],
+                initialfile=f"{prefijo}_Siigo_cambios_{periodo}.xlsx")
+            if destino:
+                self.procesador.exportar_diferencias(diferencias, destino)
+                self.log(f"✅ Cambios guardados: {destino}")
+        
+        def guardar_corrida():
+            self.espacio.guardar_corrida(cliente['id'], periodo, tipo, self.df_resultado)
+            self.log(f"🆚 Corrida guardada: {cliente['nombre']} {tipo} {periodo}")
+            boton_corrida.config(state=tk.DISABLED)
+        
+        frame_acciones = tk.Frame(ventana, bg=self.COLORES['fondo_principal'])
+        frame_acciones.pack(pady=5)
+        tk.Button(frame_acciones, text="💾 Exportar cambios", command=exportar,
+                 state=tk.DISABLED if diferencias['sin_cambios'] else tk.NORMAL,
+                 bg=self.COLORES['boton_exito'], fg='white',
+                 font=('Helvetica', 10, 'bold'), padx=15, pady=5,
+                 cursor='hand2').pack(side=tk.LEFT, padx=5)
+        boton_corrida = tk.Button(frame_acciones, text="📌 Guardar como corrida importada", command=guardar_corrida,
+                                  bg=self.COLORES['boton_accion'], fg='white',
+                                  font=('Helvetica', 10, 'bold'), padx=15, pady=5,
+                                  cursor='hand2')
+        boton_corrida.pack(side=tk.LEFT, padx=5)
+    
+    def facturas_exportadas(self):
+        """Registra en el índice las facturas del resultado una vez guardado o enviado"""
+        if self.procesador.indice_facturas is None or self.procesador.huellas_leidas is None:
+            return
+        try:
+            nuevas = self.procesador.registrar_facturas()
+            self.log(f"🔁 {nuevas} facturas registradas como procesadas")
+        except (OSError, TimeoutError) as e:
+            self.log(f"⚠️ No se pudo actualizar el índice de facturas ({e})")
+    
     def guardar_excel(self):
         """Guarda el resultado en Excel con formato colombiano EXACTO"""
         if self.df_resultado is None:
@@ -962,135 +4005,343 @@ class AplicacionDIAN:
         tipo = self.tipo_var.get()
         prefijo = "Compras" if tipo == "compras" else "Ventas"
         
-        archivo = filedialog.asksaveasfilename(
-            defaultextension=".xlsx",
-            filetypes=[("Excel", "*.xlsx")],
-            initialfile=f"{prefijo}_Siigo_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        )
+        archivo = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel", "*.xlsx")],
+            initialfile=f"{prefijo}_Siigo_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        )
+        
+        if archivo:
+            try:
+                df_export = self.df_resultado[self.procesador.columnas_exportables(self.df_resultado)]
+                
+                if len(df_export) > self.procesador.MAX_FILAS_HOJA:
+                    # Supera el límite de filas de Excel: partir en varias hojas del mismo libro
+                    manifiesto = self.procesador.exportar_particiones(
+                        self.df_resultado, archivo, por_periodo=False, en_hojas=True)
+                    self.log(f"Resultado dividido en {len(manifiesto)} hojas (límite de Excel)")
+                else:
+                    escribir_libro_siigo(archivo, [('Siigo', df_export)])
+                
+                self.log(f"✅ Excel guardado: {archivo}")
+                self.facturas_exportadas()
+                self.log("✅ Valores guardados como ENTEROS (redondeados al peso)")
+                self.log("✅ Formato colombiano EXACTO: #.##0,00")
+                
+                if messagebox.askyesno("Éxito", 
+                    "Archivo guardado exitosamente.\n\n"
+                    "✅ Todos los valores redondeados al peso más cercano\n"
+                    "✅ Formato colombiano EXACTO: 200.000,00\n"
+                    "✅ Listo para usar en Siigo\n\n"
+                    "¿Deseas abrir el archivo ahora?"):
+                    os.startfile(archivo)
+                    
+            except Exception as e:
+                self.log(f"❌ Error guardando: {str(e)}")
+                messagebox.showerror("Error", f"No se pudo guardar:\n{str(e)}")
+    
+    def exportar_a_plantilla(self):
+        """Escribe el resultado dentro de una plantilla de importación de Siigo existente"""
+        if self.df_resultado is None:
+            return
+        
+        plantilla = filedialog.askopenfilename(
+            title="Plantilla de importación de Siigo",
+            filetypes=[("Excel", "*.xlsx")]
+        )
+        if not plantilla:
+            return
+        
+        try:
+            hojas = [nombre for nombre, _ in hojas_plantilla(plantilla)]
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo leer la plantilla:\n{str(e)}")
+            return
+        
+        hoja = simpledialog.askstring("Plantilla", f"Hoja destino ({', '.join(hojas)}):",
+                                      initialvalue=hojas[0] if hojas else '', parent=self.root)
+        if not hoja:
+            return
+        celda = simpledialog.askstring("Plantilla", "Celda donde empiezan los datos:",
+                                       initialvalue='A2', parent=self.root)
+        if not celda:
+            return
+        
+        archivo = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel", "*.xlsx")],
+            initialfile=f"{Path(plantilla).stem}_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        )
+        if not archivo:
+            return
+        if Path(archivo).resolve() == Path(plantilla).resolve():
+            messagebox.showerror("Error", "Guarda el resultado con otro nombre para conservar la plantilla.")
+            return
+        
+        try:
+            df_export = self.df_resultado[self.procesador.columnas_exportables(self.df_resultado)]
+            escribir_en_plantilla(plantilla, archivo, df_export, hoja=hoja, celda_inicio=celda)
+            self.log(f"✅ {len(df_export)} filas escritas en '{hoja}' desde {celda.upper()}: {archivo}")
+            self.facturas_exportadas()
+            if messagebox.askyesno("Éxito", 
+                f"Se escribieron {len(df_export)} filas en la plantilla.\n\n"
+                f"¿Deseas abrir el archivo ahora?"):
+                os.startfile(archivo)
+        except Exception as e:
+            self.log(f"❌ Error escribiendo en la plantilla: {str(e)}")
+            messagebox.showerror("Error", f"No se pudo escribir en la plantilla:\n{str(e)}")
+    
+    def exportar_por_mes(self):
+        """Exporta un libro por mes de emisión (escritos en paralelo) y un manifiesto de totales"""
+        if self.df_resultado is None:
+            return
+        
+        tipo = self.tipo_var.get()
+        prefijo = "Compras" if tipo == "compras" else "Ventas"
+        
+        archivo = filedialog.asksaveasfilename(
+            title="Nombre base de los archivos por mes",
+            defaultextension=".xlsx",
+            filetypes=[("Excel", "*.xlsx")],
+            initialfile=f"{prefijo}_Siigo_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        )
+        
+        if archivo:
+            try:
+                self.log("Exportando por mes de emisión...")
+                manifiesto = self.procesador.exportar_particiones(self.df_resultado, archivo, por_periodo=True)
+                for fila in manifiesto.itertuples(index=False):
+                    self.log(f"  {fila.PARTICION}: {fila.FILAS} filas → {fila.ARCHIVO}")
+                self.log(f"✅ {len(manifiesto)} archivos guardados en {Path(archivo).parent}")
+                self.facturas_exportadas()
+                messagebox.showinfo("Éxito", 
+                    f"Se guardaron {len(manifiesto)} archivos (uno por mes).\n\n"
+                    f"El manifiesto con los totales por mes está en:\n"
+                    f"{Path(archivo).stem}_manifiesto.csv")
+            except Exception as e:
+                self.log(f"❌ Error exportando: {str(e)}")
+                messagebox.showerror("Error", f"No se pudo exportar:\n{str(e)}")
+    
+    def enviar_a_siigo(self):
+        """Publica los comprobantes directamente en la API de Siigo (por lotes, con reintentos)"""
+        if self.df_resultado is None:
+            return
+        
+        if 'DOCUMENTO' not in self.df_resultado.columns:
+            messagebox.showerror("Error", "El envío a Siigo requiere el detalle por factura "
+                                          "(desactiva la consolidación)")
+            return
+        
+        # La API solo acepta códigos PUC: pedir una cuenta por cada una que no lo sea (p. ej. '14, 51, 61')
+        cuentas = {}
+        for cuenta in self.procesador.cuentas_no_puc(self.df_resultado):
+            codigo = simpledialog.askstring("Siigo",
+                f"La cuenta '{cuenta}' no es un código PUC y la API de Siigo la rechazaría.\n\n"
+                f"Cuenta (solo dígitos) a usar en su lugar:",
+                parent=self.root)
+            if not codigo:
+                return
+            cuentas[cuenta] = codigo.strip()
+        
+        # Las compras no llevan la línea de proveedores: sus comprobantes necesitan contrapartida
+        cuenta_contrapartida = None
+        descuadre = self.procesador.descuadre_por_documento(self.df_resultado)
+        if (descuadre != 0).any():
+            cuenta_contrapartida = simpledialog.askstring("Siigo",
+                f"{int((descuadre != 0).sum())} facturas no cuadran (débitos ≠ créditos) "
+                f"y Siigo las rechazaría.\n\n"
+                f"Cuenta de contrapartida para cuadrarlas"
+                f"{' (proveedores)' if self.tipo_actual == 'compras' else ''}:",
+                initialvalue='22050501' if self.tipo_actual == 'compras' else '',
+                parent=self.root)
+            if not cuenta_contrapartida:
+                return
+        
+        usuario = simpledialog.askstring("Siigo", "Usuario de la API:",
+                                         initialvalue=os.environ.get('SIIGO_USUARIO', ''), parent=self.root)
+        if not usuario:
+            return
+        access_key = simpledialog.askstring("Siigo", "Access key:", show='*',
+                                            initialvalue=os.environ.get('SIIGO_ACCESS_KEY', ''), parent=self.root)
+        if not access_key:
+            return
+        id_documento = simpledialog.askinteger("Siigo", "Id del tipo de comprobante contable (CC):",
+                                               parent=self.root)
+        if not id_documento:
+            return
+        url_base = os.environ.get('SIIGO_URL', 'https://api.siigo.com')
+        
+        try:
+            comprobantes = self.procesador.construir_comprobantes(self.df_resultado, id_documento,
+                                                                  cuenta_contrapartida=cuenta_contrapartida,
+                                                                  cuentas=cuentas)
+        except Exception as e:
+            self.log(f"❌ Error enviando a Siigo: {str(e)}")
+            messagebox.showerror("Error", f"No se pudo enviar a Siigo:\n{str(e)}")
+            return
+        self.log(f"Enviando {len(comprobantes)} comprobantes a {url_base}...")
+        self.progress['value'] = 0
+        
+        # El envío corre en un hilo aparte; la ventana lee su avance de una cola (ver esperar_envio)
+        avance = queue.Queue()
+        
+        def enviar():
+            try:
+                cliente = ClienteSiigo(usuario, access_key, url_base=url_base)
+                try:
+                    resultados = cliente.publicar_comprobantes(
+                        comprobantes, progreso=lambda *datos: avance.put(('progreso', datos)))
+                finally:
+                    cliente.cerrar()
+                avance.put(('fin', resultados))
+            except Exception as e:
+                avance.put(('error', e))
+        
+        self.btn_siigo.config(state=tk.DISABLED)
+        threading.Thread(target=enviar, daemon=True).start()
+        self.esperar_envio(avance)
+    
+    def esperar_envio(self, avance):
+        """Muestra el avance del envío a Siigo sin bloquear la ventana"""
+        while True:
+            try:
+                evento, datos = avance.get_nowait()
+            except queue.Empty:
+                self.root.after(200, self.esperar_envio, avance)
+                return
+            if evento == 'progreso':
+                enviados, total, resultados_lote = datos
+                errores = sum(1 for r in resultados_lote if r['estado'] == 'error')
+                self.progress['value'] = 100 * enviados / total
+                self.log(f"  {enviados}/{total} enviados" + (f" ({errores} con error en el lote)" if errores else ""))
+                continue
+            break
+        
+        self.btn_siigo.config(state=tk.NORMAL)
+        if evento == 'error':
+            self.log(f"❌ Error enviando a Siigo: {str(datos)}")
+            messagebox.showerror("Error", f"No se pudo enviar a Siigo:\n{str(datos)}")
+            return
+        
+        resultados = datos
+        conteo = resultados['estado'].value_counts()
+        for fila in resultados[resultados['estado'] == 'error'].head(20).itertuples(index=False):
+            self.log(f"❌ {fila.documento}: {fila.error}")
+        self.log(f"✅ Siigo: {conteo.get('creado', 0)} creados, {conteo.get('duplicado', 0)} ya existían, "
+                 f"{conteo.get('error', 0)} con error")
+        if conteo.get('creado', 0) or conteo.get('duplicado', 0):
+            self.facturas_exportadas()
+        messagebox.showinfo("Siigo",
+            f"Comprobantes creados: {conteo.get('creado', 0)}\n"
+            f"Ya existían (no duplicados): {conteo.get('duplicado', 0)}\n"
+            f"Con error: {conteo.get('error', 0)}")
+    
+    def conciliar_con_siigo(self):
+        """Concilia las facturas procesadas contra un auxiliar contable exportado de Siigo"""
+        if self.df_facturas is None:
+            return
+        
+        archivo = filedialog.askopenfilename(
+            title="Seleccionar auxiliar contable exportado de Siigo",
+            filetypes=[
+                ("Archivos Excel", "*.xlsx *.xls"),
+                ("Archivos CSV", "*.csv"),
+                ("Todos los archivos", "*.*")
+            ]
+        )
+        if not archivo:
+            return
+        
+        sugerida = '2205' if self.tipo_actual == 'compras' else '1305'
+        cuentas = simpledialog.askstring(
+            "Conciliación", "Cuentas del auxiliar a conciliar (prefijos separados por coma,\n"
+                            "vacío = todas):", initialvalue=sugerida, parent=self.root)
+        if cuentas is None:
+            return
+        cuentas = [c.strip() for c in cuentas.split(',') if c.strip()]
+        
+        try:
+            self.log(f"Leyendo auxiliar de Siigo: {Path(archivo).name}")
+            df_auxiliar = self.procesador.leer_auxiliar_siigo(archivo, cuentas=cuentas or None)
+            self.log(f"Movimientos del auxiliar: {len(df_auxiliar)}")
+            reporte = self.procesador.conciliar_siigo(self.df_facturas, df_auxiliar, self.tipo_actual)
+        except Exception as e:
+            self.log(f"❌ Error conciliando: {str(e)}")
+            messagebox.showerror("Error", f"No se pudo conciliar:\n{str(e)}")
+            return
+        
+        totales = reporte['totales']
+        pendientes = [f"{estado}: {totales[estado]}" for estado in reporte['detalle']['ESTADO'].cat.categories
+                      if estado != 'Conciliado' and totales[estado]]
+        self.log(f"⚖ Conciliadas: {totales['Conciliado']}" + (f" | {' | '.join(pendientes)}" if pendientes else ""))
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Conciliación DIAN ↔ Siigo")
+        ventana.geometry("1200x600")
+        ventana.configure(bg=self.COLORES['fondo_principal'])
+        
+        estado = "✅ Todo conciliado" if reporte['conciliado'] else "⚠️ Hay diferencias"
+        tk.Label(ventana, text=f"{estado}\n"
+                              f"Facturas DIAN: {totales['facturas_dian']} "
+                              f"({self.procesador.formato_pesos_display(totales['valor_dian'])})   "
+                              f"Movimientos Siigo: {totales['movimientos_siigo']} "
+                              f"({self.procesador.formato_pesos_display(totales['valor_siigo'])})\n"
+                              f"Conciliadas: {totales['Conciliado']}   " + '   '.join(pendientes),
+                fg=self.COLORES['texto_principal'],
+                bg=self.COLORES['fondo_principal'],
+                font=('Helvetica', 11, 'bold'),
+                justify=tk.LEFT).pack(pady=10)
+        
+        frame = tk.Frame(ventana, padx=10, pady=10, bg=self.COLORES['fondo_principal'])
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        detalle = reporte['detalle']
+        columnas = list(detalle.columns)
+        tree = ttk.Treeview(frame, columns=columnas, show='headings', height=20)
+        for col in columnas:
+            tree.heading(col, text=col)
+            tree.column(col, width=150 if col in ['ESTADO', 'DOCUMENTO'] else 100, anchor='center')
+        
+        # Diferencias primero (el detalle ya viene ordenado); máximo 500 filas en pantalla
+        for row in detalle.head(500).itertuples(index=False):
+            valores = []
+            for col, valor in zip(columnas, row):
+                if col in ['VALOR_DIAN', 'VALOR_SIIGO', 'DIFERENCIA']:
+                    valores.append(self.formato_display(valor))
+                elif col in ['FECHA_DIAN', 'FECHA_SIIGO']:
+                    valores.append(valor.strftime('%d/%m/%Y') if pd.notna(valor) else '')
+                else:
+                    valores.append(str(valor) if pd.notna(valor) else '')
+            tree.insert('', tk.END, values=valores)
+        
+        scrollbar_y = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar_y.set)
+        tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar_y.grid(row=0, column=1, sticky='ns')
+        frame.grid_rowconfigure(0, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+        
+        def exportar():
+            destino = filedialog.asksaveasfilename(
+                parent=ventana,
+                defaultextension=".csv",
+                filetypes=[("CSV", "*.csv")],
+                initialfile=f"Conciliacion_{datetime.now().strftime('%Y%m%d')}.csv")
+            if destino:
+                detalle.to_csv(destino, index=False, sep=';', encoding='utf-8-sig', date_format='%d/%m/%Y')
+                self.log(f"✅ Conciliación guardada: {destino}")
         
-        if archivo:
-            try:
-                from openpyxl import Workbook
-                from openpyxl.styles import numbers
-                
-                # Crear un nuevo workbook
-                wb = Workbook()
-                ws = wb.active
-                ws.title = 'Siigo'
-                
-                # Escribir encabezados
-                for col_idx, col_name in enumerate(self.df_resultado.columns, start=1):
-                    ws.cell(row=1, column=col_idx, value=col_name)
-                
-                # Escribir datos - VALORES COMO ENTEROS (redondeados al peso)
-                for row_idx, row_data in enumerate(self.df_resultado.itertuples(index=False), start=2):
-                    for col_idx, (col_name, valor) in enumerate(zip(self.df_resultado.columns, row_data), start=1):
-                        cell = ws.cell(row=row_idx, column=col_idx)
-                        
-                        # Escribir valor según el tipo
-                        if col_name in ['DEBITO', 'CREDITO', 'VALOR_BASE']:
-                            if pd.notna(valor) and valor is not None:
-                                # Asegurar que sea entero
-                                cell.value = int(round(float(valor), 0))
-                                # Formato colombiano EXACTO: 200.000,00
-                                cell.number_format = '#.##0,00'
-                            else:
-                                cell.value = None
-                        elif col_name == 'H':
-                            if pd.notna(valor) and valor is not None and valor != '':
-                                cell.value = int(valor)
-                            else:
-                                cell.value = None
-                        else:
-                            cell.value = str(valor) if pd.notna(valor) and valor != '' else ''
-                
-                # Ajustar anchos de columna
-                for column in ws.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if cell.value:
-                                max_length = max(max_length, len(str(cell.value)))
-                        except:
-                            pass
-                    ws.column_dimensions[column_letter].width = min(max_length + 2, 50)
-                
-                # Guardar archivo
-                wb.save(archivo)
-                
-                self.log(f"✅ Excel guardado: {archivo}")
-                self.log("✅ Valores guardados como ENTEROS (redondeados al peso)")
-                self.log("✅ Formato colombiano EXACTO: #.##0,00")
-                
-                if messagebox.askyesno("Éxito", 
-                    "Archivo guardado exitosamente.\n\n"
-                    "✅ Todos los valores redondeados al peso más cercano\n"
-                    "✅ Formato colombiano EXACTO: 200.000,00\n"
-                    "✅ Listo para usar en Siigo\n\n"
-                    "¿Deseas abrir el archivo ahora?"):
-                    os.startfile(archivo)
-                    
-            except Exception as e:
-                self.log(f"❌ Error guardando: {str(e)}")
-                messagebox.showerror("Error", f"No se pudo guardar:\n{str(e)}")
+        tk.Button(ventana, text="💾 Exportar detalle", command=exportar,
+                 bg=self.COLORES['boton_exito'], fg='white',
+                 font=('Helvetica', 10, 'bold'), padx=15, pady=5,
+                 cursor='hand2').pack(pady=5)
     
     def mostrar_power_query(self):
         """Muestra código Power Query con valores enteros"""
         if self.df_resultado is None:
             return
         
-        # Crear copia del dataframe para formatear valores en el código M
-        df_display = self.df_resultado.copy()
-        
-        # Generar código M
-        filas = []
-        for idx, row in df_display.iterrows():
-            valores = []
-            for col_name, v in zip(df_display.columns, row.values):
-                if col_name in ['DEBITO', 'CREDITO', 'VALOR_BASE']:
-                    if pd.isna(v) or v is None:
-                        valores.append('null')
-                    else:
-                        # Convertir a entero (ya redondeado)
-                        valores.append(str(int(round(float(v), 0))))
-                elif col_name == 'H':
-                    if pd.isna(v) or v is None or v == '':
-                        valores.append('null')
-                    else:
-                        valores.append(str(int(v)))
-                else:
-                    if pd.isna(v) or v == '':
-                        valores.append('null')
-                    else:
-                        valores.append(f'"{str(v)}"')
-            filas.append(f"    {{ {', '.join(valores)} }}")
-        
-        datos = ",\n".join(filas)
-        headers = ", ".join([f'"{col}"' for col in df_display.columns])
-        
-        codigo_m = f"""let
-    Origen = #table(
-        {{ {headers} }},
-        {{
-{datos}
-        }}
-    ),
-    TipoCambiado = Table.TransformColumnTypes(Origen,{{
-        {{"CUENTA", type text}}, 
-        {{"CC", type text}}, 
-        {{"OBSERVACIONES", type text}}, 
-        {{"DEBITO", Int64.Type}}, 
-        {{"CREDITO", Int64.Type}}, 
-        {{"VALOR_BASE", Int64.Type}},
-        {{"TERCERO", type text}}, 
-        {{"H", Int64.Type}}
-    }}),
-    Limpieza = Table.ReplaceValue(TipoCambiado,null,null,Replacer.ReplaceValue,
-        {{"DEBITO", "CREDITO", "H", "VALOR_BASE"}}),
-    Filtrado = Table.SelectRows(Limpieza, each ([CUENTA] <> null))
-in
-    Filtrado"""
+        codigo_m = self.procesador.generar_codigo_m(self.df_resultado)
         
         ventana = tk.Toplevel(self.root)
         ventana.title("Código Power Query (M)")
@@ -1126,7 +4377,1284 @@ in
                  activeforeground='white').pack(pady=10)
 
 
+def _trabajo_conversion(ruta_archivo, carpeta_salida, opciones):
+    """
+    Convierte un archivo DIAN y deja las salidas en `carpeta_salida` (Excel, CSV y M).
+    Función de módulo para ejecutarse en un pool de procesos; el log queda en
+    opciones['log'] (por defecto log.txt). Devuelve un resumen serializable del resultado.
+    """
+    carpeta_salida = Path(carpeta_salida)
+    ruta_log = carpeta_salida / opciones.get('log', 'log.txt')
+    with open(ruta_log, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        procesador = ProcesadorContableDIAN()
+        # Cuentas propias del cliente (espacio de trabajo)
+        procesador.CUENTAS_COMPRAS.update(opciones.get('cuentas_compras') or {})
+        procesador.CUENTAS_VENTAS.update(opciones.get('cuentas_ventas') or {})
+        if opciones.get('indice_facturas'):
+            procesador.indice_facturas = IndiceFacturas(opciones['indice_facturas'])
+            procesador.excluir_duplicados = opciones.get('excluir_duplicados', False)
+        argumentos = {'tipo': opciones.get('tipo', 'auto'),
+                      'consolidar': opciones.get('consolidar', False),
+                      'por_periodo': opciones.get('por_periodo', False)}
+        plan = procesador.planificar_conversion(ruta_archivo, opciones.get('presupuesto_memoria'))
+        if plan['modo'] == 'bloques':
+            conversion = procesador.convertir_por_bloques(ruta_archivo, tamano_bloque=plan['tamano_bloque'],
+                                                          **argumentos)
+        else:
+            conversion = procesador.convertir(ruta_archivo, **argumentos)
+        prefijo = "Compras" if conversion['tipo'] == "compras" else "Ventas"
+        nombre = Path(ruta_archivo)
+        nombre_base = f"{prefijo}_Siigo_{Path(nombre.stem).stem if nombre.suffix.lower() == '.gz' else nombre.stem}"
+        rutas = procesador.guardar_salidas(conversion['resultado'], carpeta_salida, nombre_base,
+                                           opciones.get('formatos', ('xlsx', 'csv', 'm')))
+        # Las facturas cuentan como procesadas solo con las salidas ya escritas
+        procesador.registrar_facturas()
+        if conversion['resumen'] is not None:
+            for clave, tabla in conversion['resumen'].items():
+                rutas[clave] = carpeta_salida / f"{nombre_base}_{clave}.csv"
+                tabla.to_csv(rutas[clave], index=False, sep=';', encoding='utf-8-sig')
+        cambios = None
+        anterior = (opciones.get('corridas_anteriores') or {}).get(conversion['tipo'])
+        if anterior and Path(anterior).exists():
+            diferencias = procesador.comparar_resultados(pd.read_pickle(anterior), conversion['resultado'])
+            rutas['cambios'] = procesador.exportar_diferencias(
+                diferencias, carpeta_salida / f"{nombre_base}_cambios.xlsx")
+            cambios = diferencias['totales']
+        if opciones.get('guardar_corrida'):
+            rutas['corrida'] = carpeta_salida / 'corrida.pkl'
+            conversion['resultado'].to_pickle(rutas['corrida'])
+    
+    totales = conversion['validacion']['totales']
+    return {
+        'tipo': conversion['tipo'],
+        'facturas': conversion['n_facturas'],
+        'filas': len(conversion['resultado']),
+        'archivos': {formato: ruta.name for formato, ruta in rutas.items()},
+        'validacion': {clave: int(valor) for clave, valor in totales.items()},
+        'terceros': (procesador.totales_resumen(conversion['resumen'])
+                     if conversion['resumen'] is not None else None),
+        'cambios': cambios,
+        'corrida': rutas['corrida'].name if 'corrida' in rutas else None,
+    }
+
+
+def _conversion_compartida(ruta_archivo, opciones):
+    """
+    Conversión por bloques en un proceso aparte (para la interfaz). El resultado y el detalle por
+    factura de la validación se publican con publicar_resultado: de vuelta solo viajan sus
+    descriptores, no los DataFrames serializados. Función de módulo para ejecutarse en un pool de procesos.
+    """
+    procesador = ProcesadorContableDIAN()
+    procesador.CUENTAS_COMPRAS.update(opciones.get('cuentas_compras') or {})
+    procesador.CUENTAS_VENTAS.update(opciones.get('cuentas_ventas') or {})
+    if opciones.get('indice_facturas'):
+        procesador.indice_facturas = IndiceFacturas(opciones['indice_facturas'])
+        procesador.excluir_duplicados = opciones.get('excluir_duplicados', False)
+    conversion = procesador.convertir_por_bloques(
+        ruta_archivo, tipo=opciones.get('tipo', 'auto'),
+        consolidar=opciones.get('consolidar', False), por_periodo=opciones.get('por_periodo', False),
+        tamano_bloque=opciones.get('tamano_bloque'), reanudar=opciones.get('reanudar', True))
+    validacion = dict(conversion['validacion'], por_factura=publicar_resultado(conversion['validacion']['por_factura']))
+    return dict(conversion, resultado=publicar_resultado(conversion['resultado']), validacion=validacion)
+
+
+class ErrorSiigo(Exception):
+    """Error definitivo de la API de Siigo (no se reintenta)"""
+    
+    def __init__(self, mensaje, estado=None, datos=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.datos = datos
+
+
+class ClienteSiigo:
+    """
+    Cliente de la API de Siigo para publicar comprobantes contables:
+    - Pool de conexiones HTTP keep-alive reutilizadas entre peticiones
+    - Concurrencia limitada al tamaño del pool
+    - Reintentos con espera exponencial (y Retry-After) ante 429, 5xx y fallos de red
+    - Idempotency-Key por factura para que un reintento no duplique el comprobante
+    Un comprobante solo se informa como ya existente cuando la API lo dice explícitamente
+    (encabezado Idempotent-Replayed: true, o 409 con un código de duplicado); cualquier otra
+    respuesta 2xx es un comprobante creado.
+    """
+    
+    ESTADOS_REINTENTABLES = {408, 425, 429, 500, 502, 503, 504}
+    CODIGOS_DUPLICADO = {'duplicate', 'duplicated', 'already_exists'}
+    
+    def __init__(self, usuario, access_key, url_base='https://api.siigo.com', partner_id='DIANaSiigo',
+                 max_conexiones=4, reintentos=4, espera_base=0.5, tiempo_espera=30):
+        url = urllib.parse.urlsplit(url_base)
+        self.esquema = url.scheme
+        self.host = url.hostname
+        self.puerto = url.port
+        self.prefijo = url.path.rstrip('/')
+        self.usuario = usuario
+        self.access_key = access_key
+        self.partner_id = partner_id
+        self.max_conexiones = max_conexiones
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.tiempo_espera = tiempo_espera
+        self.token = None
+        self._bloqueo_token = threading.Lock()
+        self._conexiones = queue.LifoQueue()
+        for _ in range(max_conexiones):
+            self._conexiones.put(None)  # se crean bajo demanda
+    
+    def _nueva_conexion(self):
+        clase = http.client.HTTPSConnection if self.esquema == 'https' else http.client.HTTPConnection
+        return clase(self.host, self.puerto, timeout=self.tiempo_espera)
+    
+    def _enviar(self, metodo, ruta, datos=None, headers=None):
+        """Una petición sobre una conexión del pool. Devuelve (estado, headers, json)"""
+        conexion = self._conexiones.get()
+        try:
+            if conexion is None:
+                conexion = self._nueva_conexion()
+            cuerpo = json.dumps(datos).encode('utf-8') if datos is not None else None
+            encabezados = {'Content-Type': 'application/json', 'Connection': 'keep-alive',
+                           'Partner-Id': self.partner_id, **(headers or {})}
+            conexion.request(metodo, self.prefijo + ruta, body=cuerpo, headers=encabezados)
+            respuesta = conexion.getresponse()
+            contenido = respuesta.read()
+            if respuesta.getheader('Connection', '').lower() == 'close':
+                conexion.close()
+                conexion = None
+            try:
+                datos_respuesta = json.loads(contenido) if contenido else {}
+            except ValueError:
+                datos_respuesta = {'texto': contenido.decode('utf-8', 'replace')}
+            return respuesta.status, respuesta, datos_respuesta
+        except (OSError, http.client.HTTPException):
+            if conexion is not None:
+                conexion.close()
+            conexion = None
+            raise
+        finally:
+            self._conexiones.put(conexion)
+    
+    def _solicitud(self, metodo, ruta, datos=None, headers=None, autenticada=True):
+        """Petición con reintentos (espera exponencial con variación aleatoria). Devuelve (estado, json, intentos, respuesta)"""
+        renovo_token = False
+        for intento in range(1, self.reintentos + 2):
+            espera = self.espera_base * (2 ** (intento - 1)) * (0.5 + random.random())
+            try:
+                encabezados = dict(headers or {})
+                if autenticada:
+                    encabezados['Authorization'] = f"Bearer {self.obtener_token()}"
+                estado, respuesta, datos_respuesta = self._enviar(metodo, ruta, datos, encabezados)
+            except (OSError, http.client.HTTPException) as e:
+                if intento > self.reintentos:
+                    raise ErrorSiigo(f"Error de conexión: {e}")
+                time.sleep(espera)
+                continue
+            
+            if estado < 300:
+                return estado, datos_respuesta, intento, respuesta
+            if estado == 401 and autenticada and not renovo_token:
+                # Token vencido: renovar una vez y repetir
+                self.token = None
+                renovo_token = True
+                continue
+            if estado in self.ESTADOS_REINTENTABLES and intento <= self.reintentos:
+                reintentar_en = respuesta.getheader('Retry-After')
+                if reintentar_en and reintentar_en.isdigit():
+                    espera = max(espera, float(reintentar_en))
+                time.sleep(espera)
+                continue
+            raise ErrorSiigo(f"HTTP {estado}: {datos_respuesta}", estado, datos_respuesta)
+        raise ErrorSiigo("Se agotaron los reintentos")
+    
+    def obtener_token(self):
+        """Autentica una sola vez (compartido entre hilos) y devuelve el token de acceso"""
+        with self._bloqueo_token:
+            if self.token is None:
+                _, datos, _, _ = self._solicitud('POST', '/auth',
+                                                 {'username': self.usuario, 'access_key': self.access_key},
+                                                 autenticada=False)
+                self.token = datos['access_token']
+            return self.token
+    
+    def publicar_comprobante(self, comprobante):
+        """Publica un comprobante; devuelve el resultado (nunca lanza excepción)"""
+        documento = comprobante['documento']
+        try:
+            _, datos, intentos, respuesta = self._solicitud(
+                'POST', '/v1/journals', comprobante['cuerpo'],
+                headers={'Idempotency-Key': comprobante['idempotency_key']})
+            repetido = (respuesta.getheader('Idempotent-Replayed') or '').lower() == 'true'
+            return {'documento': documento, 'estado': 'duplicado' if repetido else 'creado',
+                    'id': datos.get('id'), 'intentos': intentos, 'error': None}
+        except ErrorSiigo as e:
+            errores = e.datos.get('Errors', []) if isinstance(e.datos, dict) else []
+            codigos = {str(error.get('Code', '')).lower() for error in errores if isinstance(error, dict)}
+            if e.estado == 409 and codigos & self.CODIGOS_DUPLICADO:
+                return {'documento': documento, 'estado': 'duplicado', 'id': None, 'intentos': 1, 'error': None}
+            return {'documento': documento, 'estado': 'error', 'id': None,
+                    'intentos': self.reintentos + 1, 'error': str(e)}
+        except Exception as e:
+            return {'documento': documento, 'estado': 'error', 'id': None,
+                    'intentos': self.reintentos + 1, 'error': str(e)}
+    
+    def publicar_comprobantes(self, comprobantes, tamano_lote=50, progreso=None):
+        """
+        Publica los comprobantes por lotes; dentro de cada lote se envían en paralelo
+        (máximo `max_conexiones` a la vez). `progreso(enviados, total, resultados_lote)`
+        se llama al terminar cada lote. Devuelve un DataFrame con el resultado por factura.
+        """
+        resultados = []
+        with ThreadPoolExecutor(max_workers=self.max_conexiones) as pool:
+            for inicio in range(0, len(comprobantes), tamano_lote):
+                lote = comprobantes[inicio:inicio + tamano_lote]
+                resultados_lote = list(pool.map(self.publicar_comprobante, lote))
+                resultados.extend(resultados_lote)
+                if progreso:
+                    progreso(len(resultados), len(comprobantes), resultados_lote)
+        return pd.DataFrame(resultados, columns=['documento', 'estado', 'id', 'intentos', 'error'])
+    
+    def cerrar(self):
+        while not self._conexiones.empty():
+            conexion = self._conexiones.get()
+            if conexion is not None:
+                conexion.close()
+
+
+class ServidorSiigoSimulado:
+    """
+    Servidor local que imita /auth y /v1/journals de la API de Siigo, para probar
+    el envío sin conexión: respeta Idempotency-Key (al repetir responde 200 con
+    Idempotent-Replayed: true), rechaza
+    comprobantes descuadrados (400) y puede fallar al azar con 429/503 (`tasa_fallos`)
+    para ejercitar los reintentos.
+    """
+    
+    def __init__(self, puerto=0, tasa_fallos=0.0, latencia=0.0):
+        self.tasa_fallos = tasa_fallos
+        self.latencia = latencia
+        self.comprobantes = {}
+        self.peticiones = 0
+        self.bloqueo = threading.Lock()
+        simulado = self
+        
+        class Manejador(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def log_message(self, *args):
+                pass
+            
+            def responder(self, estado, datos, extra=None):
+                cuerpo = json.dumps(datos).encode('utf-8')
+                self.send_response(estado)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                for clave, valor in (extra or {}).items():
+                    self.send_header(clave, valor)
+                self.end_headers()
+                self.wfile.write(cuerpo)
+            
+            def do_POST(self):
+                datos = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with simulado.bloqueo:
+                    simulado.peticiones += 1
+                if simulado.latencia:
+                    time.sleep(simulado.latencia)
+                if self.path == '/auth':
+                    self.responder(200, {'access_token': 'token-simulado', 'expires_in': 86400})
+                    return
+                if self.path != '/v1/journals':
+                    self.responder(404, {'Errors': [{'Code': 'not_found'}]})
+                    return
+                if self.headers.get('Authorization') != 'Bearer token-simulado':
+                    self.responder(401, {'Errors': [{'Code': 'unauthorized'}]})
+                    return
+                if random.random() < simulado.tasa_fallos:
+                    self.responder(random.choice([429, 503]), {'Errors': [{'Code': 'retry'}]},
+                                   {'Retry-After': '0'})
+                    return
+                items = datos.get('items', [])
+                if sum(i['value'] if i['account']['movement'] == 'Debit' else -i['value'] for i in items) != 0:
+                    self.responder(400, {'Errors': [{'Code': 'invalid_balance',
+                                                     'Message': 'Debits and credits must be equal'}]})
+                    return
+                clave = self.headers.get('Idempotency-Key')
+                with simulado.bloqueo:
+                    if clave in simulado.comprobantes:
+                        self.responder(200, simulado.comprobantes[clave], {'Idempotent-Replayed': 'true'})
+                        return
+                    comprobante = {'id': str(uuid.uuid4()), 'name': f"CC-{len(simulado.comprobantes) + 1}",
+                                   'items': len(datos.get('items', []))}
+                    simulado.comprobantes[clave] = comprobante
+                self.responder(201, comprobante)
+        
+        self.servidor = http.server.ThreadingHTTPServer(('127.0.0.1', puerto), Manejador)
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+    
+    def iniciar(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+    
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class ServidorConversion:
+    """
+    Servicio HTTP local (asyncio) para convertir archivos DIAN desde el navegador.
+    Las conversiones corren en un pool de procesos acotado; si la cola está llena
+    responde 503 (Retry-After) en lugar de aceptar más trabajo.
+    
+    Rutas:
+    - GET  /                          formulario de carga
+    - POST /trabajos                  sube un archivo (multipart 'archivo' o cuerpo binario ?nombre=)
+    - GET  /trabajos                  lista de trabajos
+    - GET  /trabajos/<id>             estado del trabajo (JSON, o HTML desde el navegador)
+    - GET  /trabajos/<id>/<formato>   descarga xlsx, csv, m o log
+    El archivo subido se borra al terminar la conversión; las salidas y el trabajo se
+    eliminan `vigencia` segundos después (campo 'vence' del estado).
+    """
+    
+    EXTENSIONES_PERMITIDAS = ['.xlsx', '.xlsm', '.xls', '.xlsb', '.ods', '.csv'] + EXTENSIONES_COMPRIMIDAS
+    TIPOS_CONTENIDO = {
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'csv': 'text/csv; charset=utf-8',
+        'm': 'text/plain; charset=utf-8',
+        'terceros': 'text/csv; charset=utf-8',
+        'cuentas': 'text/csv; charset=utf-8',
+        'iva': 'text/csv; charset=utf-8',
+        'log': 'text/plain; charset=utf-8',
+    }
+    
+    def __init__(self, host='127.0.0.1', puerto=8765, trabajadores=None, max_pendientes=None,
+                 carpeta=None, max_bytes=200 * 1024 * 1024, memoria=None, vigencia=3600):
+        self.host = host
+        self.puerto = puerto
+        self.trabajadores = trabajadores or max(1, (os.cpu_count() or 2) - 1)
+        # El presupuesto de memoria se reparte entre las conversiones simultáneas
+        self.presupuesto_trabajo = (memoria or presupuesto_memoria()) // self.trabajadores
+        self.max_pendientes = max_pendientes or self.trabajadores * 4
+        self.carpeta = Path(carpeta) if carpeta else None
+        self.max_bytes = max_bytes
+        self.vigencia = vigencia
+        self.trabajos = {}
+        self.pendientes = 0
+        self.pool = None
+        self.servidor = None
+        self.semaforo = None
+        self.limpieza = None
+        self.carpeta_temporal = None
+    
+    def ejecutar(self):
+        """Arranca el servicio y atiende peticiones hasta Ctrl+C"""
+        try:
+            asyncio.run(self._ejecutar())
+        except KeyboardInterrupt:
+            print("\nServicio detenido")
+    
+    async def _ejecutar(self):
+        with tempfile.TemporaryDirectory(prefix='dian_siigo_') as temporal:
+            if self.carpeta is None:
+                self.carpeta = Path(temporal)
+            self.carpeta.mkdir(parents=True, exist_ok=True)
+            await self.iniciar()
+            try:
+                async with self.servidor:
+                    await self.servidor.serve_forever()
+            finally:
+                await self.detener()
+    
+    async def iniciar(self):
+        """Crea el pool de procesos y abre el socket (útil para pruebas dentro de otro loop)"""
+        if self.carpeta is None:
+            self.carpeta = self.carpeta_temporal = Path(tempfile.mkdtemp(prefix='dian_siigo_'))
+        self.pool = ProcessPoolExecutor(max_workers=self.trabajadores)
+        self.semaforo = asyncio.Semaphore(self.trabajadores)
+        self.limpieza = asyncio.get_running_loop().create_task(self._limpiar_periodicamente())
+        self.servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self.servidor.sockets[0].getsockname()[1]
+        print(f"Servicio DIAN → Siigo en http://{self.host}:{self.puerto} "
+              f"({self.trabajadores} procesos, cola máxima {self.max_pendientes})")
+    
+    async def detener(self):
+        """Cierra el socket y el pool, y borra la carpeta temporal creada por iniciar()"""
+        if self.limpieza is not None:
+            self.limpieza.cancel()
+        self.servidor.close()
+        self.pool.shutdown()
+        if self.carpeta_temporal is not None:
+            shutil.rmtree(self.carpeta_temporal, ignore_errors=True)
+    
+    async def _limpiar_periodicamente(self):
+        """Revisa los trabajos vencidos cada minuto (o antes si la vigencia es más corta)"""
+        while True:
+            await asyncio.sleep(max(1, min(60, self.vigencia // 2)))
+            self.limpiar_vencidos()
+    
+    def limpiar_vencidos(self, ahora=None):
+        """
+        Elimina los trabajos terminados (o con error) cuya vigencia pasó, con su carpeta.
+        Los que tienen una descarga en curso esperan a la siguiente revisión.
+        Devuelve cuántos eliminó.
+        """
+        ahora = (ahora or datetime.now()).isoformat(timespec='seconds')
+        vencidos = [trabajo for trabajo in self.trabajos.values()
+                    if trabajo.get('vence') and trabajo['vence'] <= ahora and not trabajo['descargando']]
+        for trabajo in vencidos:
+            shutil.rmtree(trabajo['carpeta'], ignore_errors=True)
+            del self.trabajos[trabajo['id']]
+        if vencidos:
+            print(f"🧹 {len(vencidos)} trabajos vencidos eliminados")
+        return len(vencidos)
+    
+    async def _atender(self, reader, writer):
+        """Atiende una petición HTTP/1.1 (una por conexión)"""
+        try:
+            encabezado = await reader.readuntil(b'\r\n\r\n')
+            lineas = encabezado.decode('latin-1').split('\r\n')
+            metodo, objetivo, _ = lineas[0].split(' ', 2)
+            headers = {}
+            for linea in lineas[1:]:
+                if ':' in linea:
+                    clave, valor = linea.split(':', 1)
+                    headers[clave.strip().lower()] = valor.strip()
+            url = urllib.parse.urlsplit(objetivo)
+            consulta = dict(urllib.parse.parse_qsl(url.query))
+            partes = [p for p in url.path.split('/') if p]
+            
+            if metodo == 'GET' and not partes:
+                await self._responder(writer, 200, self._pagina_inicio(), 'text/html; charset=utf-8')
+            elif metodo == 'POST' and partes == ['trabajos']:
+                await self._recibir_trabajo(reader, writer, headers, consulta)
+            elif metodo == 'GET' and partes == ['trabajos']:
+                await self._responder_json(writer, 200, [self._estado(t) for t in self.trabajos.values()])
+            elif metodo == 'GET' and len(partes) == 2 and partes[0] == 'trabajos':
+                await self._consultar_trabajo(writer, partes[1], headers)
+            elif metodo == 'GET' and len(partes) == 3 and partes[0] == 'trabajos':
+                await self._descargar(writer, partes[1], partes[2])
+            else:
+                await self._responder_json(writer, 404, {'error': 'Ruta no encontrada'})
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            await self._responder_json(writer, 400, {'error': f'Petición inválida: {e}'})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def _recibir_trabajo(self, reader, writer, headers, consulta):
+        """Recibe el archivo, lo encola en el pool y responde 202 con el id del trabajo"""
+        if self.pendientes >= self.max_pendientes:
+            await self._responder_json(writer, 503, {'error': 'Cola llena, intenta de nuevo en unos segundos'},
+                                       extra={'Retry-After': '5'})
+            return
+        if 'content-length' not in headers:
+            await self._responder_json(writer, 411, {'error': 'Falta Content-Length'})
+            return
+        longitud = int(headers['content-length'])
+        if longitud > self.max_bytes:
+            await self._responder_json(writer, 413, {'error': 'Archivo demasiado grande'})
+            return
+        
+        # Reservar el cupo antes de leer el cuerpo (contrapresión)
+        self.pendientes += 1
+        try:
+            cuerpo = await reader.readexactly(longitud)
+            tipo_contenido = headers.get('content-type', '')
+            if tipo_contenido.startswith('multipart/form-data'):
+                nombre, contenido, campos = self._leer_multipart(tipo_contenido, cuerpo)
+                consulta = {**consulta, **campos}
+            else:
+                nombre, contenido = consulta.get('nombre', 'archivo.xlsx'), cuerpo
+            
+            nombre = Path(nombre or '').name
+            if Path(nombre).suffix.lower() not in self.EXTENSIONES_PERMITIDAS:
+                raise ValueError(f"Extensión no soportada: '{nombre}'")
+            
+            id_trabajo = uuid.uuid4().hex[:12]
+            carpeta = self.carpeta / id_trabajo
+            carpeta.mkdir(parents=True)
+            ruta = carpeta / nombre
+            ruta.write_bytes(contenido)
+        except Exception:
+            self.pendientes -= 1
+            raise
+        
+        tipo = consulta.get('tipo', 'auto')
+        trabajo = {
+            'id': id_trabajo,
+            'archivo': nombre,
+            'estado': 'en cola',
+            'creado': datetime.now().isoformat(timespec='seconds'),
+            'carpeta': carpeta,
+            'ruta': ruta,
+            'opciones': {
+                'tipo': tipo if tipo in ('auto', 'compras', 'ventas') else 'auto',
+                'consolidar': consulta.get('consolidar') in ('1', 'on', 'true'),
+                'por_periodo': consulta.get('por_periodo') in ('1', 'on', 'true'),
+                'presupuesto_memoria': self.presupuesto_trabajo,
+            },
+            'resumen': None,
+            'error': None,
+            'vence': None,
+            'descargando': 0,
+        }
+        self.trabajos[id_trabajo] = trabajo
+        asyncio.get_running_loop().create_task(self._ejecutar_trabajo(trabajo))
+        
+        if 'text/html' in headers.get('accept', ''):
+            await self._responder(writer, 303, b'', 'text/plain', extra={'Location': f'/trabajos/{id_trabajo}'})
+        else:
+            await self._responder_json(writer, 202, self._estado(trabajo),
+                                       extra={'Location': f'/trabajos/{id_trabajo}'})
+    
+    async def _ejecutar_trabajo(self, trabajo):
+        """Ejecuta la conversión en el pool de procesos respetando el límite de trabajadores"""
+        try:
+            async with self.semaforo:
+                trabajo['estado'] = 'procesando'
+                inicio = time.perf_counter()
+                trabajo['resumen'] = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, _trabajo_conversion, str(trabajo['ruta']), str(trabajo['carpeta']),
+                    trabajo['opciones'])
+                trabajo['segundos'] = round(time.perf_counter() - inicio, 2)
+                trabajo['estado'] = 'terminado'
+        except Exception as e:
+            trabajo['estado'] = 'error'
+            trabajo['error'] = str(e)
+        finally:
+            self.pendientes -= 1
+            # El archivo subido ya no hace falta; las salidas quedan hasta que venza el trabajo
+            with contextlib.suppress(OSError):
+                trabajo['ruta'].unlink()
+            trabajo['vence'] = (datetime.now() + timedelta(seconds=self.vigencia)).isoformat(timespec='seconds')
+    
+    async def _consultar_trabajo(self, writer, id_trabajo, headers):
+        trabajo = self.trabajos.get(id_trabajo)
+        if trabajo is None:
+            await self._responder_json(writer, 404, {'error': 'Trabajo no encontrado'})
+        elif 'text/html' in headers.get('accept', ''):
+            await self._responder(writer, 200, self._pagina_trabajo(trabajo), 'text/html; charset=utf-8')
+        else:
+            await self._responder_json(writer, 200, self._estado(trabajo))
+    
+    async def _descargar(self, writer, id_trabajo, formato):
+        """Envía el archivo de salida en bloques (sin cargarlo completo en memoria)"""
+        trabajo = self.trabajos.get(id_trabajo)
+        if trabajo is None or formato not in self.TIPOS_CONTENIDO:
+            await self._responder_json(writer, 404, {'error': 'No encontrado'})
+            return
+        if formato == 'log':
+            ruta = trabajo['carpeta'] / 'log.txt'
+        elif trabajo['estado'] == 'terminado' and formato in trabajo['resumen']['archivos']:
+            ruta = trabajo['carpeta'] / trabajo['resumen']['archivos'][formato]
+        else:
+            await self._responder_json(writer, 409, {'error': f"Salida no disponible (estado: {trabajo['estado']})"})
+            return
+        if not ruta.exists():
+            await self._responder_json(writer, 404, {'error': 'No encontrado'})
+            return
+        
+        tamano = ruta.stat().st_size
+        writer.write(self._encabezados(200, self.TIPOS_CONTENIDO[formato], tamano,
+                                       {'Content-Disposition': f'attachment; filename="{ruta.name}"'}))
+        trabajo['descargando'] += 1
+        try:
+            with open(ruta, 'rb') as archivo:
+                while True:
+                    bloque = archivo.read(64 * 1024)
+                    if not bloque:
+                        break
+                    writer.write(bloque)
+                    await writer.drain()
+        finally:
+            trabajo['descargando'] -= 1
+    
+    def _leer_multipart(self, tipo_contenido, cuerpo):
+        """Extrae (nombre, contenido, campos) de un formulario multipart/form-data"""
+        mensaje = BytesParser(policy=email.policy.default).parsebytes(
+            f"Content-Type: {tipo_contenido}\r\n\r\n".encode('latin-1') + cuerpo)
+        nombre, contenido, campos = None, None, {}
+        for parte in mensaje.iter_parts():
+            campo = parte.get_param('name', header='content-disposition')
+            if parte.get_filename():
+                nombre, contenido = parte.get_filename(), parte.get_payload(decode=True)
+            elif campo:
+                campos[campo] = parte.get_content().strip()
+        if contenido is None:
+            raise ValueError("El formulario no incluye el campo 'archivo'")
+        return nombre, contenido, campos
+    
+    def _estado(self, trabajo):
+        estado = {clave: trabajo.get(clave) for clave in
+                  ('id', 'archivo', 'estado', 'creado', 'opciones', 'resumen', 'error', 'segundos', 'vence')}
+        if trabajo['estado'] == 'terminado':
+            estado['descargas'] = {formato: f"/trabajos/{trabajo['id']}/{formato}"
+                                   for formato in trabajo['resumen']['archivos']}
+        return estado
+    
+    def _encabezados(self, codigo, tipo_contenido, longitud, extra=None):
+        razones = {200: 'OK', 202: 'Accepted', 303: 'See Other', 400: 'Bad Request', 404: 'Not Found',
+                   409: 'Conflict', 411: 'Length Required', 413: 'Payload Too Large',
+                   503: 'Service Unavailable'}
+        lineas = [f"HTTP/1.1 {codigo} {razones.get(codigo, '')}",
+                  f"Content-Type: {tipo_contenido}",
+                  f"Content-Length: {longitud}",
+                  "Connection: close"]
+        lineas += [f"{clave}: {valor}" for clave, valor in (extra or {}).items()]
+        return ('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1')
+    
+    async def _responder(self, writer, codigo, cuerpo, tipo_contenido, extra=None):
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode('utf-8')
+        writer.write(self._encabezados(codigo, tipo_contenido, len(cuerpo), extra) + cuerpo)
+        await writer.drain()
+    
+    async def _responder_json(self, writer, codigo, datos, extra=None):
+        cuerpo = json.dumps(datos, ensure_ascii=False, default=str)
+        await self._responder(writer, codigo, cuerpo, 'application/json; charset=utf-8', extra)
+    
+    def _pagina_inicio(self):
+        return f"""<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>DIAN → Siigo</title></head>
+<body style="font-family: Helvetica, sans-serif; background: #FFF0F5; color: #8B0058; padding: 30px">
+<h1 style="color: #C71585">Conversor DIAN a Siigo</h1>
+<form action="/trabajos" method="post" enctype="multipart/form-data">
+  <p><input type="file" name="archivo" accept="{','.join(self.EXTENSIONES_PERMITIDAS)}" required></p>
+  <p><select name="tipo">
+    <option value="auto">Detectar automáticamente</option>
+    <option value="compras">Compras / Recibidos</option>
+    <option value="ventas">Ventas / Enviados</option>
+  </select></p>
+  <p><label><input type="checkbox" name="consolidar" value="1"> Consolidar por tercero y cuenta</label>
+     <label><input type="checkbox" name="por_periodo" value="1"> Separar por mes</label></p>
+  <p><button type="submit">Procesar archivo</button></p>
+</form>
+</body></html>"""
+    
+    def _pagina_trabajo(self, trabajo):
+        nombre = html.escape(trabajo['archivo'])
+        if trabajo['estado'] in ('en cola', 'procesando'):
+            contenido = f"<p>{trabajo['estado'].capitalize()}...</p>"
+            refresco = '<meta http-equiv="refresh" content="2">'
+        elif trabajo['estado'] == 'error':
+            contenido = f"<p>❌ Error: {html.escape(trabajo['error'] or '')}</p>"
+            refresco = ''
+        else:
+            resumen = trabajo['resumen']
+            enlaces = ''.join(f'<li><a href="/trabajos/{trabajo["id"]}/{formato}">{html.escape(archivo)}</a></li>'
+                              for formato, archivo in resumen['archivos'].items())
+            contenido = (f"<p>✅ {resumen['tipo'].capitalize()}: {resumen['facturas']} facturas → "
+                         f"{resumen['filas']} registros Siigo</p><ul>{enlaces}</ul>"
+                         f"<p>Disponible hasta {trabajo['vence'].replace('T', ' ')}</p>")
+            refresco = ''
+        return f"""<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8">{refresco}<title>{nombre}</title></head>
+<body style="font-family: Helvetica, sans-serif; background: #FFF0F5; color: #8B0058; padding: 30px">
+<h2 style="color: #C71585">{nombre}</h2>{contenido}
+<p><a href="/trabajos/{trabajo['id']}/log">Ver log</a> · <a href="/">Convertir otro archivo</a></p>
+</body></html>"""
+
+
+class VigilanteCarpeta:
+    """
+    Vigila una carpeta y convierte automáticamente los reportes DIAN que aparecen en ella:
+    - Espera a que el archivo deje de cambiar (tamaño y fecha) antes de procesarlo
+    - Clasifica Recibidos/Enviados por el nombre del archivo
+    - Convierte en segundo plano en un pool de procesos acotado
+    - Es idempotente: un índice por hash de contenido evita convertir dos veces el mismo archivo
+    - Cada conversión deja sus salidas en una carpeta propia (nombre + hash del contenido): dos
+      archivos con el mismo nombre base (Recibidos.xlsx y Recibidos.csv, o la descarga de otro
+      día) no se sobrescriben
+    """
+    
+    EXTENSIONES = ['.xlsx', '.xlsm', '.xls', '.xlsb', '.ods', '.csv'] + EXTENSIONES_COMPRIMIDAS
+    ARCHIVO_INDICE = '.convertidos.json'
+    
+    def __init__(self, carpeta_entrada, carpeta_salida, trabajadores=None, intervalo=2.0,
+                 espera_estable=3.0, opciones=None, memoria=None):
+        self.carpeta_entrada = Path(carpeta_entrada)
+        self.carpeta_salida = Path(carpeta_salida)
+        if self.carpeta_entrada.resolve() == self.carpeta_salida.resolve():
+            raise ValueError("La carpeta de salida debe ser distinta de la carpeta vigilada")
+        self.trabajadores = trabajadores or max(1, (os.cpu_count() or 2) - 1)
+        self.intervalo = intervalo
+        self.espera_estable = espera_estable
+        self.opciones = opciones or {}
+        # El presupuesto de memoria se reparte entre las conversiones simultáneas
+        self.opciones.setdefault('presupuesto_memoria', (memoria or presupuesto_memoria()) // self.trabajadores)
+        self.procesador = ProcesadorContableDIAN()
+        self.ruta_indice = self.carpeta_salida / self.ARCHIVO_INDICE
+        self.indice = self._cargar_indice()
+        self.observados = {}   # ruta -> (tamaño, mtime, desde cuándo no cambia)
+        self.en_curso = {}     # future -> (hash, ruta, carpeta)
+        self.vistos = {}       # ruta -> (tamaño, mtime) ya resueltos (convertidos, duplicados o con error)
+    
+    def _cargar_indice(self):
+        if self.ruta_indice.exists():
+            with open(self.ruta_indice, encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+    
+    def _guardar_indice(self):
+        # Escritura atómica para no corromper el índice si el proceso se interrumpe
+        temporal = self.ruta_indice.with_suffix('.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.indice, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, self.ruta_indice)
+    
+    def hash_archivo(self, ruta):
+        """SHA-256 del contenido, leído en bloques"""
+        sha = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(bloque)
+        return sha.hexdigest()
+    
+    def _carpeta_trabajo(self, ruta, hash_contenido):
+        return self.carpeta_salida / f"{ruta.stem}_{hash_contenido[:8]}"
+    
+    def archivos_listos(self):
+        """Archivos nuevos cuyo tamaño y fecha no cambian desde hace `espera_estable` segundos"""
+        ahora = time.monotonic()
+        listos = []
+        presentes = set()
+        for ruta in self.carpeta_entrada.iterdir():
+            if ruta.suffix.lower() not in self.EXTENSIONES or ruta.name.startswith(('~$', '.')):
+                continue
+            try:
+                if not ruta.is_file():
+                    continue
+                estado = ruta.stat()
+            except OSError:
+                # Borrado o renombrado mientras se recorría la carpeta (normal en Descargas)
+                continue
+            presentes.add(ruta)
+            firma = (estado.st_size, estado.st_mtime)
+            if self.vistos.get(ruta) == firma:
+                continue
+            anterior = self.observados.get(ruta)
+            if anterior is None or anterior[:2] != firma:
+                # Nuevo o todavía escribiéndose: reiniciar la espera
+                self.observados[ruta] = (*firma, ahora)
+            elif ahora - anterior[2] >= self.espera_estable and estado.st_size > 0:
+                listos.append(ruta)
+        # Olvidar los archivos que desaparecieron antes de quedar estables
+        for ruta in set(self.observados) - presentes:
+            del self.observados[ruta]
+        return listos
+    
+    def revisar(self, pool):
+        """Una pasada: recoge trabajos terminados y lanza los archivos listos (hasta llenar el pool)"""
+        for futuro in [f for f in self.en_curso if f.done()]:
+            hash_contenido, ruta, carpeta = self.en_curso.pop(futuro)
+            try:
+                resumen = futuro.result()
+                self.indice[hash_contenido] = {
+                    'archivo': ruta.name,
+                    'convertido': datetime.now().isoformat(timespec='seconds'),
+                    'tipo': resumen['tipo'],
+                    'filas': resumen['filas'],
+                    'carpeta': carpeta.name,
+                    'salidas': list(resumen['archivos'].values()),
+                }
+                self._guardar_indice()
+                print(f"✅ {ruta.name}: {resumen['facturas']} facturas → {resumen['filas']} registros "
+                      f"({carpeta.name}/: {', '.join(resumen['archivos'].values())})")
+            except Exception as e:
+                print(f"❌ {ruta.name}: {e}")
+        
+        en_proceso = {hash_contenido for hash_contenido, _, _ in self.en_curso.values()}
+        for ruta in self.archivos_listos():
+            if len(self.en_curso) >= self.trabajadores:
+                break
+            self.observados.pop(ruta, None)
+            try:
+                estado = ruta.stat()
+                hash_contenido = self.hash_archivo(ruta)
+            except OSError as e:
+                print(f"↷ {ruta.name}: ya no se puede leer ({e}), se omite")
+                continue
+            self.vistos[ruta] = (estado.st_size, estado.st_mtime)
+            if hash_contenido in self.indice or hash_contenido in en_proceso:
+                previo = self.indice.get(hash_contenido, {}).get('archivo', ruta.name)
+                print(f"↷ {ruta.name}: mismo contenido que '{previo}', ya convertido")
+                continue
+            
+            tipo = self.procesador.tipo_por_nombre(ruta.name) or 'auto'
+            opciones = {**self.opciones, 'tipo': tipo, 'log': f"{ruta.stem}.log"}
+            carpeta = self._carpeta_trabajo(ruta, hash_contenido)
+            carpeta.mkdir(parents=True, exist_ok=True)
+            print(f"⚙️ {ruta.name}: convirtiendo como {tipo}...")
+            futuro = pool.submit(_trabajo_conversion, str(ruta), str(carpeta), opciones)
+            self.en_curso[futuro] = (hash_contenido, ruta, carpeta)
+            en_proceso.add(hash_contenido)
+    
+    def ejecutar(self):
+        """Vigila la carpeta hasta Ctrl+C"""
+        self.carpeta_salida.mkdir(parents=True, exist_ok=True)
+        print(f"Vigilando {self.carpeta_entrada} → {self.carpeta_salida} "
+              f"({self.trabajadores} procesos, {len(self.indice)} archivos ya convertidos)")
+        with ProcessPoolExecutor(max_workers=self.trabajadores) as pool:
+            try:
+                while True:
+                    self.revisar(pool)
+                    time.sleep(self.intervalo)
+            except KeyboardInterrupt:
+                print("\nDeteniendo: esperando las conversiones en curso...")
+                for futuro in list(self.en_curso):
+                    futuro.result()
+                self.revisar(pool)
+
+
+class EspacioTrabajo:
+    """
+    Espacio de trabajo multi-cliente guardado en SQLite:
+    - Clientes con sus cuentas propias (sobre CUENTAS_COMPRAS / CUENTAS_VENTAS) y opciones de salida
+    - Cola persistente de conversiones con prioridad: los trabajos sobreviven a un reinicio
+      y los que quedaron 'procesando' sin planificador vivo vuelven a la cola (ver recuperar_interrumpidos)
+    - Corridas ya importadas por cliente, periodo y tipo, para ver qué cambió en la siguiente
+      (ver ProcesadorContableDIAN.comparar_resultados)
+    Una conexión por hilo (la interfaz y el planificador usan la base a la vez); la toma de
+    trabajos es atómica (BEGIN IMMEDIATE). Cada trabajo tomado queda a nombre de su planificador,
+    que lo mantiene vivo con latidos: varios planificadores (la interfaz y --planificador) pueden
+    compartir la cola sin quitarse trabajos en curso.
+    """
+    
+    ESTADOS = ['en cola', 'procesando', 'terminado', 'error', 'cancelado']
+    # Un trabajo 'procesando' cuyo planificador no da señales en este tiempo se da por abandonado
+    VENCIMIENTO_LATIDO = 60
+    OPCIONES_CLIENTE = ['consolidar', 'por_periodo', 'excluir_duplicados']
+    
+    def __init__(self, ruta=ARCHIVO_ESPACIO_TRABAJO):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conexion().executescript("""
+            CREATE TABLE IF NOT EXISTS clientes (
+                id INTEGER PRIMARY KEY,
+                nombre TEXT NOT NULL UNIQUE,
+                cuentas_compras TEXT NOT NULL DEFAULT '{}',
+                cuentas_ventas TEXT NOT NULL DEFAULT '{}',
+                opciones TEXT NOT NULL DEFAULT '{}',
+                carpeta_salida TEXT,
+                creado TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id INTEGER PRIMARY KEY,
+                cliente_id INTEGER NOT NULL REFERENCES clientes(id),
+                ruta TEXT NOT NULL,
+                tipo TEXT NOT NULL DEFAULT 'auto',
+                periodo TEXT,
+                prioridad INTEGER NOT NULL DEFAULT 0,
+                estado TEXT NOT NULL DEFAULT 'en cola',
+                intentos INTEGER NOT NULL DEFAULT 0,
+                creado TEXT NOT NULL,
+                iniciado TEXT,
+                terminado TEXT,
+                carpeta_salida TEXT,
+                resumen TEXT,
+                error TEXT,
+                dueno TEXT,
+                latido TEXT
+            );
+            CREATE INDEX IF NOT EXISTS trabajos_cola ON trabajos (estado, prioridad DESC, id);
+            CREATE TABLE IF NOT EXISTS corridas (
+                id INTEGER PRIMARY KEY,
+                cliente_id INTEGER NOT NULL REFERENCES clientes(id),
+                periodo TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                ruta TEXT NOT NULL,
+                filas INTEGER,
+                trabajo_id INTEGER REFERENCES trabajos(id),
+                creado TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS corridas_periodo ON corridas (cliente_id, periodo, tipo, id);
+        """)
+        # Bases creadas antes de registrar el dueño de cada trabajo
+        columnas = {fila['name'] for fila in self._conexion().execute("PRAGMA table_info(trabajos)")}
+        for columna in ['dueno', 'latido']:
+            if columna not in columnas:
+                self._conexion().execute(f"ALTER TABLE trabajos ADD COLUMN {columna} TEXT")
+    
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            # Autocommit; las transacciones se abren explícitamente donde hacen falta
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute('PRAGMA journal_mode=WAL')
+            self._local.conexion = conexion
+        return conexion
+    
+    def _ahora(self):
+        return datetime.now().isoformat(timespec='seconds')
+    
+    def _cliente_dict(self, fila):
+        cliente = dict(fila)
+        for clave in ['cuentas_compras', 'cuentas_ventas', 'opciones']:
+            cliente[clave] = json.loads(cliente[clave])
+        return cliente
+    
+    def guardar_cliente(self, nombre, cuentas_compras=None, cuentas_ventas=None, opciones=None,
+                        carpeta_salida=None):
+        """
+        Crea o actualiza un cliente. Las cuentas son solo las que difieren de las del procesador
+        (p. ej. {'gasto': '5105'}); un argumento None conserva el valor guardado. Devuelve el id.
+        """
+        nombre = nombre.strip()
+        if not nombre:
+            raise ValueError("El cliente necesita un nombre")
+        conexion = self._conexion()
+        conexion.execute("INSERT OR IGNORE INTO clientes (nombre, creado) VALUES (?, ?)", (nombre, self._ahora()))
+        for columna, valor in [('cuentas_compras', cuentas_compras), ('cuentas_ventas', cuentas_ventas),
+                               ('opciones', opciones)]:
+            if valor is not None:
+                conexion.execute(f"UPDATE clientes SET {columna} = ? WHERE nombre = ?",
+                                 (json.dumps(valor, ensure_ascii=False), nombre))
+        if carpeta_salida is not None:
+            conexion.execute("UPDATE clientes SET carpeta_salida = ? WHERE nombre = ?",
+                             (str(carpeta_salida) or None, nombre))
+        return self.cliente(nombre)['id']
+    
+    def cliente(self, nombre):
+        """Datos de un cliente (cuentas y opciones ya decodificadas) o None"""
+        fila = self._conexion().execute("SELECT * FROM clientes WHERE nombre = ?", (nombre,)).fetchone()
+        return self._cliente_dict(fila) if fila else None
+    
+    def clientes(self):
+        return [self._cliente_dict(fila)
+                for fila in self._conexion().execute("SELECT * FROM clientes ORDER BY nombre")]
+    
+    def ruta_indice(self, cliente_id):
+        """Índice de facturas ya procesadas propio de cada cliente"""
+        return self.ruta.parent / 'clientes' / str(cliente_id) / 'facturas.idx'
+    
+    def guardar_corrida(self, cliente_id, periodo, tipo, df_resultado=None, ruta=None, trabajo_id=None):
+        """
+        Registra la corrida importada de un cliente/periodo/tipo: la última pasa a ser la base de
+        la próxima comparación. Con df_resultado se guarda en la carpeta del cliente; con `ruta`
+        se registra un pickle ya escrito (p. ej. el corrida.pkl de un trabajo). Devuelve la ruta.
+        """
+        if df_resultado is not None:
+            carpeta = self.ruta.parent / 'clientes' / str(cliente_id) / 'corridas'
+            carpeta.mkdir(parents=True, exist_ok=True)
+            ruta = carpeta / f"{periodo}_{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pkl"
+            df_resultado.to_pickle(ruta)
+            filas = len(df_resultado)
+        elif ruta is not None:
+            filas = None
+        else:
+            raise ValueError("Se necesita el resultado o la ruta de la corrida")
+        self._conexion().execute(
+            "INSERT INTO corridas (cliente_id, periodo, tipo, ruta, filas, trabajo_id, creado) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cliente_id, periodo, tipo, str(ruta), filas, trabajo_id, self._ahora()))
+        return Path(ruta)
+    
+    def marcar_importado(self, ids):
+        """
+        Deja la corrida de trabajos terminados (con periodo) como la ya importada en Siigo: las
+        próximas conversiones del periodo se comparan contra ella. Devuelve cuántas se registraron.
+        """
+        marcados = 0
+        for id_trabajo in ids:
+            fila = self._conexion().execute(
+                "SELECT * FROM trabajos WHERE id = ? AND estado = 'terminado' AND periodo IS NOT NULL",
+                (id_trabajo,)).fetchone()
+            if fila is None:
+                continue
+            resumen = json.loads(fila['resumen'])
+            if not resumen.get('corrida'):
+                continue
+            ruta = Path(fila['carpeta_salida']) / resumen['corrida']
+            if not ruta.exists():
+                continue
+            self.guardar_corrida(fila['cliente_id'], fila['periodo'], resumen['tipo'], ruta=ruta,
+                                 trabajo_id=id_trabajo)
+            marcados += 1
+        return marcados
+    
+    def ultima_corrida(self, cliente_id, periodo, tipo):
+        """Ruta de la última corrida guardada del cliente/periodo/tipo que todavía existe, o None"""
+        for fila in self._conexion().execute(
+                "SELECT ruta FROM corridas WHERE cliente_id = ? AND periodo = ? AND tipo = ? ORDER BY id DESC",
+                (cliente_id, periodo, tipo)):
+            if Path(fila['ruta']).exists():
+                return Path(fila['ruta'])
+        return None
+    
+    def encolar(self, cliente, rutas, prioridad=0, tipo='auto', periodo=None):
+        """Agrega archivos a la cola del cliente (mayor prioridad = antes). Devuelve los ids"""
+        datos = self.cliente(cliente)
+        if datos is None:
+            raise ValueError(f"No existe el cliente '{cliente}'")
+        conexion = self._conexion()
+        ids = []
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            for ruta in rutas:
+                cursor = conexion.execute(
+                    "INSERT INTO trabajos (cliente_id, ruta, tipo, periodo, prioridad, creado) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (datos['id'], str(Path(ruta).resolve()), tipo, periodo, int(prioridad), self._ahora()))
+                ids.append(cursor.lastrowid)
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        return ids
+    
+    def tomar_trabajo(self, dueno=None, max_intentos=None):
+        """
+        Saca de la cola el trabajo de mayor prioridad (y más antiguo) y lo marca 'procesando'.
+        `dueno` identifica al planificador que lo toma (ver latir). Con `max_intentos`, los
+        trabajos que ya gastaron sus intentos (p. ej. un archivo que tumba el proceso y vuelve
+        a la cola una y otra vez) pasan a 'error' en lugar de tomarse. Devuelve el trabajo con
+        los datos de su cliente, o None si la cola está vacía.
+        """
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            if max_intentos is not None:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = 'error', terminado = ?, dueno = NULL, "
+                    "error = 'Se agotaron los ' || intentos || ' intentos' || COALESCE(': ' || error, '') "
+                    "WHERE estado = 'en cola' AND intentos >= ?", (self._ahora(), int(max_intentos)))
+            fila = conexion.execute(
+                "SELECT * FROM trabajos WHERE estado = 'en cola' ORDER BY prioridad DESC, id LIMIT 1").fetchone()
+            if fila is not None:
+                ahora = self._ahora()
+                conexion.execute("UPDATE trabajos SET estado = 'procesando', iniciado = ?, latido = ?, dueno = ?, "
+                                 "intentos = intentos + 1 WHERE id = ?", (ahora, ahora, dueno, fila['id']))
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        if fila is None:
+            return None
+        trabajo = dict(fila, estado='procesando')
+        trabajo['intentos'] += 1
+        trabajo['cliente'] = self._cliente_dict(
+            conexion.execute("SELECT * FROM clientes WHERE id = ?", (trabajo['cliente_id'],)).fetchone())
+        return trabajo
+    
+    def terminar_trabajo(self, id_trabajo, carpeta_salida, resumen):
+        self._conexion().execute(
+            "UPDATE trabajos SET estado = 'terminado', terminado = ?, carpeta_salida = ?, resumen = ?, error = NULL "
+            "WHERE id = ?", (self._ahora(), str(carpeta_salida), json.dumps(resumen, ensure_ascii=False), id_trabajo))
+    
+    def fallar_trabajo(self, id_trabajo, error, reintentar=False, contar_intento=True):
+        """
+        Registra el error; con reintentar=True el trabajo vuelve a la cola. contar_intento=False
+        devuelve el intento cuando el trabajo no llegó a correr o se detuvo a pedido (Ctrl+C).
+        """
+        self._conexion().execute(
+            "UPDATE trabajos SET estado = ?, terminado = ?, error = ?, dueno = NULL, "
+            "intentos = intentos - ? WHERE id = ?",
+            ('en cola' if reintentar else 'error', self._ahora(), str(error), 0 if contar_intento else 1,
+             id_trabajo))
+    
+    def latir(self, dueno):
+        """Marca como vivos los trabajos en curso del planificador `dueno`"""
+        self._conexion().execute("UPDATE trabajos SET latido = ? WHERE dueno = ? AND estado = 'procesando'",
+                                 (self._ahora(), dueno))
+    
+    def recuperar_interrumpidos(self, vencimiento=None):
+        """
+        Devuelve a la cola los trabajos 'procesando' cuyo planificador dejó de dar latidos hace más
+        de `vencimiento` segundos (cierre inesperado). Los de planificadores vivos no se tocan.
+        Devuelve cuántos.
+        """
+        limite = (datetime.now() - timedelta(seconds=vencimiento or self.VENCIMIENTO_LATIDO)).isoformat(
+            timespec='seconds')
+        cursor = self._conexion().execute(
+            "UPDATE trabajos SET estado = 'en cola', dueno = NULL "
+            "WHERE estado = 'procesando' AND (latido IS NULL OR latido < ?)", (limite,))
+        return cursor.rowcount
+    
+    def reintentar(self, ids):
+        """Vuelve a encolar trabajos con error o cancelados"""
+        self._conexion().executemany(
+            "UPDATE trabajos SET estado = 'en cola', intentos = 0, error = NULL "
+            "WHERE id = ? AND estado IN ('error', 'cancelado')", [(i,) for i in ids])
+    
+    def cancelar(self, ids):
+        """Cancela trabajos que todavía están en cola"""
+        self._conexion().executemany(
+            "UPDATE trabajos SET estado = 'cancelado' WHERE id = ? AND estado = 'en cola'", [(i,) for i in ids])
+    
+    def pendientes(self):
+        """Trabajos en cola o procesando"""
+        return self._conexion().execute(
+            "SELECT COUNT(*) FROM trabajos WHERE estado IN ('en cola', 'procesando')").fetchone()[0]
+    
+    def trabajos(self, cliente=None, estado=None, limite=500):
+        """Trabajos (los más recientes primero) como DataFrame, con el nombre del cliente"""
+        condiciones, parametros = [], []
+        if cliente is not None:
+            condiciones.append("c.nombre = ?")
+            parametros.append(cliente)
+        if estado is not None:
+            condiciones.append("t.estado = ?")
+            parametros.append(estado)
+        donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        return pd.read_sql_query(
+            f"SELECT t.id, c.nombre AS cliente, t.ruta, t.tipo, t.periodo, t.prioridad, t.estado, t.intentos, "
+            f"t.creado, t.iniciado, t.terminado, t.carpeta_salida, t.resumen, t.error "
+            f"FROM trabajos t JOIN clientes c ON c.id = t.cliente_id {donde} ORDER BY t.id DESC LIMIT ?",
+            self._conexion(), params=parametros + [limite])
+
+
+class PlanificadorTrabajos:
+    """
+    Ejecuta en segundo plano la cola de un EspacioTrabajo con un pool de procesos acotado:
+    - Toma los trabajos por prioridad hasta llenar el pool; cada uno usa las cuentas, opciones
+      e índice de facturas de su cliente y deja sus salidas en una carpeta propia
+    - Devuelve a la cola lo que quedó a medias (trabajos sin latidos de su planificador, ver
+      EspacioTrabajo.VENCIMIENTO_LATIDO); las conversiones por bloques continúan desde su último
+      punto de control
+    - Reintenta hasta `max_intentos` veces un trabajo que falla, también si tumba el proceso
+      de conversión (pool roto) o el planificador mismo: al agotarlos queda en 'error'
+    """
+    
+    def __init__(self, espacio, carpeta_salida=None, trabajadores=None, intervalo=1.0, memoria=None,
+                 max_intentos=2):
+        self.espacio = espacio
+        self.carpeta_salida = Path(carpeta_salida) if carpeta_salida else espacio.ruta.parent / 'salidas'
+        self.trabajadores = trabajadores or max(1, (os.cpu_count() or 2) - 1)
+        self.intervalo = intervalo
+        self.max_intentos = max_intentos
+        # El presupuesto de memoria se reparte entre las conversiones simultáneas
+        self.presupuesto_trabajo = (memoria or presupuesto_memoria()) // self.trabajadores
+        self.procesador = ProcesadorContableDIAN()
+        self.en_curso = {}     # future -> trabajo
+        # Identifica a este planificador en los trabajos que toma (ver EspacioTrabajo.latir)
+        self.dueno = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._detener = threading.Event()
+        self._hilo = None
+    
+    def _carpeta_trabajo(self, trabajo):
+        cliente = trabajo['cliente']
+        base = Path(cliente['carpeta_salida']) if cliente['carpeta_salida'] else (
+            self.carpeta_salida / re.sub(r'[^\w\- ]', '_', cliente['nombre']))
+        return base / (trabajo['periodo'] or '') / f"trabajo_{trabajo['id']:06d}"
+    
+    def _opciones(self, trabajo):
+        cliente = trabajo['cliente']
+        tipo = trabajo['tipo']
+        if tipo == 'auto':
+            tipo = self.procesador.tipo_por_nombre(Path(trabajo['ruta']).name) or 'auto'
+        opciones = {
+            **{clave: cliente['opciones'][clave] for clave in self.espacio.OPCIONES_CLIENTE
+               if clave in cliente['opciones']},
+            'tipo': tipo,
+            'cuentas_compras': cliente['cuentas_compras'],
+            'cuentas_ventas': cliente['cuentas_ventas'],
+            'indice_facturas': str(self.espacio.ruta_indice(cliente['id'])),
+            'presupuesto_memoria': self.presupuesto_trabajo,
+        }
+        if trabajo['periodo']:
+            # Con periodo se compara con la corrida importada del mismo periodo. La corrida se deja en
+            # la carpeta del trabajo; solo pasa a ser la base si se marca como importada (marcar_importado)
+            opciones['guardar_corrida'] = True
+            opciones['corridas_anteriores'] = {}
+            for tipo_corrida in ['compras', 'ventas']:
+                anterior = self.espacio.ultima_corrida(cliente['id'], trabajo['periodo'], tipo_corrida)
+                if anterior is not None:
+                    opciones['corridas_anteriores'][tipo_corrida] = str(anterior)
+        return opciones
+    
+    def revisar(self, pool):
+        """Una pasada: registra los trabajos terminados y toma de la cola hasta llenar el pool"""
+        self.espacio.latir(self.dueno)
+        recuperados = self.espacio.recuperar_interrumpidos()
+        if recuperados:
+            print(f"♻️ {recuperados} trabajos abandonados por otro planificador vuelven a la cola")
+        for futuro in [f for f in self.en_curso if f.done()]:
+            trabajo = self.en_curso.pop(futuro)
+            nombre = Path(trabajo['ruta']).name
+            try:
+                resumen = futuro.result()
+                self.espacio.terminar_trabajo(trabajo['id'], self._carpeta_trabajo(trabajo), resumen)
+                cambios = resumen.get('cambios')
+                print(f"✅ [{trabajo['cliente']['nombre']}] {nombre}: {resumen['facturas']} facturas → "
+                      f"{resumen['filas']} registros"
+                      + (f" ({cambios['agregadas']} agregadas, {cambios['eliminadas']} eliminadas, "
+                         f"{cambios['modificadas']} modificadas)" if cambios else ""))
+            except BrokenProcessPool as e:
+                # Puede ser culpa del archivo (p. ej. se queda sin memoria): gasta un intento, así
+                # un archivo que tumba el proceso no se reintenta sin fin (ver tomar_trabajo)
+                self.espacio.fallar_trabajo(trabajo['id'], e, reintentar=True)
+                raise
+            except KeyboardInterrupt:
+                self.espacio.fallar_trabajo(trabajo['id'], "Interrumpido", reintentar=True, contar_intento=False)
+            except Exception as e:
+                reintentar = trabajo['intentos'] < self.max_intentos
+                self.espacio.fallar_trabajo(trabajo['id'], e, reintentar=reintentar)
+                print(f"❌ [{trabajo['cliente']['nombre']}] {nombre}: {e}" + (" (se reintentará)" if reintentar else ""))
+        
+        while len(self.en_curso) < self.trabajadores and not self._detener.is_set():
+            trabajo = self.espacio.tomar_trabajo(self.dueno, max_intentos=self.max_intentos)
+            if trabajo is None:
+                break
+            carpeta = self._carpeta_trabajo(trabajo)
+            carpeta.mkdir(parents=True, exist_ok=True)
+            print(f"⚙️ [{trabajo['cliente']['nombre']}] {Path(trabajo['ruta']).name} "
+                  f"(prioridad {trabajo['prioridad']}, intento {trabajo['intentos']})")
+            try:
+                futuro = pool.submit(_trabajo_conversion, trabajo['ruta'], str(carpeta), self._opciones(trabajo))
+            except BrokenProcessPool as e:
+                # No alcanzó a correr
+                self.espacio.fallar_trabajo(trabajo['id'], e, reintentar=True, contar_intento=False)
+                raise
+            self.en_curso[futuro] = trabajo
+    
+    def ejecutar(self):
+        """Procesa la cola hasta detener() o Ctrl+C; si el pool se rompe, lo vuelve a crear"""
+        recuperados = self.espacio.recuperar_interrumpidos()
+        print(f"Planificador: {self.trabajadores} procesos, {self.espacio.pendientes()} trabajos pendientes"
+              + (f" ({recuperados} recuperados de una ejecución anterior)" if recuperados else ""))
+        while not self._detener.is_set():
+            try:
+                with ProcessPoolExecutor(max_workers=self.trabajadores) as pool:
+                    try:
+                        while not self._detener.is_set():
+                            self.revisar(pool)
+                            self._detener.wait(self.intervalo)
+                    except KeyboardInterrupt:
+                        self._detener.set()
+                    # Registrar lo que termine para no repetirlo en el próximo arranque
+                    print("Deteniendo: esperando las conversiones en curso...")
+                    pendientes = list(self.en_curso)
+                    while pendientes:
+                        # Seguir dando latidos para que otro planificador no los tome como abandonados
+                        self.espacio.latir(self.dueno)
+                        pendientes = [futuro for futuro in pendientes if not futuro.done()]
+                        time.sleep(self.intervalo if pendientes else 0)
+                    self.revisar(pool)
+            except BrokenProcessPool as e:
+                print(f"⚠️ El pool de procesos se detuvo ({e}), reiniciándolo")
+                for trabajo in self.en_curso.values():
+                    self.espacio.fallar_trabajo(trabajo['id'], e, reintentar=True)
+                self.en_curso.clear()
+    
+    def iniciar(self):
+        """Ejecuta el planificador en un hilo de fondo"""
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self.ejecutar, daemon=True)
+            self._hilo.start()
+    
+    def detener(self, esperar=True):
+        self._detener.set()
+        if esperar and self._hilo is not None:
+            self._hilo.join()
+
+
 if __name__ == "__main__":
+    # Necesario para los pools de procesos en el ejecutable (PyInstaller)
+    multiprocessing.freeze_support()
+    
     # Instalar dependencias si faltan
     try:
         import pandas
@@ -1139,6 +5667,95 @@ if __name__ == "__main__":
         print("Dependencias instaladas. Reiniciando...")
         os.execv(sys.executable, ['python'] + sys.argv)
     
+    parser = argparse.ArgumentParser(description="DIAN → Siigo | Conversor Contable")
+    parser.add_argument('--servidor', action='store_true',
+                        help="Inicia el servicio web local en lugar de la aplicación de escritorio")
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección del servicio (por defecto 127.0.0.1)")
+    parser.add_argument('--puerto', type=int, default=8765, help="Puerto del servicio (por defecto 8765)")
+    parser.add_argument('--vigencia', type=int, default=3600, metavar='SEGUNDOS',
+                        help="Segundos que el servicio conserva las salidas de un trabajo (por defecto 3600)")
+    parser.add_argument('--trabajadores', type=int, default=None,
+                        help="Procesos de conversión simultáneos (por defecto núcleos - 1)")
+    parser.add_argument('--vigilar', metavar='CARPETA',
+                        help="Convierte automáticamente los archivos que lleguen a CARPETA")
+    parser.add_argument('--salida', metavar='CARPETA',
+                        help="Carpeta de salida para --vigilar (por defecto CARPETA/Siigo)")
+    parser.add_argument('--consolidar', action='store_true', help="Consolidar por tercero y cuenta (--vigilar)")
+    parser.add_argument('--por-periodo', action='store_true', help="Consolidar además por mes (--vigilar)")
+    parser.add_argument('--memoria', type=int, metavar='MB', default=None,
+                        help="Presupuesto de memoria total para las conversiones (por defecto la mitad de la RAM)")
+    parser.add_argument('--excluir-duplicadas', action='store_true',
+                        help="Excluye las facturas ya procesadas antes según el índice de facturas (--vigilar)")
+    parser.add_argument('--cliente', metavar='NOMBRE',
+                        help="Cliente del espacio de trabajo (se crea si no existe)")
+    parser.add_argument('--cuenta', action='append', default=[], metavar='CLAVE=CUENTA',
+                        help="Cuenta propia del cliente, p. ej. gasto=5105 o ingresos=4135 (repetible)")
+    parser.add_argument('--encolar', nargs='+', metavar='ARCHIVO',
+                        help="Agrega archivos a la cola del cliente (--cliente)")
+    parser.add_argument('--prioridad', type=int, default=0, help="Prioridad de --encolar (mayor = antes)")
+    parser.add_argument('--periodo', metavar='AAAA-MM',
+                        help="Periodo de los archivos de --encolar (compara con la corrida importada del periodo)")
+    parser.add_argument('--planificador', action='store_true',
+                        help="Procesa la cola del espacio de trabajo en segundo plano hasta Ctrl+C")
+    parser.add_argument('--cola', action='store_true', help="Muestra los trabajos del espacio de trabajo")
+    parser.add_argument('--importado', nargs='+', type=int, metavar='ID',
+                        help="Marca trabajos terminados como importados en Siigo (base de la próxima comparación)")
+    args = parser.parse_args()
+    
+    if args.cliente or args.encolar or args.planificador or args.cola or args.importado:
+        espacio = EspacioTrabajo()
+        if args.cliente:
+            base = ProcesadorContableDIAN()
+            cuentas = {'compras': {}, 'ventas': {}}
+            for asignacion in args.cuenta:
+                clave, _, cuenta = asignacion.partition('=')
+                if clave in base.CUENTAS_COMPRAS:
+                    cuentas['compras'][clave] = cuenta
+                elif clave in base.CUENTAS_VENTAS:
+                    cuentas['ventas'][clave] = cuenta
+                else:
+                    parser.error(f"Cuenta desconocida '{clave}' "
+                                 f"(válidas: {', '.join([*base.CUENTAS_COMPRAS, *base.CUENTAS_VENTAS])})")
+            anterior = espacio.cliente(args.cliente)
+            opciones = None
+            if args.consolidar or args.por_periodo or args.excluir_duplicadas:
+                opciones = {'consolidar': args.consolidar, 'por_periodo': args.por_periodo,
+                            'excluir_duplicados': args.excluir_duplicadas}
+            espacio.guardar_cliente(
+                args.cliente,
+                cuentas_compras={**(anterior['cuentas_compras'] if anterior else {}), **cuentas['compras']},
+                cuentas_ventas={**(anterior['cuentas_ventas'] if anterior else {}), **cuentas['ventas']},
+                opciones=opciones, carpeta_salida=args.salida)
+        if args.encolar:
+            if not args.cliente:
+                parser.error("--encolar requiere --cliente")
+            ids = espacio.encolar(args.cliente, args.encolar, prioridad=args.prioridad, periodo=args.periodo)
+            print(f"📥 {len(ids)} trabajos en cola para {args.cliente} (prioridad {args.prioridad})")
+        if args.importado:
+            print(f"📌 {espacio.marcar_importado(args.importado)} corridas marcadas como importadas")
+        if args.cola:
+            print(espacio.trabajos()[['id', 'cliente', 'ruta', 'prioridad', 'estado', 'intentos', 'error']]
+                  .to_string(index=False))
+        if args.planificador:
+            memoria = args.memoria * 1024 * 1024 if args.memoria else None
+            PlanificadorTrabajos(espacio, trabajadores=args.trabajadores, memoria=memoria).ejecutar()
+        sys.exit(0)
+    
+    if args.servidor:
+        memoria = args.memoria * 1024 * 1024 if args.memoria else None
+        ServidorConversion(host=args.host, puerto=args.puerto, trabajadores=args.trabajadores,
+                           memoria=memoria, vigencia=args.vigencia).ejecutar()
+        sys.exit(0)
+    
+    if args.vigilar:
+        salida = args.salida or os.path.join(args.vigilar, 'Siigo')
+        memoria = args.memoria * 1024 * 1024 if args.memoria else None
+        VigilanteCarpeta(args.vigilar, salida, trabajadores=args.trabajadores, memoria=memoria,
+                         opciones={'consolidar': args.consolidar, 'por_periodo': args.por_periodo,
+                                   'indice_facturas': str(ARCHIVO_INDICE_FACTURAS),
+                                   'excluir_duplicados': args.excluir_duplicadas}).ejecutar()
+        sys.exit(0)
+    
     # Iniciar
     root = tk.Tk()
     app = AplicacionDIAN(root)
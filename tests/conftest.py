@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import dian_a_siigo
+
+NIT_EMPRESA = '901000000'
+
+
+@pytest.fixture
+def procesador(tmp_path, monkeypatch):
+    """Procesador con los puntos de control en una carpeta temporal (no en ~/.dian_a_siigo)"""
+    monkeypatch.setattr(dian_a_siigo, 'CARPETA_AVANCE', tmp_path / 'avance')
+    return dian_a_siigo.ProcesadorContableDIAN()
+
+
+def pesos_colombianos(centavos):
+    """12345678 → '123.456,78'"""
+    return f"{centavos / 100:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def filas_dian(facturas, tipo='compras'):
+    """
+    Filas de un reporte DIAN como DataFrame de texto. Cada factura es un dict con 'tercero',
+    'folio', 'total' e 'iva' (centavos) y opcionales 'prefijo', 'cufe', 'fecha' (dd-mm-aaaa),
+    'tipo' (texto de Tipo de documento) y 'nombre'. En compras el tercero es el emisor; en
+    ventas, el receptor.
+    """
+    filas = []
+    for factura in facturas:
+        tercero = factura['tercero']
+        emisor, receptor = (tercero, NIT_EMPRESA) if tipo == 'compras' else (NIT_EMPRESA, tercero)
+        filas.append({
+            'Tipo de documento': factura.get('tipo', 'Factura electrónica'),
+            'CUFE/CUDE': factura.get('cufe', ''),
+            'Folio': str(factura['folio']),
+            'Prefijo': factura.get('prefijo', 'FE'),
+            'Fecha Emisión': factura.get('fecha', '15-01-2024'),
+            'NIT Emisor': emisor,
+            'Nombre Emisor': factura.get('nombre', f'Tercero {tercero}') if tipo == 'compras' else 'Mi Empresa',
+            'NIT Receptor': receptor,
+            'Nombre Receptor': 'Mi Empresa' if tipo == 'compras' else factura.get('nombre', f'Tercero {tercero}'),
+            'IVA': pesos_colombianos(factura['iva']),
+            'Total': pesos_colombianos(factura['total']),
+        })
+    return pd.DataFrame(filas)
+
+
+@pytest.fixture
+def reporte_dian(tmp_path):
+    """Escribe un reporte DIAN (.csv) con las facturas dadas (ver filas_dian) y devuelve su ruta"""
+    def escribir(facturas, tipo='compras', nombre=None, preambulo=False):
+        ruta = tmp_path / (nombre or ('Recibidos.csv' if tipo == 'compras' else 'Enviados.csv'))
+        with open(ruta, 'w', encoding='utf-8') as f:
+            if preambulo:
+                f.write('Reporte de documentos' + ',' * 10 + '\n')
+            filas_dian(facturas, tipo).to_csv(f, index=False)
+        return ruta
+
+    return escribir
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dian_a_siigo
+
+
+def facturas_mezcladas(cantidad=60):
+    """Compras con tarifas de IVA mezcladas y notas crédito"""
+    rng = np.random.default_rng(7)
+    facturas = []
+    for i in range(cantidad):
+        base = int(rng.integers(1000, 5_000_000)) * 100 + int(rng.integers(0, 100))
+        iva = round(base * [0.19, 0.05, 0][i % 3])
+        nota = i % 11 == 5
+        facturas.append({
+            'tercero': str(900000001 + i % 7), 'folio': i + 1, 'total': base + iva, 'iva': iva,
+            'prefijo': 'NC' if nota else 'FE',
+            'tipo': 'Nota crédito electrónica' if nota else 'Factura electrónica',
+            'fecha': f'{1 + i % 28:02d}-{1 + i % 3:02d}-2024',
+        })
+    return facturas
+
+
+@pytest.fixture
+def recibidos(reporte_dian):
+    return reporte_dian(facturas_mezcladas(), preambulo=True)
+
+
+@pytest.fixture
+def con_indice(procesador, tmp_path):
+    procesador.indice_facturas = dian_a_siigo.IndiceFacturas(tmp_path / 'facturas.idx')
+    procesador.excluir_duplicados = True
+    return procesador
+
+
+@pytest.mark.parametrize('tamano_bloque', [1, 7, 1000])
+def test_por_bloques_igual_que_en_memoria(procesador, recibidos, tamano_bloque):
+    completo = procesador.convertir(recibidos)
+    por_bloques = procesador.convertir_por_bloques(recibidos, tamano_bloque=tamano_bloque, reanudar=False)
+
+    assert por_bloques['tipo'] == completo['tipo'] == 'compras'
+    pd.testing.assert_frame_equal(por_bloques['resultado'], completo['resultado'])
+    assert por_bloques['validacion']['totales'] == completo['validacion']['totales']
+    for clave in ('terceros', 'cuentas', 'iva'):
+        pd.testing.assert_frame_equal(por_bloques['resumen'][clave], completo['resumen'][clave])
+
+
+def test_reanudar_da_el_mismo_resultado(procesador, recibidos):
+    class Corte(Exception):
+        pass
+
+    def cortar(filas, bloques):
+        if bloques == 3:
+            raise Corte
+
+    completo = procesador.convertir(recibidos)
+    with pytest.raises(Corte):
+        procesador.convertir_por_bloques(recibidos, tamano_bloque=9, reanudar=False, progreso=cortar)
+    reanudado = procesador.convertir_por_bloques(recibidos, tamano_bloque=9)
+
+    pd.testing.assert_frame_equal(reanudado['resultado'], completo['resultado'])
+    assert reanudado['validacion']['totales'] == completo['validacion']['totales']
+
+
+def test_bloque_solo_de_duplicadas_conserva_su_validacion(con_indice, reporte_dian):
+    facturas = facturas_mezcladas(10)
+    ruta = reporte_dian(facturas + facturas[:5])
+
+    completo = con_indice.convertir(ruta)
+    por_bloques = con_indice.convertir_por_bloques(ruta, tamano_bloque=5, reanudar=False)
+
+    # El último bloque queda vacío al excluir sus duplicadas, pero sus anomalías se reportan
+    assert completo['validacion']['totales']['anomalias'] == 5
+    assert por_bloques['validacion']['totales'] == completo['validacion']['totales']
+    assert (por_bloques['validacion']['anomalias']['MOTIVO']
+            == 'Factura repetida en el archivo (excluida)').sum() == 5
+
+
+def test_archivo_ya_procesado(con_indice, recibidos):
+    con_indice.convertir_por_bloques(recibidos, tamano_bloque=7, reanudar=False)
+    con_indice.registrar_facturas()
+
+    with pytest.raises(Exception, match='ya fueron procesadas antes'):
+        con_indice.convertir(recibidos)
+    with pytest.raises(Exception, match='ya fueron procesadas antes'):
+        con_indice.convertir_por_bloques(recibidos, tamano_bloque=7, reanudar=False)
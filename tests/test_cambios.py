@@ -0,0 +1,48 @@
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000},
+    {'tercero': '900000003', 'folio': 4, 'total': 5000000, 'iva': 0},
+]
+
+
+def resultado(procesador, reporte_dian, facturas):
+    return procesador.convertir(reporte_dian(facturas, 'compras'), tipo='compras')['resultado']
+
+
+def test_misma_corrida_sin_cambios(procesador, reporte_dian):
+    df = resultado(procesador, reporte_dian, FACTURAS)
+    diferencias = procesador.comparar_resultados(df, df.copy())
+
+    assert diferencias['sin_cambios']
+    assert diferencias['totales']['sin_cambios'] == len(df)
+
+
+def test_agregadas_eliminadas_y_modificadas(procesador, reporte_dian):
+    anterior = resultado(procesador, reporte_dian, FACTURAS)
+    nuevas = [dict(FACTURAS[0], total=12000000), FACTURAS[1],
+              {'tercero': '900000009', 'folio': 2, 'total': 1000000, 'iva': 0}]
+    nuevo = resultado(procesador, reporte_dian, nuevas)
+
+    diferencias = procesador.comparar_resultados(anterior, nuevo)
+
+    # Cambia el gasto de la primera factura; sale 900000003 y entra 900000009
+    assert diferencias['totales'] == {'agregadas': 1, 'eliminadas': 1, 'modificadas': 1, 'sin_cambios': 3}
+    assert diferencias['agregadas']['TERCERO'].tolist() == ['900000009']
+    assert diferencias['eliminadas']['TERCERO'].tolist() == ['900000003']
+    assert diferencias['modificadas']['TERCERO'].tolist() == ['900000001']
+    assert diferencias['modificadas_antes']['DEBITO'].tolist() == [100000]
+    assert diferencias['modificadas']['DEBITO'].tolist() == [101000]
+
+
+def test_documento_repetido_entre_terceros_no_cruza_lineas(procesador, reporte_dian):
+    # Corrida guardada con un DOCUMENTO que no distingue al tercero (solo el folio)
+    anterior = resultado(procesador, reporte_dian, FACTURAS[:2])
+    anterior['DOCUMENTO'] = 'FE1'
+    nuevo = anterior.iloc[::-1].reset_index(drop=True)
+    nuevo.loc[nuevo['TERCERO'] == '900000002', 'OBSERVACIONES'] = 'Proveedor renombrado'
+
+    diferencias = procesador.comparar_resultados(anterior, nuevo)
+
+    assert diferencias['totales']['modificadas'] == 2
+    assert set(diferencias['modificadas']['TERCERO']) == {'900000002'}
+    assert diferencias['totales']['sin_cambios'] == 2
@@ -0,0 +1,68 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize('texto, centavos', [
+    ('1.234,56', 123456),
+    ('1,234.56', 123456),
+    ('12,5', 1250),
+    (' 7 ', 700),
+    ('1234.565', 123457),
+    ('1234.564', 123456),
+    ('-0,005', -1),
+    ('-1.234,555', -123456),
+    ('1e3', 100000),
+    ('', 0),
+    (None, 0),
+    (np.nan, 0),
+    # Más allá de la precisión de un float: debe quedar exacto
+    ('99.999.999.999.999,99', 9999999999999999),
+])
+def test_convertir_a_centavos(procesador, texto, centavos):
+    resultado = procesador.convertir_a_centavos(pd.Series([texto], dtype=object))
+    assert resultado.dtype == np.int64
+    assert resultado.iloc[0] == centavos
+
+
+def test_convertir_a_centavos_coincide_con_decimal(procesador):
+    rng = np.random.default_rng(0)
+    milesimas = rng.integers(-10**12, 10**12, 5000)
+    texto = pd.Series([f"{Decimal(int(m)) / 1000:.3f}" for m in milesimas])
+    esperado = [int((Decimal(t) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP)) for t in texto]
+    assert procesador.convertir_a_centavos(texto).tolist() == esperado
+
+
+@pytest.mark.parametrize('numerador, denominador, cociente', [
+    (150, 100, 2),
+    (149, 100, 1),
+    (250, 100, 3),
+    (-150, 100, -2),
+    (-149, 100, -1),
+    (0, 100, 0),
+    (5, 10, 1),
+    (-5, 10, -1),
+    (2**62, 100, (2**62 + 50) // 100),
+])
+def test_dividir_redondeado(procesador, numerador, denominador, cociente):
+    assert procesador.dividir_redondeado(np.int64(numerador), denominador) == cociente
+
+
+def test_dividir_redondeado_coincide_con_decimal(procesador):
+    rng = np.random.default_rng(1)
+    numeradores = rng.integers(-10**15, 10**15, 5000)
+    for denominador in (3, 19, 100, 119):
+        esperado = [int((Decimal(int(n)) / denominador).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+                    for n in numeradores]
+        resultado = procesador.dividir_redondeado(numeradores, denominador)
+        assert resultado.dtype == np.int64
+        assert resultado.tolist() == esperado
+
+
+def test_centavos_a_pesos(procesador):
+    centavos = pd.Series([11900050, 11900049, -50, -49], dtype='int64')
+    pesos = procesador.centavos_a_pesos(centavos)
+    assert pesos.dtype == np.int64
+    assert pesos.tolist() == [119001, 119000, -1, 0]
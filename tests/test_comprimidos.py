@@ -0,0 +1,82 @@
+import gzip
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+import dian_a_siigo
+from conftest import filas_dian
+
+
+def factura(folio, tercero='900000001'):
+    return {'tercero': tercero, 'folio': folio, 'total': 11900000, 'iva': 1900000}
+
+
+def csv_dian(facturas):
+    return filas_dian(facturas).to_csv(index=False).encode('utf-8')
+
+
+def xlsx_dian(facturas):
+    contenido = io.BytesIO()
+    filas_dian(facturas).to_excel(contenido, index=False, engine='openpyxl')
+    return contenido.getvalue()
+
+
+@pytest.fixture
+def reporte_zip(tmp_path):
+    """Un CSV, un libro de Excel, un .csv.gz y la basura que deja el compresor de macOS"""
+    ruta = tmp_path / 'Recibidos.zip'
+    with zipfile.ZipFile(ruta, 'w', zipfile.ZIP_DEFLATED) as archivo_zip:
+        archivo_zip.writestr('enero.csv', csv_dian([factura(1), factura(2)]))
+        archivo_zip.writestr('febrero.xlsx', xlsx_dian([factura(3)]))
+        archivo_zip.writestr('marzo.csv.gz', gzip.compress(csv_dian([factura(4)])))
+        archivo_zip.writestr('__MACOSX/._enero.csv', b'\x00\x05\x16\x07')
+        archivo_zip.writestr('leeme.pdf', b'%PDF-1.4')
+    return ruta
+
+
+def test_extension_datos():
+    assert dian_a_siigo.extension_datos('Recibidos.csv.gz') == '.csv'
+    assert dian_a_siigo.extension_datos('Recibidos.gz') == '.gz'
+    assert dian_a_siigo.extension_datos('Recibidos.XLSX') == '.xlsx'
+
+
+def test_zip_lee_todos_los_miembros_soportados(procesador, reporte_zip):
+    df = procesador.leer_archivo_dian(reporte_zip)
+
+    assert sorted(df['Folio'].tolist()) == ['1', '2', '3', '4']
+    assert not df['Hoja Origen'].str.contains('MACOSX|leeme').any()
+    assert procesador.ultima_lectura['motor'].startswith('zip (')
+
+
+def test_zip_con_miembros_iguales_a_los_sueltos(procesador, reporte_zip, reporte_dian):
+    desde_zip = procesador.convertir(reporte_zip)
+    sueltos = procesador.convertir(reporte_dian([factura(1), factura(2), factura(3), factura(4)]))
+
+    assert desde_zip['n_facturas'] == 4
+    assert desde_zip['validacion']['cuadrado']
+    columnas = ['DOCUMENTO', 'CUENTA', 'DEBITO', 'CREDITO']
+    ordenar = lambda df: df[columnas].sort_values(columnas).reset_index(drop=True)
+    pd.testing.assert_frame_equal(ordenar(desde_zip['resultado']), ordenar(sueltos['resultado']))
+
+
+def test_zip_sin_reportes_falla(procesador, tmp_path):
+    ruta = tmp_path / 'vacio.zip'
+    with zipfile.ZipFile(ruta, 'w') as archivo_zip:
+        archivo_zip.writestr('__MACOSX/._Recibidos.csv', b'\x00')
+        archivo_zip.writestr('leeme.pdf', b'%PDF-1.4')
+
+    with pytest.raises(Exception, match='no contiene reportes'):
+        procesador.leer_archivo_dian(ruta)
+
+
+def test_csv_gz_se_lee_sin_descomprimir_a_disco(procesador, tmp_path):
+    ruta = tmp_path / 'Recibidos.csv.gz'
+    ruta.write_bytes(gzip.compress(csv_dian([factura(1), factura(2, '900000002')])))
+
+    conversion = procesador.convertir(ruta)
+
+    assert conversion['n_facturas'] == 2
+    assert conversion['validacion']['cuadrado']
+    assert list(tmp_path.iterdir()) == [ruta]
@@ -0,0 +1,77 @@
+import pandas as pd
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000, 'fecha': '10-01-2024'},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000, 'fecha': '12-01-2024'},
+    {'tercero': '900000003', 'folio': 5, 'total': 5000000, 'iva': 0, 'fecha': '15-01-2024'},
+    {'tercero': '900000004', 'folio': 9, 'total': 3000000, 'iva': 0, 'fecha': '20-01-2024'},
+    {'tercero': '900000005', 'folio': 3, 'total': 1000000, 'iva': 0, 'fecha': '20-01-2024'},
+]
+
+
+def auxiliar(movimientos):
+    """Auxiliar de proveedores ya leído: (tercero, crédito en centavos, fecha)"""
+    return pd.DataFrame({
+        'TERCERO': [m[0] for m in movimientos],
+        'DEBITO': 0,
+        'CREDITO': [m[1] for m in movimientos],
+        'FECHA': pd.to_datetime([m[2] for m in movimientos]),
+        'COMPROBANTE': [f'CC-1-{i}' for i in range(len(movimientos))],
+        'CUENTA': '22050501',
+    })
+
+
+def conciliar(procesador, reporte_dian, facturas, movimientos):
+    df = procesador.leer_archivo_dian(reporte_dian(facturas, 'compras'))
+    return procesador.conciliar_siigo(df, auxiliar(movimientos), 'compras')
+
+
+def test_estados_de_conciliacion(procesador, reporte_dian):
+    reporte = conciliar(procesador, reporte_dian, FACTURAS, [
+        ('900000001', 11900000, '2024-01-11'),   # conciliado
+        ('900000002', 2380000, '2024-03-01'),    # fecha fuera de rango
+        ('900000003', 5100000, '2024-01-15'),    # diferencia de valor
+        ('900000005', 1000000, '2024-01-21'),    # conciliado
+        ('900000005', 1000000, '2024-01-22'),    # registrado dos veces en Siigo
+        ('800000000', 700000, '2024-01-05'),     # sin soporte DIAN
+    ])
+    estados = reporte['detalle'].set_index('TERCERO')['ESTADO'].astype(str)
+
+    assert estados['900000001'] == 'Conciliado'
+    assert estados['900000002'] == 'Fecha fuera de rango'
+    assert estados['900000003'] == 'Diferencia de valor'
+    assert estados['900000004'] == 'Falta en Siigo'
+    assert sorted(estados['900000005']) == ['Conciliado', 'Duplicado en Siigo']
+    assert estados['800000000'] == 'Sin soporte DIAN'
+    diferencia = reporte['detalle'].set_index('TERCERO').loc['900000003', 'DIFERENCIA']
+    assert diferencia == 1000
+
+
+def test_mismo_folio_de_proveedores_distintos_no_es_duplicado(procesador, reporte_dian):
+    reporte = conciliar(procesador, reporte_dian, FACTURAS[:2], [
+        ('900000001', 11900000, '2024-01-10'),
+        ('900000002', 2380000, '2024-01-12'),
+    ])
+
+    assert reporte['totales']['Duplicado en DIAN'] == 0
+    assert reporte['conciliado']
+    detalle = reporte['detalle'].set_index('TERCERO')
+    assert detalle.loc['900000001', 'DOCUMENTO'] == '900000001-FE1'
+    assert detalle.loc['900000002', 'DOCUMENTO'] == '900000002-FE1'
+
+
+def test_factura_repetida_en_dian(procesador, reporte_dian):
+    reporte = conciliar(procesador, reporte_dian, [FACTURAS[0], FACTURAS[0]], [
+        ('900000001', 11900000, '2024-01-10'),
+    ])
+
+    assert reporte['totales']['Conciliado'] == 1
+    assert reporte['totales']['Duplicado en DIAN'] == 1
+
+
+def test_movimiento_sin_fecha_queda_fuera_de_rango(procesador, reporte_dian):
+    reporte = conciliar(procesador, reporte_dian, FACTURAS[:1], [
+        ('900000001', 11900000, None),
+    ])
+
+    assert reporte['detalle']['ESTADO'].astype(str).tolist() == ['Fecha fuera de rango']
@@ -0,0 +1,48 @@
+import pandas as pd
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000, 'fecha': '10-01-2024'},
+    {'tercero': '900000001', 'folio': 2, 'total': 5950000, 'iva': 950000, 'fecha': '05-02-2024'},
+    {'tercero': '900000001', 'folio': 3, 'total': 1000000, 'iva': 0, 'fecha': '20-02-2024'},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000, 'fecha': '12-01-2024'},
+]
+
+
+def test_consolida_por_tercero_y_cuenta(procesador, reporte_dian):
+    ruta = reporte_dian(FACTURAS)
+    detalle = procesador.convertir(ruta)['resultado']
+    consolidado = procesador.convertir(ruta, consolidar=True)['resultado']
+
+    lineas = consolidado.set_index(['TERCERO', 'CUENTA'])
+    gasto = procesador.CUENTAS_COMPRAS['gasto']
+    iva = procesador.CUENTAS_COMPRAS['iva_descontable']
+    assert len(consolidado) == 4
+    assert lineas.loc[('900000001', gasto), 'DEBITO'] == 100000 + 50000 + 10000
+    assert lineas.loc[('900000001', gasto), 'FACTURAS'] == 3
+    assert lineas.loc[('900000001', iva), 'DEBITO'] == 19000 + 9500
+    assert lineas.loc[('900000001', iva), 'VALOR_BASE'] == 100000 + 50000
+    assert lineas.loc[('900000001', iva), 'FACTURAS'] == 2
+    assert consolidado['DEBITO'].sum() == detalle['DEBITO'].sum()
+    assert 'DOCUMENTO' not in consolidado.columns
+
+
+def test_consolida_por_periodo(procesador, reporte_dian):
+    consolidado = procesador.convertir(reporte_dian(FACTURAS), consolidar=True, por_periodo=True)['resultado']
+
+    gasto = consolidado[consolidado['CUENTA'] == procesador.CUENTAS_COMPRAS['gasto']]
+    por_mes = gasto.set_index(['PERIODO', 'TERCERO'])['DEBITO']
+    assert por_mes.to_dict() == {('2024-01', '900000001'): 100000, ('2024-01', '900000002'): 20000,
+                                 ('2024-02', '900000001'): 60000}
+
+
+def test_sin_valor_queda_vacio(procesador):
+    detalle = pd.DataFrame({
+        'CUENTA': ['41', '41'], 'CC': '', 'TERCERO': ['1', '1'], 'OBSERVACIONES': 'Venta',
+        'DEBITO': [None, None], 'CREDITO': [100, 200], 'VALOR_BASE': [None, None], 'H': [0, 0],
+        'DOCUMENTO': ['a', 'b'], 'FECHA': pd.to_datetime(['2024-01-01', '2024-01-02']),
+    })
+    consolidado = procesador.consolidar_registros(detalle)
+
+    assert consolidado['CREDITO'].tolist() == [300]
+    assert consolidado['DEBITO'].isna().all()
+    assert consolidado['FACTURAS'].tolist() == [2]
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import dian_a_siigo
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000001', 'folio': 2, 'total': 5000000, 'iva': 0},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000},
+]
+
+
+@pytest.fixture
+def con_indice(procesador, tmp_path):
+    procesador.indice_facturas = dian_a_siigo.IndiceFacturas(tmp_path / 'facturas.idx')
+    return procesador
+
+
+def test_indice_compacto_y_persistente(tmp_path):
+    ruta = tmp_path / 'facturas.idx'
+    indice = dian_a_siigo.IndiceFacturas(ruta)
+
+    assert indice.registrar(np.array([5, 3, 5], dtype=np.uint64)) == 2
+    assert indice.registrar(np.array([3, 9], dtype=np.uint64)) == 1
+    assert ruta.stat().st_size == len(dian_a_siigo.IndiceFacturas.FIRMA) + 3 * 8
+
+    otro = dian_a_siigo.IndiceFacturas(ruta)
+    assert len(otro) == 3
+    assert otro.contiene(np.array([9, 4, 3], dtype=np.uint64)).tolist() == [True, False, True]
+
+
+def test_indice_invalido(tmp_path):
+    ruta = tmp_path / 'facturas.idx'
+    ruta.write_bytes(b'no es un indice')
+
+    with pytest.raises(ValueError):
+        dian_a_siigo.IndiceFacturas(ruta)
+
+
+def test_mismo_folio_de_otro_proveedor_no_es_duplicado(procesador, reporte_dian):
+    df = procesador.leer_archivo_dian(reporte_dian(FACTURAS))
+    huellas = procesador.huellas_facturas(df)
+
+    assert len(set(huellas.tolist())) == 3
+    # Con CUFE la huella no depende del folio ni del proveedor
+    df['CUFE/CUDE'] = ['ABC', 'abc ', 'otro']
+    con_cufe = procesador.huellas_facturas(df)
+    assert con_cufe[0] == con_cufe[1] != con_cufe[2]
+
+
+def test_repetidas_en_el_archivo_y_ya_procesadas(con_indice, reporte_dian):
+    con_indice.convertir(reporte_dian(FACTURAS[:2], nombre='enero.csv'))
+    con_indice.registrar_facturas()
+
+    conversion = con_indice.convertir(reporte_dian(FACTURAS + FACTURAS[2:], nombre='febrero.csv'))
+    motivos = conversion['validacion']['anomalias'].set_index('DOCUMENTO')['MOTIVO']
+
+    assert motivos.to_dict() == {'900000001-FE1': 'Factura ya procesada antes',
+                                 '900000001-FE2': 'Factura ya procesada antes',
+                                 '900000002-FE1': 'Factura repetida en el archivo'}
+    # Solo se señalan: sin excluir_duplicados se convierten todas
+    assert conversion['n_facturas'] == 4
+
+
+def test_excluir_duplicadas(con_indice, reporte_dian):
+    con_indice.excluir_duplicados = True
+    con_indice.convertir(reporte_dian(FACTURAS[:1], nombre='enero.csv'))
+    con_indice.registrar_facturas()
+
+    conversion = con_indice.convertir(reporte_dian(FACTURAS, nombre='febrero.csv'))
+
+    assert sorted(conversion['resultado']['DOCUMENTO'].unique()) == ['900000001-FE2', '900000002-FE1']
+    assert conversion['validacion']['anomalias']['MOTIVO'].tolist() == ['Factura ya procesada antes (excluida)']
+
+
+def test_convertir_no_registra_hasta_guardar(con_indice, reporte_dian):
+    ruta = reporte_dian(FACTURAS)
+    con_indice.convertir(ruta)
+    con_indice.convertir(ruta)
+
+    assert len(con_indice.indice_facturas) == 0
+    assert con_indice.registrar_facturas() == 3
+    assert con_indice.registrar_facturas() == 0
@@ -0,0 +1,110 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import pytest
+
+import dian_a_siigo
+
+
+@pytest.fixture
+def espacio(tmp_path):
+    espacio = dian_a_siigo.EspacioTrabajo(tmp_path / 'espacio.db')
+    espacio.guardar_cliente('Ferretería', cuentas_compras={'gasto': '51050501'})
+    espacio.guardar_cliente('Panadería')
+    return espacio
+
+
+def test_cola_por_prioridad_y_antiguedad(espacio, tmp_path):
+    primero, segundo = espacio.encolar('Ferretería', [tmp_path / 'a.csv', tmp_path / 'b.csv'])
+    [urgente] = espacio.encolar('Panadería', [tmp_path / 'c.csv'], prioridad=5)
+
+    tomados = [espacio.tomar_trabajo('p1') for _ in range(4)]
+
+    assert [t['id'] for t in tomados[:3]] == [urgente, primero, segundo]
+    assert tomados[3] is None
+    assert tomados[1]['cliente']['cuentas_compras'] == {'gasto': '51050501'}
+    assert tomados[0]['intentos'] == 1
+    assert espacio.pendientes() == 3
+
+
+def test_reintentar_y_cancelar(espacio, tmp_path):
+    fallido, pendiente = espacio.encolar('Ferretería', [tmp_path / 'a.csv', tmp_path / 'b.csv'])
+    espacio.tomar_trabajo('p1')
+    espacio.fallar_trabajo(fallido, 'archivo dañado')
+    espacio.cancelar([pendiente])
+
+    estados = espacio.trabajos().set_index('id')
+    assert estados.loc[fallido, 'estado'] == 'error'
+    assert estados.loc[fallido, 'error'] == 'archivo dañado'
+    assert estados.loc[pendiente, 'estado'] == 'cancelado'
+
+    espacio.reintentar([fallido, pendiente])
+    estados = espacio.trabajos().set_index('id')
+    assert (estados['estado'] == 'en cola').all()
+    assert estados.loc[fallido, 'intentos'] == 0
+
+
+def test_recupera_solo_trabajos_sin_latidos(espacio, tmp_path):
+    vivo, abandonado = espacio.encolar('Ferretería', [tmp_path / 'a.csv', tmp_path / 'b.csv'])
+    espacio.tomar_trabajo('vivo')
+    espacio.tomar_trabajo('caido')
+    hace_rato = (datetime.now() - timedelta(minutes=5)).isoformat(timespec='seconds')
+    espacio._conexion().execute("UPDATE trabajos SET latido = ? WHERE dueno = 'caido'", (hace_rato,))
+
+    assert espacio.recuperar_interrumpidos() == 1
+    estados = espacio.trabajos().set_index('id')['estado']
+    assert estados[vivo] == 'procesando'
+    assert estados[abandonado] == 'en cola'
+    assert espacio.tomar_trabajo('otro')['id'] == abandonado
+
+
+def test_max_intentos_al_tomar(espacio, tmp_path):
+    [trabajo] = espacio.encolar('Ferretería', [tmp_path / 'a.csv'])
+    for _ in range(2):
+        assert espacio.tomar_trabajo('p1', max_intentos=2)['id'] == trabajo
+        espacio.fallar_trabajo(trabajo, 'se cayó el proceso', reintentar=True)
+
+    assert espacio.tomar_trabajo('p1', max_intentos=2) is None
+    fila = espacio.trabajos().iloc[0]
+    assert fila['estado'] == 'error'
+    assert fila['error'] == 'Se agotaron los 2 intentos: se cayó el proceso'
+
+
+def test_interrupcion_no_gasta_intentos(espacio, tmp_path):
+    [trabajo] = espacio.encolar('Ferretería', [tmp_path / 'a.csv'])
+    for _ in range(3):
+        espacio.tomar_trabajo('p1', max_intentos=2)
+        espacio.fallar_trabajo(trabajo, 'Interrumpido', reintentar=True, contar_intento=False)
+
+    assert espacio.tomar_trabajo('p1', max_intentos=2)['intentos'] == 1
+
+
+class PoolQueSeRompe:
+    """Pool cuyas conversiones terminan siempre con el proceso caído"""
+
+    def submit(self, *args):
+        futuro = Future()
+        futuro.set_exception(BrokenProcessPool('proceso terminado abruptamente'))
+        return futuro
+
+
+def test_archivo_que_tumba_el_pool_no_se_reintenta_sin_fin(espacio, tmp_path):
+    [trabajo] = espacio.encolar('Ferretería', [tmp_path / 'a.csv'])
+    planificador = dian_a_siigo.PlanificadorTrabajos(espacio, carpeta_salida=tmp_path / 'salidas',
+                                                     trabajadores=1, memoria=2 ** 30, max_intentos=2)
+    pool = PoolQueSeRompe()
+
+    roturas = 0
+    for _ in range(10):
+        try:
+            planificador.revisar(pool)
+        except BrokenProcessPool:
+            roturas += 1
+        if not planificador.en_curso and espacio.pendientes() == 0:
+            break
+
+    assert roturas == 2
+    fila = espacio.trabajos().set_index('id').loc[trabajo]
+    assert fila['estado'] == 'error'
+    assert fila['error'].startswith('Se agotaron los 2 intentos')
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from conftest import filas_dian
+
+
+def factura(folio, tercero='900000001'):
+    return {'tercero': tercero, 'folio': folio, 'total': 11900000, 'iva': 1900000}
+
+
+@pytest.fixture
+def libro_varias_hojas(tmp_path):
+    """Enero (con títulos antes del encabezado), una hoja vacía, Febrero y una continuación sin encabezado"""
+    ruta = tmp_path / 'Recibidos.xlsx'
+    with pd.ExcelWriter(ruta, engine='openpyxl') as libro:
+        filas_dian([factura(1), factura(2)]).to_excel(libro, sheet_name='Enero', index=False, startrow=2)
+        libro.sheets['Enero'].cell(row=1, column=1, value='Documentos recibidos enero')
+        pd.DataFrame().to_excel(libro, sheet_name='Vacía', index=False)
+        filas_dian([factura(3), factura(1, '900000002')]).to_excel(libro, sheet_name='Febrero', index=False)
+        filas_dian([factura(4)]).to_excel(libro, sheet_name='Continuación', index=False, header=False)
+    return ruta
+
+
+def test_lee_todas_las_hojas(procesador, libro_varias_hojas):
+    df = procesador.leer_archivo_dian(libro_varias_hojas)
+
+    assert df['Hoja Origen'].tolist() == ['Enero', 'Enero', 'Febrero', 'Febrero', 'Continuación']
+    assert df['Folio'].tolist() == ['1', '2', '3', '1', '4']
+    assert df['Total'].tolist() == [11900000] * 5
+
+
+def test_convierte_el_libro_completo(procesador, libro_varias_hojas):
+    conversion = procesador.convertir(libro_varias_hojas)
+
+    assert conversion['tipo'] == 'compras'
+    assert conversion['n_facturas'] == 5
+    assert conversion['resultado']['DOCUMENTO'].nunique() == 5
+    assert conversion['validacion']['cuadrado']
+
+
+def test_hoja_sin_encabezados_reconocibles_se_ignora(procesador, tmp_path):
+    ruta = tmp_path / 'Recibidos.xlsx'
+    with pd.ExcelWriter(ruta, engine='openpyxl') as libro:
+        filas_dian([factura(1)]).to_excel(libro, sheet_name='Datos', index=False)
+        pd.DataFrame({'a': ['x', 'y'], 'b': ['z', 'w']}).to_excel(libro, sheet_name='Notas', index=False)
+
+    df = procesador.leer_archivo_dian(ruta)
+
+    assert df['Hoja Origen'].tolist() == ['Datos']
@@ -0,0 +1,44 @@
+import ast
+import inspect
+import tkinter as tk
+
+import pytest
+
+import dian_a_siigo
+
+
+def test_la_interfaz_solo_usa_metodos_que_existen():
+    """Todo self.<nombre> que la interfaz usa sin asignarlo debe ser un método (p. ej. un command=)"""
+    clase = ast.parse(inspect.getsource(dian_a_siigo.AplicacionDIAN))
+    usados, asignados = set(), set()
+    for nodo in ast.walk(clase):
+        if isinstance(nodo, ast.Attribute) and isinstance(nodo.value, ast.Name) and nodo.value.id == 'self':
+            (asignados if isinstance(nodo.ctx, ast.Store) else usados).add(nodo.attr)
+
+    faltantes = {nombre for nombre in usados - asignados if not hasattr(dian_a_siigo.AplicacionDIAN, nombre)}
+    assert not faltantes
+
+
+@pytest.fixture
+def ventana(tmp_path, monkeypatch):
+    try:
+        raiz = tk.Tk()
+    except tk.TclError:
+        pytest.skip("Sin pantalla para Tk")
+    monkeypatch.setattr(dian_a_siigo, 'ARCHIVO_INDICE_FACTURAS', tmp_path / 'facturas.idx')
+    monkeypatch.setattr(dian_a_siigo, 'ARCHIVO_ESPACIO_TRABAJO', tmp_path / 'espacio.db')
+    monkeypatch.setattr(dian_a_siigo, 'CARPETA_RESULTADOS', tmp_path / 'resultados')
+    yield raiz
+    raiz.destroy()
+
+
+def test_construye_la_ventana(ventana):
+    app = dian_a_siigo.AplicacionDIAN(ventana)
+    ventana.update_idletasks()
+
+    filas = [app.fila_exportar.winfo_children(), app.fila_revision.winfo_children()]
+    assert [len(fila) for fila in filas] == [5, 5]
+    assert app.btn_cambios in filas[1]
+    assert all(str(boton['state']) == tk.DISABLED for fila in filas for boton in fila)
+    # Cada fila cabe en la ventana de 1000 px
+    assert all(sum(boton.winfo_reqwidth() + 10 for boton in fila) < 1000 - 60 for fila in filas)
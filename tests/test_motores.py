@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+import dian_a_siigo
+from conftest import filas_dian
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000002', 'folio': 7, 'total': 10500050, 'iva': 500049},
+]
+
+
+@pytest.fixture
+def libro(tmp_path):
+    ruta = tmp_path / 'Recibidos.xlsx'
+    filas_dian(FACTURAS).to_excel(ruta, index=False)
+    return ruta
+
+
+@pytest.mark.parametrize('nombre, extension', [
+    ('Recibidos.xlsx', '.xlsx'), ('datos.CSV', '.csv'), ('datos.csv.gz', '.csv'), ('datos.gz', '.gz'),
+])
+def test_extension_datos(nombre, extension):
+    assert dian_a_siigo.extension_datos(nombre) == extension
+
+
+def test_orden_de_motores_por_tamano_y_preferencia(monkeypatch):
+    monkeypatch.setattr(dian_a_siigo, 'motor_disponible', lambda motor: motor in ('openpyxl', 'calamine', 'csv'))
+    umbral = dian_a_siigo.UMBRAL_MOTOR_RAPIDO
+
+    assert dian_a_siigo.motores_para_archivo('a.xlsx', tamano=10) == ['openpyxl', 'calamine']
+    assert dian_a_siigo.motores_para_archivo('a.xlsx', tamano=umbral) == ['calamine', 'openpyxl']
+    assert dian_a_siigo.motores_para_archivo('a.xlsx', 'calamine', tamano=10) == ['calamine', 'openpyxl']
+    assert dian_a_siigo.motores_para_archivo('a.xls', tamano=10) == ['calamine']
+    assert dian_a_siigo.motores_para_archivo('a.csv', tamano=10) == ['csv']
+
+
+def test_motor_no_instalado_se_omite(monkeypatch):
+    monkeypatch.setattr(dian_a_siigo, 'motor_disponible', lambda motor: motor != 'calamine')
+
+    assert dian_a_siigo.motores_para_archivo('a.xlsx', tamano=dian_a_siigo.UMBRAL_MOTOR_RAPIDO) == ['openpyxl']
+    assert dian_a_siigo.motores_para_archivo('a.ods', tamano=10) == []
+
+
+@pytest.mark.skipif(not dian_a_siigo.motor_disponible('calamine'), reason="calamine no está instalado")
+def test_motores_leen_lo_mismo(procesador, libro):
+    lecturas = {}
+    for motor in ['openpyxl', 'calamine']:
+        procesador.motor_lectura = motor
+        lecturas[motor] = procesador.leer_archivo_dian(libro)
+        assert procesador.ultima_lectura['motor'] == motor
+        assert procesador.ultima_lectura['segundos'] >= 0
+
+    pd.testing.assert_frame_equal(lecturas['openpyxl'], lecturas['calamine'])
+
+
+@pytest.mark.skipif(not dian_a_siigo.motor_disponible('calamine'), reason="calamine no está instalado")
+def test_si_un_motor_falla_se_usa_el_siguiente(procesador, libro, monkeypatch):
+    leer_hojas = procesador._leer_hojas
+
+    def falla_openpyxl(ruta, motor):
+        if motor == 'openpyxl':
+            raise ValueError('archivo dañado para openpyxl')
+        return leer_hojas(ruta, motor)
+
+    monkeypatch.setattr(procesador, '_leer_hojas', falla_openpyxl)
+    df = procesador.leer_archivo_dian(libro)
+
+    assert procesador.ultima_lectura['motor'] == 'calamine'
+    assert df['Folio'].tolist() == ['1', '7']
+
+
+def test_sin_motores_que_funcionen_se_informa_el_error(procesador, libro, monkeypatch):
+    def falla(ruta, motor):
+        raise ValueError(f'falla {motor}')
+
+    monkeypatch.setattr(procesador, '_leer_hojas', falla)
+    monkeypatch.setattr(dian_a_siigo, 'motores_para_archivo', lambda *args, **kwargs: ['openpyxl'])
+
+    with pytest.raises(Exception, match='falla openpyxl'):
+        procesador.leer_archivo_dian(libro)
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from conftest import NIT_EMPRESA
+
+DOCUMENTOS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000001', 'folio': 2, 'total': -2380000, 'iva': -380000, 'prefijo': 'NC',
+     'tipo': 'Nota crédito electrónica'},
+    {'tercero': '900000001', 'folio': 3, 'total': 595000, 'iva': 95000, 'prefijo': 'ND',
+     'tipo': 'Nota Débito electrónica'},
+    {'tercero': '900000001', 'folio': 4, 'total': 0, 'iva': 0, 'prefijo': 'AR',
+     'tipo': 'Application response'},
+]
+
+
+def lineas(resultado, documento):
+    filas = resultado[resultado['DOCUMENTO'] == documento]
+    return [[cuenta, None if pd.isna(debito) else debito, None if pd.isna(credito) else credito]
+            for cuenta, debito, credito in zip(filas['CUENTA'], filas['DEBITO'], filas['CREDITO'])]
+
+
+def test_clasifica_los_tipos_de_documento(procesador, reporte_dian):
+    df = procesador.leer_archivo_dian(reporte_dian(DOCUMENTOS))
+
+    # Las Application Responses se descartan al leer
+    assert df['Clase Documento'].tolist() == ['Factura', 'Nota crédito', 'Nota débito']
+    assert str(df['Clase Documento'].dtype) == 'category'
+
+
+@pytest.mark.parametrize('texto, clase', [
+    ('Factura electrónica de venta', 'Factura'),
+    ('Nota crédito electrónica', 'Nota crédito'),
+    ('NOTA CREDITO', 'Nota crédito'),
+    ('Nota débito electrónica', 'Nota débito'),
+    ('ApplicationResponse', 'Application response'),
+    ('Documento soporte', 'Otro'),
+])
+def test_clasificar_tipo_documento(procesador, texto, clase):
+    assert procesador.clasificar_tipo_documento(texto) == clase
+
+
+def test_compras_nota_credito_reversa_y_nota_debito_suma(procesador, reporte_dian):
+    resultado = procesador.convertir(reporte_dian(DOCUMENTOS), tipo='compras')['resultado']
+    gasto, iva = procesador.CUENTAS_COMPRAS['gasto'], procesador.CUENTAS_COMPRAS['iva_descontable']
+
+    assert lineas(resultado, '900000001-FE1') == [[gasto, 100000, None], [iva, 19000, None]]
+    assert lineas(resultado, '900000001-NC2') == [[gasto, None, 20000], [iva, None, 3800]]
+    assert lineas(resultado, '900000001-ND3') == [[gasto, 5000, None], [iva, 950, None]]
+    assert resultado['DOCUMENTO'].nunique() == 3
+
+
+def test_ventas_nota_credito_reversa(procesador, reporte_dian):
+    conversion = procesador.convertir(reporte_dian(DOCUMENTOS, 'ventas'), tipo='ventas')
+    resultado = conversion['resultado']
+    cuentas = procesador.CUENTAS_VENTAS
+
+    assert lineas(resultado, f'{NIT_EMPRESA}-NC2') == [[cuentas['ingresos'], 20000, None],
+                                                       [cuentas['iva_generado'], 3800, None],
+                                                       [cuentas['iva_credito'], None, 23800]]
+    assert conversion['validacion']['cuadrado']
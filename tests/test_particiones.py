@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000, 'fecha': '10-01-2024'},
+    {'tercero': '900000001', 'folio': 2, 'total': 5000000, 'iva': 0, 'fecha': '11-01-2024'},
+    {'tercero': '900000002', 'folio': 3, 'total': 2380000, 'iva': 380000, 'fecha': '12-01-2024'},
+    {'tercero': '900000002', 'folio': 4, 'total': 1190000, 'iva': 190000, 'fecha': '03-02-2024'},
+]
+
+
+@pytest.fixture
+def resultado(procesador, reporte_dian):
+    return procesador.convertir(reporte_dian(FACTURAS))['resultado']
+
+
+def test_particiona_por_mes(procesador, resultado):
+    particiones = dict(procesador.particionar_resultado(resultado))
+
+    assert list(particiones) == ['2024-01', '2024-02']
+    assert particiones['2024-01']['DOCUMENTO'].nunique() == 3
+    assert particiones['2024-02']['DOCUMENTO'].tolist() == ['900000002-FE4'] * 2
+
+
+@pytest.mark.parametrize('max_filas', [1, 2, 3, 4, 5])
+def test_nunca_separa_las_lineas_de_una_factura(procesador, resultado, max_filas):
+    particiones = procesador.particionar_resultado(resultado, por_periodo=False, max_filas=max_filas)
+
+    pd.testing.assert_frame_equal(pd.concat([parte for _, parte in particiones]), resultado)
+    documentos = [set(parte['DOCUMENTO']) for _, parte in particiones]
+    if max_filas >= 2:
+        # Las facturas tienen 1 o 2 líneas: con cupo para 2 ninguna se parte
+        assert all(not (a & b) for a, b in zip(documentos, documentos[1:]))
+        assert all(len(parte) <= max_filas for _, parte in particiones)
+    if len(particiones) > 1:
+        assert [nombre for nombre, _ in particiones][:2] == ['Siigo_parte1', 'Siigo_parte2']
+
+
+def test_cortes_por_documento(procesador):
+    grupo = pd.DataFrame({'DOCUMENTO': ['a', 'a', 'b', 'c', 'c', 'c', 'd']})
+
+    assert procesador._cortes_por_documento(grupo, 3) == [0, 3, 6, 7]
+    # Un documento más largo que el cupo se corta por dentro
+    assert procesador._cortes_por_documento(grupo, 2) == [0, 2, 3, 5, 7]
+    assert procesador._cortes_por_documento(grupo.iloc[:0], 2) == [0, 0]
+    assert procesador._cortes_por_documento(pd.DataFrame({'X': range(5)}), 2) == [0, 2, 4, 5]
+
+
+@pytest.mark.parametrize('en_hojas', [False, True])
+def test_exporta_particiones_con_manifiesto(procesador, resultado, tmp_path, en_hojas):
+    ruta = tmp_path / 'Compras.xlsx'
+    manifiesto = procesador.exportar_particiones(resultado, ruta, en_hojas=en_hojas)
+
+    assert manifiesto['PARTICION'].tolist() == ['2024-01', '2024-02']
+    assert manifiesto['FILAS'].tolist() == [5, 2]
+    assert manifiesto['FACTURAS'].tolist() == [3, 1]
+    assert manifiesto['DEBITO'].sum() == resultado['DEBITO'].sum()
+    assert (tmp_path / 'Compras_manifiesto.csv').exists()
+    for fila in manifiesto.itertuples():
+        hoja = pd.read_excel(tmp_path / fila.ARCHIVO, sheet_name=fila.HOJA)
+        assert len(hoja) == fila.FILAS
@@ -0,0 +1,93 @@
+import gzip
+
+import pandas as pd
+import pytest
+
+import dian_a_siigo
+from conftest import filas_dian
+
+FACTURAS = [{'tercero': '900000001', 'folio': folio, 'total': 11900000, 'iva': 1900000} for folio in range(1, 4)]
+
+
+def test_presupuesto_es_una_fraccion_de_la_ram(monkeypatch):
+    monkeypatch.setattr(dian_a_siigo, 'memoria_fisica', lambda: 8 * 1024 ** 3)
+    assert dian_a_siigo.presupuesto_memoria() == int(8 * 1024 ** 3 * dian_a_siigo.FRACCION_MEMORIA)
+
+    monkeypatch.setattr(dian_a_siigo, 'memoria_fisica', lambda: None)
+    assert dian_a_siigo.presupuesto_memoria() == dian_a_siigo.PRESUPUESTO_MEMORIA_RESPALDO
+
+
+def test_estima_csv_sin_leerlo_completo(procesador, reporte_dian, tmp_path):
+    estimacion = procesador.estimar_archivo(reporte_dian(FACTURAS))
+
+    assert estimacion['formato'] == 'csv'
+    assert estimacion['metodo'] == 'conteo exacto'
+    assert estimacion['filas'] == len(FACTURAS) + 1
+    assert estimacion['columnas'] == 11
+
+    comprimido = tmp_path / 'Recibidos.csv.gz'
+    comprimido.write_bytes(gzip.compress(filas_dian(FACTURAS).to_csv(index=False).encode('utf-8')))
+    assert procesador.estimar_archivo(comprimido)['filas'] == len(FACTURAS) + 1
+
+
+def test_estima_xlsx_por_la_dimension_de_las_hojas(procesador, tmp_path):
+    ruta = tmp_path / 'Recibidos.xlsx'
+    with pd.ExcelWriter(ruta, engine='openpyxl') as libro:
+        filas_dian(FACTURAS).to_excel(libro, sheet_name='Enero', index=False)
+        filas_dian(FACTURAS[:1]).to_excel(libro, sheet_name='Febrero', index=False)
+
+    estimacion = procesador.estimar_archivo(ruta)
+
+    assert estimacion['formato'] == 'excel'
+    assert estimacion['metodo'] == 'dimensión de las hojas'
+    assert estimacion['filas'] == (len(FACTURAS) + 1) + 2
+    assert estimacion['columnas'] == 11
+
+
+def test_archivo_pequeno_se_convierte_en_memoria(procesador, reporte_dian):
+    plan = procesador.planificar_conversion(reporte_dian(FACTURAS))
+
+    assert plan['modo'] == 'memoria'
+    assert plan['tamano_bloque'] is None
+    assert plan['memoria_en_memoria'] <= plan['presupuesto']
+
+
+def test_archivo_que_excede_el_presupuesto_va_por_bloques(procesador, reporte_dian):
+    ruta = reporte_dian(FACTURAS)
+    procesador.TAMANO_BLOQUE, procesador.TAMANO_BLOQUE_MINIMO = 1000, 1
+    completo = procesador.planificar_conversion(ruta)['memoria_en_memoria']
+
+    plan = procesador.planificar_conversion(ruta, presupuesto=completo - 1)
+
+    assert plan['modo'] == 'bloques'
+    assert plan['motivo'] == 'excede el presupuesto'
+    assert 1 <= plan['tamano_bloque'] < len(FACTURAS) + 1
+    assert plan['memoria_en_bloques'] <= plan['presupuesto']
+
+
+def test_bloques_respetan_los_limites_de_tamano(procesador, reporte_dian):
+    ruta = reporte_dian(FACTURAS)
+
+    plan = procesador.planificar_conversion(ruta, presupuesto=1)
+
+    assert plan['modo'] == 'bloques'
+    assert plan['tamano_bloque'] == procesador.TAMANO_BLOQUE_MINIMO
+    assert 'el resultado final por sí solo' in plan['motivo']
+
+
+def test_presupuesto_configurado_en_el_procesador(procesador, reporte_dian):
+    procesador.presupuesto_memoria = 1
+
+    assert procesador.planificar_conversion(reporte_dian(FACTURAS))['modo'] == 'bloques'
+
+
+@pytest.mark.parametrize('extension', ['.xls', '.ods', '.zip'])
+def test_formatos_sin_lectura_por_bloques_quedan_en_memoria(procesador, tmp_path, extension):
+    ruta = tmp_path / f'Recibidos{extension}'
+    ruta.write_bytes(b'\x00' * 4000)
+
+    plan = procesador.planificar_conversion(ruta, presupuesto=1)
+
+    assert plan['modo'] == 'memoria'
+    assert plan['motivo'] == 'excede el presupuesto'
+    assert 'no se puede leer por bloques' in plan['advertencia']
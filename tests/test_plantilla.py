@@ -0,0 +1,98 @@
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.styles import Font, PatternFill
+
+import dian_a_siigo
+
+ASIENTOS = pd.DataFrame({
+    'CUENTA': ['14350101', '24080201', '22050501'],
+    'DOCUMENTO': ['900000001-FE1', '900000001-FE1', '900000001-FE1'],
+    'DEBITO': [100000, 19000, None],
+    'CREDITO': [None, None, 119000],
+})
+AMARILLO = 'FFFFFF00'
+
+
+@pytest.fixture
+def plantilla(tmp_path):
+    """Portada con estilo propio y hoja 'Asientos' con título y una fila vacía con formato en la fila 3"""
+    ruta = tmp_path / 'plantilla.xlsx'
+    libro = openpyxl.Workbook()
+    portada = libro.active
+    portada.title = 'Portada'
+    portada['A1'] = 'Empresa & Cía'
+    portada['A1'].font = Font(bold=True)
+    hoja = libro.create_sheet('Asientos')
+    hoja['A1'] = 'Comprobante de compras'
+    hoja['A3'].fill = PatternFill('solid', start_color=AMARILLO)
+    hoja['C3'].fill = PatternFill('solid', start_color=AMARILLO)
+    libro.save(ruta)
+    return ruta
+
+
+def test_hojas_en_orden(plantilla):
+    assert [nombre for nombre, _ in dian_a_siigo.hojas_plantilla(plantilla)] == ['Portada', 'Asientos']
+
+
+def test_escribe_desde_la_celda_de_inicio(plantilla, tmp_path):
+    salida = dian_a_siigo.escribir_en_plantilla(plantilla, tmp_path / 'salida.xlsx', ASIENTOS,
+                                                hoja='Asientos', celda_inicio='B3')
+    libro = openpyxl.load_workbook(salida)
+    hoja = libro['Asientos']
+
+    assert hoja['A1'].value == 'Comprobante de compras'
+    assert [[c.value for c in fila] for fila in hoja['B3:E5']] == [
+        ['14350101', '900000001-FE1', 100000, None],
+        ['24080201', '900000001-FE1', 19000, None],
+        ['22050501', '900000001-FE1', None, 119000],
+    ]
+    assert hoja['D3'].number_format == hoja['E5'].number_format == '#.##0,00'
+    assert hoja.max_row == 5
+    assert hoja.calculate_dimension() == 'A1:E5'
+
+
+def test_conserva_el_resto_del_libro(plantilla, tmp_path):
+    salida = dian_a_siigo.escribir_en_plantilla(plantilla, tmp_path / 'salida.xlsx', ASIENTOS,
+                                                hoja='Asientos', celda_inicio='B3')
+    libro = openpyxl.load_workbook(salida)
+
+    assert libro.sheetnames == ['Portada', 'Asientos']
+    assert libro['Portada']['A1'].value == 'Empresa & Cía'
+    assert libro['Portada']['A1'].font.bold
+    # La fila con formato recibe los datos sin perder el estilo de sus celdas
+    assert libro['Asientos']['A3'].fill.start_color.rgb == AMARILLO
+    assert libro['Asientos']['C3'].fill.start_color.rgb == AMARILLO
+    assert libro['Asientos']['C3'].value == '900000001-FE1'
+
+
+def test_primera_hoja_por_defecto(plantilla, tmp_path):
+    salida = dian_a_siigo.escribir_en_plantilla(plantilla, tmp_path / 'salida.xlsx', ASIENTOS)
+    portada = openpyxl.load_workbook(salida)['Portada']
+
+    assert portada['A1'].value == 'Empresa & Cía'
+    assert portada['A2'].value == '14350101'
+    assert portada['C2'].value == 100000
+
+
+def test_no_sobrescribe_contenido_de_la_plantilla(plantilla, tmp_path):
+    with pytest.raises(ValueError, match='contenido en la fila 1'):
+        dian_a_siigo.escribir_en_plantilla(plantilla, tmp_path / 'salida.xlsx', ASIENTOS,
+                                           hoja='Asientos', celda_inicio='A1')
+
+
+def test_hoja_inexistente(plantilla, tmp_path):
+    with pytest.raises(ValueError, match="no tiene la hoja 'Compras'"):
+        dian_a_siigo.escribir_en_plantilla(plantilla, tmp_path / 'salida.xlsx', ASIENTOS, hoja='Compras')
+
+
+def test_formato_de_pesos_se_reutiliza():
+    estilos = ('<styleSheet><numFmts count="1"><numFmt formatCode="#.##0,00" numFmtId="170"/></numFmts>'
+               '<cellXfs count="1"><xf numFmtId="0"/></cellXfs></styleSheet>')
+
+    nuevos, indice = dian_a_siigo._estilo_pesos(estilos)
+
+    assert indice == 1
+    assert nuevos.count('<numFmt ') == 1
+    assert '<xf numFmtId="170"' in nuevos
+    assert '<cellXfs count="2">' in nuevos
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dian_a_siigo
+
+
+def sin_categorias(df):
+    """Las columnas de texto vuelven como categóricas: compararlas como texto"""
+    return df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+
+
+@pytest.fixture
+def tabla():
+    return pd.DataFrame({
+        'CUENTA': ['14350101', '24080201', None, '14350101'],
+        'DESCRIPCION': ['Compra café', '', 'IVA 19%', 'Compra café'],
+        'DEBITO': pd.array([100000, None, 19000, 5], dtype='Int64'),
+        'TASA': [0.19, 0.05, np.nan, 0.0],
+        'ENTERO': np.array([1, 2, 3, 4], dtype='int64'),
+        'REVERSA': [False, True, False, False],
+        'FECHA': pd.to_datetime(['2024-01-15', '2024-01-16', '2024-02-01', '2024-02-29']),
+    })
+
+
+def test_ida_y_vuelta_conserva_valores_y_tipos(tabla, tmp_path):
+    descriptor = dian_a_siigo.publicar_resultado(tabla, carpeta=tmp_path)
+    df = dian_a_siigo.abrir_resultado(descriptor)
+
+    assert descriptor['filas'] == 4
+    assert isinstance(df['CUENTA'].dtype, pd.CategoricalDtype)
+    assert df['DEBITO'].dtype == 'Int64'
+    pd.testing.assert_frame_equal(sin_categorias(df), tabla.astype({'CUENTA': object, 'DESCRIPCION': object}))
+
+
+def test_columnas_son_vistas_del_archivo(tabla, tmp_path):
+    df = dian_a_siigo.abrir_resultado(dian_a_siigo.publicar_resultado(tabla, carpeta=tmp_path))
+
+    for col in ['ENTERO', 'TASA']:
+        base = df[col].to_numpy()
+        while base.base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        assert isinstance(base, np.memmap)
+
+
+def test_eliminar_borra_el_archivo_y_los_datos_siguen_mapeados(tabla, tmp_path):
+    descriptor = dian_a_siigo.publicar_resultado(tabla, carpeta=tmp_path)
+
+    df = dian_a_siigo.abrir_resultado(descriptor)
+
+    assert list(tmp_path.iterdir()) == []
+    assert df['DEBITO'].sum() == 119005
+
+
+def test_cambios_en_el_proceso_no_modifican_el_archivo(tabla, tmp_path):
+    descriptor = dian_a_siigo.publicar_resultado(tabla, carpeta=tmp_path)
+    df = dian_a_siigo.abrir_resultado(descriptor, eliminar=False)
+
+    df.loc[0, 'ENTERO'] = 99
+
+    assert dian_a_siigo.abrir_resultado(descriptor)['ENTERO'].tolist() == [1, 2, 3, 4]
+
+
+def test_tabla_vacia(tabla, tmp_path):
+    df = dian_a_siigo.abrir_resultado(dian_a_siigo.publicar_resultado(tabla.iloc[:0], carpeta=tmp_path))
+
+    assert df.empty
+    assert df.columns.tolist() == tabla.columns.tolist()
+
+
+def test_conversion_en_proceso_aparte_devuelve_el_mismo_resultado(procesador, reporte_dian, tmp_path, monkeypatch):
+    monkeypatch.setattr(dian_a_siigo.publicar_resultado, '__defaults__', (tmp_path / 'resultados',))
+    facturas = [{'tercero': f'90000000{i}', 'folio': i, 'total': 11900000, 'iva': 1900000} for i in range(1, 4)]
+    ruta = reporte_dian(facturas)
+
+    compartida = dian_a_siigo._conversion_compartida(ruta, {'tipo': 'compras', 'tamano_bloque': 2})
+    esperada = procesador.convertir(ruta, tipo='compras')
+
+    assert isinstance(compartida['resultado'], dict)
+    resultado = dian_a_siigo.abrir_resultado(compartida['resultado'])
+    pd.testing.assert_frame_equal(sin_categorias(resultado), esperada['resultado'], check_dtype=False)
+    assert len(dian_a_siigo.abrir_resultado(compartida['validacion']['por_factura'])) == 3
+    assert list((tmp_path / 'resultados').iterdir()) == []
+
+
+def test_limpiar_resultados_de_sesiones_anteriores(tabla, tmp_path):
+    for _ in range(2):
+        dian_a_siigo.publicar_resultado(tabla, carpeta=tmp_path)
+
+    dian_a_siigo.limpiar_resultados(tmp_path)
+    dian_a_siigo.limpiar_resultados(tmp_path / 'no_existe')
+
+    assert list(tmp_path.iterdir()) == []
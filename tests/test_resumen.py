@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000001', 'folio': 2, 'total': 5000000, 'iva': 0},
+    {'tercero': '900000002', 'folio': 7, 'total': 10500050, 'iva': 500049},
+    {'tercero': '900000002', 'folio': 8, 'total': 1190000, 'iva': 190000, 'prefijo': 'NC',
+     'tipo': 'Nota crédito electrónica'},
+    # IVA del 30 %: más IVA del que admite la base a la tarifa general
+    {'tercero': '900000003', 'folio': 9, 'total': 1000000, 'iva': 300000},
+]
+
+
+@pytest.fixture
+def conversion(procesador, reporte_dian):
+    return procesador.convertir(reporte_dian(FACTURAS))
+
+
+def test_resumen_por_tercero(conversion):
+    terceros = conversion['resumen']['terceros'].set_index('TERCERO')
+
+    assert terceros.index.tolist() == ['900000001', '900000002', '900000003']
+    assert terceros.loc['900000001', ['DOCUMENTOS', 'BASE', 'IVA', 'TOTAL', 'BASE_IVA', 'NO_GRAVADO']].tolist() == \
+        [2, 150000, 19000, 169000, 100000, 50000]
+    # La nota crédito resta: 105.001 - 11.900
+    assert terceros.loc['900000002', ['DOCUMENTOS', 'NOTAS_CREDITO', 'TOTAL', 'IVA']].tolist() == \
+        [2, 1, 93101, 3100]
+    assert terceros.loc['900000003', 'NO_GRAVADO'] == 7000 - 15789
+
+
+def test_resumen_por_cuenta_cuadra_con_los_asientos(conversion):
+    cuentas = conversion['resumen']['cuentas']
+    resultado = conversion['resultado']
+
+    assert cuentas['LINEAS'].sum() == len(resultado)
+    assert cuentas['DEBITO'].sum() == resultado['DEBITO'].sum()
+    assert cuentas['CREDITO'].sum() == resultado['CREDITO'].sum()
+    assert (cuentas['SALDO'] == cuentas['DEBITO'] - cuentas['CREDITO']).all()
+
+
+def test_resumen_de_iva_por_tarifa(conversion):
+    iva = conversion['resumen']['iva'].set_index('TARIFA')
+
+    assert iva.index.tolist() == ['Sin IVA', '19%', '5%', 'Otra']
+    assert iva['DOCUMENTOS'].tolist() == [1, 2, 1, 1]
+    assert iva.loc['19%', ['BASE', 'IVA', 'TOTAL']].tolist() == [100000 - 10000, 19000 - 1900, 119000 - 11900]
+    assert iva['TOTAL'].sum() == conversion['resumen']['terceros']['TOTAL'].sum()
+
+
+def test_totales_del_lote(procesador, conversion):
+    totales = procesador.totales_resumen(conversion['resumen'])
+
+    assert totales['DOCUMENTOS'] == 5
+    assert totales['NOTAS_CREDITO'] == 1
+    assert totales['TOTAL'] == 169000 + 93101 + 10000
+    assert totales['terceros'] == 3
+    assert totales['cuentas'] == len(conversion['resumen']['cuentas'])
+    assert totales['iva_excedido'] == 1
+
+
+def test_resumenes_por_partes_combinan_igual_que_el_completo(procesador, reporte_dian, conversion):
+    partes = [procesador.convertir(reporte_dian(facturas, nombre=f'Recibidos_{i}.csv'))['resumen']
+              for i, facturas in enumerate([FACTURAS[3:], FACTURAS[:3]])]
+
+    combinado = procesador.combinar_resumenes(partes)
+
+    for clave in ['terceros', 'cuentas', 'iva']:
+        pd.testing.assert_frame_equal(combinado[clave], conversion['resumen'][clave])
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import urllib.error
+import urllib.request
+import zipfile
+
+import dian_a_siigo
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000},
+]
+
+
+def solicitar(url, datos=None, headers=None):
+    """(estado, cuerpo) de una petición; los errores HTTP también se devuelven"""
+    peticion = urllib.request.Request(url, data=datos, headers=headers or {},
+                                      method='POST' if datos is not None else 'GET')
+    try:
+        with urllib.request.urlopen(peticion, timeout=30) as respuesta:
+            return respuesta.status, respuesta.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def con_servidor(tmp_path, prueba):
+    """Ejecuta prueba(base, servidor, pedir) con un ServidorConversion en un puerto libre"""
+    async def principal():
+        servidor = dian_a_siigo.ServidorConversion(puerto=0, trabajadores=1, carpeta=tmp_path / 'servidor',
+                                                   memoria=2 ** 30)
+        await servidor.iniciar()
+        loop = asyncio.get_running_loop()
+
+        async def pedir(ruta, datos=None, headers=None):
+            return await loop.run_in_executor(None, solicitar, f'http://127.0.0.1:{servidor.puerto}{ruta}',
+                                              datos, headers)
+
+        try:
+            return await prueba(servidor, pedir)
+        finally:
+            await servidor.detener()
+
+    return asyncio.run(principal())
+
+
+def test_formulario_acepta_comprimidos(tmp_path):
+    async def prueba(servidor, pedir):
+        return await pedir('/')
+
+    estado, pagina = con_servidor(tmp_path, prueba)
+
+    assert estado == 200
+    assert 'accept=".xlsx,.xlsm,.xls,.xlsb,.ods,.csv,.zip,.gz"' in pagina.decode('utf-8')
+
+
+def test_convierte_un_zip_subido(tmp_path, reporte_dian):
+    comprimido = tmp_path / 'Recibidos.zip'
+    with zipfile.ZipFile(comprimido, 'w') as zf:
+        zf.write(reporte_dian(FACTURAS), 'Recibidos.csv')
+
+    async def prueba(servidor, pedir):
+        estado, cuerpo = await pedir('/trabajos?nombre=Recibidos.zip&tipo=compras', comprimido.read_bytes())
+        assert estado == 202
+        trabajo = json.loads(cuerpo)
+        for _ in range(300):
+            _, cuerpo = await pedir(f"/trabajos/{trabajo['id']}")
+            trabajo = json.loads(cuerpo)
+            if trabajo['estado'] in ('terminado', 'error'):
+                break
+            await asyncio.sleep(0.1)
+        return trabajo, await pedir(f"/trabajos/{trabajo['id']}/csv")
+
+    trabajo, (estado, csv) = con_servidor(tmp_path, prueba)
+
+    assert trabajo['estado'] == 'terminado', trabajo['error']
+    assert trabajo['resumen']['facturas'] == 2
+    assert trabajo['vence'] is not None
+    assert estado == 200
+    assert b'900000002' in csv
+
+
+def test_rechaza_extensiones_no_soportadas(tmp_path):
+    async def prueba(servidor, pedir):
+        return await pedir('/trabajos?nombre=factura.pdf', b'%PDF')
+
+    estado, cuerpo = con_servidor(tmp_path, prueba)
+
+    assert estado == 400
+    assert 'factura.pdf' in json.loads(cuerpo)['error']
@@ -0,0 +1,87 @@
+import pytest
+
+import dian_a_siigo
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000},
+]
+CUENTAS = {'14, 51, 61': '51350501'}
+
+
+@pytest.fixture
+def compras(procesador, reporte_dian):
+    return procesador.convertir(reporte_dian(FACTURAS, 'compras'), tipo='compras')['resultado']
+
+
+@pytest.fixture
+def simulado():
+    servidor = dian_a_siigo.ServidorSiigoSimulado().iniciar()
+    yield servidor
+    servidor.detener()
+
+
+def test_un_comprobante_por_factura_aunque_repitan_folio(procesador, compras):
+    comprobantes = procesador.construir_comprobantes(compras, 1, cuenta_contrapartida='22050501', cuentas=CUENTAS)
+
+    assert [c['documento'] for c in comprobantes] == ['900000001-FE1', '900000002-FE1']
+    for comprobante in comprobantes:
+        items = comprobante['cuerpo']['items']
+        assert len({i['customer']['identification'] for i in items}) == 1
+        assert sum(i['value'] if i['account']['movement'] == 'Debit' else -i['value'] for i in items) == 0
+    assert comprobantes[0]['idempotency_key'] != comprobantes[1]['idempotency_key']
+
+
+def test_cuenta_que_no_es_puc_se_rechaza(procesador, compras):
+    with pytest.raises(Exception, match="'14, 51, 61'"):
+        procesador.construir_comprobantes(compras, 1, cuenta_contrapartida='22050501')
+
+    assert procesador.cuentas_no_puc(compras) == ['14, 51, 61']
+    comprobantes = procesador.construir_comprobantes(compras, 1, cuenta_contrapartida='22050501', cuentas=CUENTAS)
+    cuentas = {i['account']['code'] for c in comprobantes for i in c['cuerpo']['items']}
+    assert cuentas == {'51350501', '24080103', '22050501'}
+
+
+def test_compras_sin_contrapartida_no_se_arman(procesador, compras):
+    with pytest.raises(Exception, match='no cuadran'):
+        procesador.construir_comprobantes(compras, 1, cuentas=CUENTAS)
+
+
+def test_ventas_cuadran_sin_contrapartida(procesador, reporte_dian):
+    # En ventas el emisor es la empresa: cada venta tiene su propio folio
+    ventas = [dict(factura, folio=numero) for numero, factura in enumerate(FACTURAS, 1)]
+    resultado = procesador.convertir(reporte_dian(ventas, 'ventas'), tipo='ventas')['resultado']
+
+    assert not (procesador.descuadre_por_documento(resultado) != 0).any()
+    comprobantes = procesador.construir_comprobantes(resultado, 1, cuentas={'41': '41350501'})
+    assert len(comprobantes) == 2
+
+
+def test_reenvio_solo_es_duplicado_si_siigo_lo_dice(procesador, compras, simulado):
+    comprobantes = procesador.construir_comprobantes(compras, 1, cuenta_contrapartida='22050501', cuentas=CUENTAS)
+    cliente = dian_a_siigo.ClienteSiigo('usuario', 'clave', url_base=simulado.url, espera_base=0)
+    try:
+        primero = cliente.publicar_comprobantes(comprobantes)
+        segundo = cliente.publicar_comprobantes(comprobantes)
+    finally:
+        cliente.cerrar()
+
+    assert primero['estado'].tolist() == ['creado', 'creado']
+    assert segundo['estado'].tolist() == ['duplicado', 'duplicado']
+    assert segundo['id'].tolist() == primero['id'].tolist()
+    assert len(simulado.comprobantes) == 2
+
+
+def test_reintentos_ante_fallos_del_servidor(procesador, compras):
+    simulado = dian_a_siigo.ServidorSiigoSimulado(tasa_fallos=0.5).iniciar()
+    cliente = dian_a_siigo.ClienteSiigo('usuario', 'clave', url_base=simulado.url, espera_base=0, reintentos=20)
+    try:
+        comprobantes = procesador.construir_comprobantes(compras, 1, cuenta_contrapartida='22050501',
+                                                         cuentas=CUENTAS)
+        resultado = cliente.publicar_comprobantes(comprobantes)
+    finally:
+        cliente.cerrar()
+        simulado.detener()
+
+    assert resultado['estado'].tolist() == ['creado', 'creado']
+    assert len(simulado.comprobantes) == 2
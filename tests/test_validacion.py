@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from conftest import NIT_EMPRESA
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000001', 'folio': 2, 'total': 5000000, 'iva': 0},
+    {'tercero': '900000002', 'folio': 7, 'total': 10500050, 'iva': 500049},
+    {'tercero': '900000002', 'folio': 8, 'total': 1190000, 'iva': 190000, 'prefijo': 'NC',
+     'tipo': 'Nota crédito electrónica'},
+]
+
+
+@pytest.mark.parametrize('tipo', ['compras', 'ventas'])
+def test_archivo_correcto_sin_descuadres_ni_anomalias(procesador, reporte_dian, tipo):
+    conversion = procesador.convertir(reporte_dian(FACTURAS, tipo), tipo=tipo)
+    validacion = conversion['validacion']
+
+    assert validacion['cuadrado']
+    assert validacion['totales']['descuadradas'] == 0
+    assert validacion['totales']['anomalias'] == 0
+    assert validacion['totales']['diferencia'] == 0
+    assert validacion['totales']['facturas'] == len(FACTURAS)
+
+
+def test_compras_se_cuadran_contra_el_total_de_la_factura(procesador, reporte_dian):
+    validacion = procesador.convertir(reporte_dian(FACTURAS, 'compras'), tipo='compras')['validacion']
+    por_factura = validacion['por_factura'].set_index('DOCUMENTO')
+
+    # Facturas: proveedores en crédito por el total; nota crédito: en débito
+    assert por_factura.loc['900000001-FE1', 'CONTRAPARTIDA'] == 119000
+    assert por_factura.loc['900000002-NC8', 'CONTRAPARTIDA'] == -11900
+    assert validacion['totales']['contrapartida'] == 119000 + 50000 + 105001 - 11900
+
+
+def test_ventas_sin_iva_llevan_la_linea_de_clientes(procesador, reporte_dian):
+    resultado = procesador.convertir(reporte_dian(FACTURAS, 'ventas'), tipo='ventas')['resultado']
+    sin_iva = resultado[resultado['DOCUMENTO'] == f'{NIT_EMPRESA}-FE2']
+
+    assert sin_iva['CUENTA'].tolist() == [procesador.CUENTAS_VENTAS['ingresos'],
+                                          procesador.CUENTAS_VENTAS['iva_credito']]
+    assert sin_iva['CREDITO'].sum() == sin_iva['DEBITO'].sum() == 50000
+
+
+def test_asiento_descuadrado_se_reporta(procesador, reporte_dian):
+    ruta = reporte_dian(FACTURAS, 'compras')
+    df = procesador.leer_archivo_dian(ruta)
+    resultado = procesador.procesar_compras(df)
+    resultado.loc[0, 'DEBITO'] += 10
+
+    validacion = procesador.validar_asientos(df, resultado, 'compras')
+
+    assert not validacion['cuadrado']
+    assert validacion['descuadradas']['DOCUMENTO'].tolist() == ['900000001-FE1']
+    assert validacion['totales']['diferencia'] == 10
+
+
+def test_mismo_folio_de_dos_proveedores_son_facturas_distintas(procesador, reporte_dian):
+    facturas = [
+        {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+        {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000},
+    ]
+    conversion = procesador.convertir(reporte_dian(facturas, 'compras'), tipo='compras')
+
+    assert sorted(conversion['resultado']['DOCUMENTO'].unique()) == ['900000001-FE1', '900000002-FE1']
+    assert conversion['validacion']['totales']['facturas'] == 2
+    assert conversion['validacion']['cuadrado']
+
+
+def test_cufe_identifica_la_factura(procesador):
+    df = pd.DataFrame({'CUFE/CUDE': ['abc', None], 'Folio': ['1', '1'], 'Prefijo': ['FE', 'FE'],
+                       'NIT Emisor': ['900000001', '900000002']})
+    assert procesador.identificar_documentos(df).tolist() == ['abc', '900000002-FE1']
+
@@ -0,0 +1,64 @@
+import gzip
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import dian_a_siigo
+
+FACTURAS = [
+    {'tercero': '900000001', 'folio': 1, 'total': 11900000, 'iva': 1900000},
+    {'tercero': '900000002', 'folio': 1, 'total': 2380000, 'iva': 380000},
+]
+
+
+@pytest.fixture
+def carpetas(tmp_path):
+    entrada, salida = tmp_path / 'Descargas', tmp_path / 'Siigo'
+    entrada.mkdir()
+    return entrada, salida
+
+
+def vigilar_hasta_terminar(vigilante, pool, pasadas=200):
+    for _ in range(pasadas):
+        vigilante.revisar(pool)
+        if not vigilante.en_curso and not vigilante.observados:
+            return
+        time.sleep(0.05)
+    raise AssertionError("El vigilante no terminó las conversiones")
+
+
+def test_mismo_nombre_base_no_se_sobrescribe(carpetas, reporte_dian):
+    entrada, salida = carpetas
+    shutil.copy(reporte_dian(FACTURAS), entrada / 'Recibidos.csv')
+    with gzip.open(entrada / 'Recibidos.csv.gz', 'wb') as destino:
+        destino.write(reporte_dian(FACTURAS[:1], nombre='otro.csv').read_bytes())
+
+    vigilante = dian_a_siigo.VigilanteCarpeta(entrada, salida, trabajadores=1, espera_estable=0, memoria=2 ** 30)
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        vigilar_hasta_terminar(vigilante, pool)
+
+    convertidos = sorted(vigilante.indice.values(), key=lambda c: c['archivo'])
+    assert [c['archivo'] for c in convertidos] == ['Recibidos.csv', 'Recibidos.csv.gz']
+    assert [c['filas'] for c in convertidos] == [4, 2]
+    assert convertidos[0]['carpeta'] != convertidos[1]['carpeta']
+    for convertido in convertidos:
+        assert (salida / convertido['carpeta'] / 'Compras_Siigo_Recibidos.xlsx').exists()
+        assert set(convertido['salidas']) <= {p.name for p in (salida / convertido['carpeta']).iterdir()}
+
+
+def test_mismo_contenido_no_se_convierte_dos_veces(carpetas, reporte_dian):
+    entrada, salida = carpetas
+    shutil.copy(reporte_dian(FACTURAS), entrada / 'Recibidos.csv')
+
+    vigilante = dian_a_siigo.VigilanteCarpeta(entrada, salida, trabajadores=1, espera_estable=0, memoria=2 ** 30)
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        vigilar_hasta_terminar(vigilante, pool)
+        shutil.copy(entrada / 'Recibidos.csv', entrada / 'Recibidos (1).csv')
+        vigilar_hasta_terminar(vigilante, pool)
+
+    assert len(vigilante.indice) == 1
+    assert len([p for p in salida.iterdir() if p.is_dir()]) == 1
+    # El índice sobrevive a un reinicio
+    assert dian_a_siigo.VigilanteCarpeta(entrada, salida, memoria=2 ** 30).indice == vigilante.indice